@@ -0,0 +1,290 @@
+"""
+Benchmark of the endpoints of `inpe_stac.app` and of `make_json_items` against a catalog loaded by `load_catalog.py`.
+
+The application runs in this process (Flask test client), then the results do not depend on a HTTP server.
+The latency percentiles and the throughput of each endpoint are printed and saved as JSON, in order to
+compare the results of two commits by `compare.py`.
+
+Usage:
+
+    # SQLite stand-in
+    PYTHONPATH=. python benchmarks/bench_endpoints.py --db-url sqlite:////tmp/inpe-stac-bench.sqlite
+
+    # MySQL/MariaDB: the `DB_*` environment variables (or `--db-url`) choose the database
+    PYTHONPATH=. python benchmarks/bench_endpoints.py --requests 500 --output results.json
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dump
+from logging import CRITICAL, disable
+from os import environ, getpid, makedirs
+from os.path import dirname, join
+from platform import platform, python_version
+from statistics import mean, median
+from subprocess import DEVNULL, CalledProcessError, check_output
+from sys import path
+from threading import Thread
+from time import perf_counter
+
+path.insert(0, dirname(__file__))
+
+environ.setdefault('TIF_ROOT', 'http://www.example.com/tif')
+environ.setdefault('PNG_ROOT', 'http://www.example.com/png')
+
+from synthetic import make_collections, make_items  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(latencies, elapsed_time, errors, size):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'bytes': size,
+        'throughput': len(latencies) / elapsed_time if elapsed_time else None,
+        'mean_ms': mean(latencies) * 1000,
+        'p50_ms': median(latencies) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def use_database(db_url):
+    """Makes the application use `db_url`."""
+
+    import sqlalchemy
+
+    from inpe_stac.data import set_engine
+
+    if db_url.startswith('sqlite'):
+        from sqlite3 import PARSE_DECLTYPES
+
+        engine = sqlalchemy.create_engine(
+            db_url, connect_args={'detect_types': PARSE_DECLTYPES, 'check_same_thread': False}
+        )
+    else:
+        engine = sqlalchemy.create_engine(db_url)
+
+    set_engine(engine)
+
+
+def make_scenarios(client):
+    """Returns the `(name, method, path, json)` requests, with the ids and dates of the loaded catalog."""
+
+    from inpe_stac.data import do_query
+
+    collections, _ = do_query('SELECT id, start_date, end_date FROM stac_collection ORDER BY id;')
+    collection = collections[0]['id']
+    others = ','.join(c['id'] for c in collections[:3])
+
+    items, _ = do_query(
+        'SELECT id, date FROM stac_item WHERE collection = :collection AND deleted = 0 ORDER BY date, id LIMIT 1000;',
+        collection=collection
+    )
+    item = items[len(items) // 2]
+    start, end = items[0]['date'], items[-1]['date']
+
+    # the token of the second page, in order to measure the keyset pagination
+    page = client.get(f'/collections/{collection}/items?limit=10').get_json()
+    next_link = next((link['href'] for link in page.get('links', []) if link['rel'] == 'next'), None)
+    next_query = next_link.split('?', 1)[1] if next_link else 'limit=10'
+
+    return [
+        ('index', 'GET', '/', None),
+        ('conformance', 'GET', '/conformance', None),
+        ('stac', 'GET', '/stac', None),
+        ('collections', 'GET', '/collections', None),
+        ('collection', 'GET', f'/collections/{collection}', None),
+        ('items_limit_10', 'GET', f'/collections/{collection}/items?limit=10', None),
+        ('items_limit_100_page_5', 'GET', f'/collections/{collection}/items?limit=100&page=5', None),
+        ('items_next_token', 'GET', f'/collections/{collection}/items?{next_query}', None),
+        ('items_bbox_time', 'GET',
+         f'/collections/{collection}/items?limit=10&bbox=-60,-20,-50,-10&time={start}/{end}', None),
+        ('item', 'GET', f'/collections/{collection}/items/{item["id"]}', None),
+        ('items_ndjson_time', 'GET', f'/collections/{collection}/items.ndjson?time={start}/{end}', None),
+        ('search_get', 'GET', f'/stac/search?collections={others}&bbox=-60,-20,-50,-10&limit=10', None),
+        ('search_post', 'POST', '/stac/search', {
+            'collections': others.split(','), 'bbox': [-60, -20, -50, -10], 'time': f'{start}/{end}', 'limit': 10,
+            'query': {'cloud_cover': {'lte': 50}}
+        })
+    ]
+
+
+def run_scenario(app, method, url, body, requests, warmup, concurrency):
+    """Sends `requests` requests (after `warmup` ones) by `concurrency` clients and returns the measures."""
+
+    latencies = []
+    errors = []
+    size = [0]
+
+    def send(client):
+        start = perf_counter()
+
+        response = client.open(url, method=method, json=body)
+        data = response.get_data()
+
+        latencies.append(perf_counter() - start)
+        size[0] = len(data)
+
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+    client = app.test_client()
+
+    for _ in range(warmup):
+        send(client)
+
+    latencies.clear()
+    errors.clear()
+
+    def worker(count):
+        worker_client = app.test_client()
+
+        for _ in range(count):
+            send(worker_client)
+
+    counts = [requests // concurrency + (1 if index < requests % concurrency else 0) for index in range(concurrency)]
+    threads = [Thread(target=worker, args=(count,)) for count in counts]
+
+    start = perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return summarize(latencies, perf_counter() - start, len(errors), size[0])
+
+
+def bench_make_json_items(page_sizes, repeat):
+    """Measures `make_json_items` (and the encoding of its result) with synthetic rows."""
+
+    from inpe_stac.data import invalidate_caches, make_json_items
+    from inpe_stac.serializer import dumps as encode
+
+    links = [
+        {'href': 'http://localhost/collections/', 'rel': 'self'},
+        {'href': 'http://localhost/collections/', 'rel': 'parent'},
+        {'href': 'http://localhost/collections/', 'rel': 'collection'},
+        {'href': 'http://localhost/stac', 'rel': 'root'}
+    ]
+
+    collection = make_collections(1)[0]
+    results = {}
+
+    for page_size in page_sizes:
+        rows = list(make_items(collection, page_size))
+
+        for cache in ('cold', 'warm'):
+            latencies = []
+
+            for _ in range(repeat):
+                # a cold page does not find its features in the feature cache
+                if cache == 'cold':
+                    invalidate_caches()
+
+                start = perf_counter()
+                encode(make_json_items([dict(row) for row in rows], links, ['eo']))
+                latencies.append(perf_counter() - start)
+
+            result = summarize(latencies, sum(latencies), 0, 0)
+            result['per_item_us'] = median(latencies) / page_size * 1e6
+
+            results[f'page_{page_size}_{cache}'] = result
+
+    return results
+
+
+def get_commit():
+    try:
+        return check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=dirname(__file__), stderr=DEVNULL).decode().strip()
+    except (CalledProcessError, OSError):
+        return None
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db-url', help='database of the catalog, by default the one of the DB_* variables')
+    parser.add_argument('--requests', type=int, default=200, help='requests to each endpoint')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--only', action='append', help='name of an endpoint to measure (it can be repeated)')
+    parser.add_argument('--page-size', type=int, action='append', help='page sizes of make_json_items')
+    parser.add_argument('--repeat', type=int, default=20, help='repetitions of each make_json_items page')
+    parser.add_argument('--output', help='JSON file of the results, by default benchmarks/results/<date>-<commit>.json')
+    args = parser.parse_args()
+
+    if args.db_url:
+        use_database(args.db_url)
+
+    # the failed requests are counted, then their tracebacks are not logged
+    disable(CRITICAL)
+
+    from inpe_stac.app import app
+    from inpe_stac.data import do_query
+
+    client = app.test_client()
+    count, _ = do_query('SELECT COUNT(*) AS count FROM stac_item;')
+
+    commit = get_commit()
+
+    results = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': python_version(),
+            'platform': platform(),
+            'database': (args.db_url or 'mysql').split('://')[0],
+            'items': count[0]['count'],
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'pid': getpid(),
+            # the configuration that changes the results (caches, count strategy, etc.)
+            'environment': {k: v for k, v in sorted(environ.items()) if k.startswith('INPE_STAC_') and 'TOKEN' not in k}
+        },
+        'endpoints': {},
+        'make_json_items': {}
+    }
+
+    print(f'items: {results["meta"]["items"]} - requests: {args.requests} - concurrency: {args.concurrency}')
+    print(f'{"endpoint":<26}{"req/s":>10}{"p50 (ms)":>12}{"p90 (ms)":>12}{"p99 (ms)":>12}{"errors":>8}')
+
+    for name, method, url, body in make_scenarios(client):
+        if args.only and name not in args.only:
+            continue
+
+        result = run_scenario(app, method, url, body, args.requests, args.warmup, args.concurrency)
+        result['method'], result['url'], result['body'] = method, url, body
+        results['endpoints'][name] = result
+
+        print(f'{name:<26}{result["throughput"]:>10.1f}{result["p50_ms"]:>12.2f}'
+              f'{result["p90_ms"]:>12.2f}{result["p99_ms"]:>12.2f}{result["errors"]:>8}')
+
+    results['make_json_items'] = bench_make_json_items(args.page_size or [10, 100, 1000], args.repeat)
+
+    print(f'\n{"make_json_items":<26}{"us/item":>10}{"p50 (ms)":>12}{"p90 (ms)":>12}')
+
+    for name, result in results['make_json_items'].items():
+        print(f'{name:<26}{result["per_item_us"]:>10.2f}{result["p50_ms"]:>12.2f}{result["p90_ms"]:>12.2f}')
+
+    output = args.output
+
+    if output is None:
+        directory = join(dirname(__file__), 'results')
+        makedirs(directory, exist_ok=True)
+        output = join(directory, f'{datetime.now():%Y%m%d-%H%M%S}-{commit or "unknown"}.json')
+
+    with open(output, 'w') as file:
+        dump(results, file, indent=2, default=str)
+
+    print(f'\nresults: {output}')
+
+
+if __name__ == '__main__':
+    main()
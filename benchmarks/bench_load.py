@@ -0,0 +1,140 @@
+"""
+Load benchmark of running servers, e.g. the WSGI and the ASGI modes of the same catalog.
+
+Each target receives the same requests from `--concurrency` clients (threads with persistent connections)
+and the throughput and latency percentiles of each target are printed side by side.
+
+Usage:
+
+    # terminal 1 and 2
+    flask run --port=5001 --with-threads
+    uvicorn inpe_stac.asgi:app --port=5002
+
+    # terminal 3
+    python benchmarks/bench_load.py \
+        --target wsgi=http://localhost:5001 --target asgi=http://localhost:5002 \
+        --path '/stac/search?collections=CBERS4_AWFI_L4_DN&limit=10' \
+        --path '/collections/CBERS4_AWFI_L4_DN/items?limit=10&bbox=-60,-20,-50,-10' \
+        --concurrency 32 --requests 2000
+"""
+
+from argparse import ArgumentParser
+from http.client import HTTPConnection, HTTPSConnection
+from itertools import cycle
+from json import dump
+from statistics import median
+from threading import Lock, Thread
+from time import perf_counter
+from urllib.parse import urlsplit
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_target(url, paths, concurrency, requests, timeout):
+    """Sends `requests` GET requests to `url`, cycling through `paths`, and returns the measures."""
+
+    parts = urlsplit(url)
+    connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+    prefix = parts.path.rstrip('/')
+
+    next_path = cycle(paths).__next__
+    lock = Lock()
+    remaining = [requests]
+    latencies = []
+    errors = []
+
+    def client():
+        connection = connection_class(parts.netloc, timeout=timeout)
+
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+
+                remaining[0] -= 1
+                path = next_path()
+
+            start = perf_counter()
+
+            try:
+                connection.request('GET', prefix + path)
+                response = connection.getresponse()
+                response.read()
+
+                if response.status >= 400:
+                    errors.append(response.status)
+                    continue
+            except Exception as error:
+                errors.append(repr(error))
+                connection.close()
+                connection = connection_class(parts.netloc, timeout=timeout)
+                continue
+
+            latencies.append(perf_counter() - start)
+
+        connection.close()
+
+    threads = [Thread(target=client) for _ in range(concurrency)]
+
+    start = perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed_time = perf_counter() - start
+
+    return {
+        'url': url,
+        'requests': requests,
+        'errors': len(errors),
+        'elapsed_time': elapsed_time,
+        'throughput': len(latencies) / elapsed_time,
+        'latency_p50_ms': median(latencies) * 1000 if latencies else float('nan'),
+        'latency_p90_ms': percentile(latencies, 90) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--target', action='append', required=True, help='name=url of a server')
+    parser.add_argument('--path', action='append', required=True, help='path (and query string) to request')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50, help='requests sent before measuring')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='JSON file to save the results')
+    args = parser.parse_args()
+
+    results = {}
+
+    for target in args.target:
+        name, _, url = target.partition('=')
+
+        run_target(url, args.path, min(args.concurrency, args.warmup or 1), args.warmup, args.timeout)
+        results[name] = run_target(url, args.path, args.concurrency, args.requests, args.timeout)
+
+    print(f'concurrency: {args.concurrency} - requests: {args.requests} - paths: {len(args.path)}')
+    print(f'{"target":<12}{"req/s":>10}{"p50 (ms)":>12}{"p90 (ms)":>12}{"p99 (ms)":>12}{"errors":>8}')
+
+    for name, result in results.items():
+        print(f'{name:<12}{result["throughput"]:>10.1f}{result["latency_p50_ms"]:>12.1f}'
+              f'{result["latency_p90_ms"]:>12.1f}{result["latency_p99_ms"]:>12.1f}{result["errors"]:>8}')
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            dump({'concurrency': args.concurrency, 'paths': args.path, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
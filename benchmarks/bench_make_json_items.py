@@ -0,0 +1,216 @@
+"""
+Micro-benchmark of the per-item cost to create and encode STAC Items.
+
+It compares the original `make_json_items` implementation (OrderedDict, deepcopy of the links,
+`getenv` per asset and `datetime` round trip) with `inpe_stac.serializer.FeatureSerializer`,
+and checks that both create the same JSON.
+
+Usage:
+
+    PYTHONPATH=. python benchmarks/bench_make_json_items.py --items 1000 --repeat 5
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import datetime, timedelta
+from json import dumps, loads
+from os import environ, getenv
+from random import Random
+from time import perf_counter
+
+environ.setdefault('TIF_ROOT', 'http://www.example.com/tif')
+environ.setdefault('PNG_ROOT', 'http://www.example.com/png')
+
+from inpe_stac import serializer  # noqa: E402
+from inpe_stac.environment import API_VERSION  # noqa: E402
+
+
+BANDS = ['blue', 'green', 'red', 'nir', 'pan']
+LINKS = [
+    {'href': 'http://localhost:5000/collections/', 'rel': 'self'},
+    {'href': 'http://localhost:5000/collections/', 'rel': 'parent'},
+    {'href': 'http://localhost:5000/collections/', 'rel': 'collection'},
+    {'href': 'http://localhost:5000/stac', 'rel': 'root'}
+]
+
+
+def make_rows(count, seed=0):
+    random = Random(seed)
+    rows = []
+
+    for index in range(count):
+        x, y = random.uniform(-75, -35), random.uniform(-35, 5)
+        date = datetime(2020, 1, 1) + timedelta(minutes=index)
+        scene = f'CBERS4_AWFI_{index:08d}'
+
+        rows.append({
+            'id': scene, 'collection': 'CBERS4_AWFI_L4_DN', 'date': date.date(), 'datetime': date,
+            'path': random.randint(1, 200), 'row': random.randint(1, 200),
+            'satellite': 'CBERS4', 'sensor': 'AWFI',
+            'cloud_cover': random.randint(0, 100), 'sync_loss': None,
+            'tl_longitude': x, 'tl_latitude': y + 1, 'bl_longitude': x, 'bl_latitude': y,
+            'br_longitude': x + 1, 'br_latitude': y, 'tr_longitude': x + 1, 'tr_latitude': y + 1,
+            'assets': dumps([{'band': band, 'href': f'/{scene}/{scene}_{band}.tif'} for band in BANDS]),
+            'thumbnail': f'/{scene}/{scene}.png'
+        })
+
+    return rows
+
+
+def bbox(coord_list):
+    box = []
+
+    for i in (0, 1):
+        res = sorted(coord_list[0], key=lambda x: x[i])
+        box.append((res[0][i], res[-1][i]))
+
+    return [box[0][0], box[1][0], box[0][1], box[1][1]]
+
+
+def legacy_make_json_items(items, links, item_stac_extensions=None):
+    """Original implementation of `inpe_stac.data.make_json_items`, kept as the baseline."""
+
+    features = []
+
+    gjson = OrderedDict()
+    gjson['stac_version'] = API_VERSION
+    gjson['stac_extensions'] = []
+    gjson['type'] = 'FeatureCollection'
+
+    for i in items:
+        feature = OrderedDict()
+
+        feature['stac_version'] = API_VERSION
+        feature['stac_extensions'] = item_stac_extensions
+        feature['type'] = 'Feature'
+        feature['id'] = i['id']
+        feature['collection'] = i['collection']
+
+        geometry = dict()
+        geometry['type'] = 'Polygon'
+        geometry['coordinates'] = [
+          [[i['tl_longitude'], i['tl_latitude']],
+           [i['bl_longitude'], i['bl_latitude']],
+           [i['br_longitude'], i['br_latitude']],
+           [i['tr_longitude'], i['tr_latitude']],
+           [i['tl_longitude'], i['tl_latitude']]]
+        ]
+        feature['geometry'] = geometry
+        feature['bbox'] = bbox(feature['geometry']['coordinates'])
+
+        feature['properties'] = {
+            'datetime': datetime.fromisoformat(str(i['datetime'])).isoformat(),
+            'path': i['path'],
+            'row': i['row'],
+            'satellite': i['satellite'],
+            'sensor': i['sensor'],
+            'cloud_cover': i['cloud_cover'],
+            'sync_loss': i['sync_loss'],
+            'eo:gsd': -1
+        }
+
+        feature['assets'] = {}
+        eo_bands = []
+
+        i['assets'] = loads(i['assets'])
+
+        for asset in i['assets']:
+            eo_bands.append({'name': asset['band'], 'common_name': asset['band']})
+
+            feature['assets'][asset['band']] = {
+                'href': getenv('TIF_ROOT') + asset['href'],
+                'type': 'image/tiff; application=geotiff',
+                'eo:bands': [len(eo_bands) - 1]
+            }
+            feature['assets'][asset['band'] + '_xml'] = {
+                'href': getenv('TIF_ROOT') + asset['href'].replace('.tif', '.xml'),
+                'type': 'application/xml'
+            }
+
+        feature['assets']['thumbnail'] = {
+            'href': getenv('PNG_ROOT') + i['thumbnail'],
+            'type': 'image/png'
+        }
+
+        feature['properties']['eo:bands'] = eo_bands
+
+        feature['links'] = deepcopy(links)
+        feature['links'][0]['href'] += i['collection'] + '/items/' + i['id']
+        feature['links'][1]['href'] += i['collection']
+        feature['links'][2]['href'] += i['collection']
+
+        features.append(feature)
+
+    gjson['features'] = features
+
+    return gjson
+
+
+def new_make_json_items(items, links, item_stac_extensions=None):
+    feature_serializer = serializer.FeatureSerializer(links, item_stac_extensions)
+
+    gjson = {
+        'stac_version': API_VERSION,
+        'stac_extensions': [],
+        'type': 'FeatureCollection',
+        'features': [feature_serializer.feature(i) for i in items]
+    }
+
+    return gjson
+
+
+def legacy_encode(data):
+    # `flask.jsonify` uses compact separators when it does not pretty print
+    return dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def measure(build, encode, rows, repeat):
+    """Returns the best time per item (in microseconds) to build and to encode the features."""
+
+    best_build = best_encode = float('inf')
+
+    for _ in range(repeat):
+        # the legacy implementation changes the rows, then each round receives a copy
+        copies = [dict(row) for row in rows]
+
+        start = perf_counter()
+        data = build(copies, LINKS, ['eo'])
+        middle = perf_counter()
+        encode(data)
+        end = perf_counter()
+
+        best_build = min(best_build, middle - start)
+        best_encode = min(best_encode, end - middle)
+
+    return best_build / len(rows) * 1e6, best_encode / len(rows) * 1e6
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+
+    legacy = legacy_encode(legacy_make_json_items([dict(row) for row in rows], LINKS, ['eo']))
+    new = legacy_encode(new_make_json_items([dict(row) for row in rows], LINKS, ['eo']))
+    assert legacy == new, 'the serializer output differs from the original implementation'
+
+    results = [
+        ('legacy (OrderedDict + deepcopy + json)', legacy_make_json_items, legacy_encode),
+        ('FeatureSerializer + json', new_make_json_items, legacy_encode),
+        (f'FeatureSerializer + {serializer.JSON_ENCODER}', new_make_json_items, serializer.dumps),
+    ]
+
+    print(f'items: {args.items} - repeat: {args.repeat} - output is identical: True')
+    print(f'{"implementation":<45}{"build (us/item)":>18}{"encode (us/item)":>18}{"total (us/item)":>18}')
+
+    for name, build, encode in results:
+        build_time, encode_time = measure(build, encode, rows, args.repeat)
+        print(f'{name:<45}{build_time:>18.2f}{encode_time:>18.2f}{build_time + encode_time:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
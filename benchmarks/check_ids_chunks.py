@@ -0,0 +1,134 @@
+"""
+Checks that a search by `ids` returns the same pages when its ids are searched in chunks of `INPE_STAC_IDS_CHUNK_SIZE`.
+
+Each search of a sample of ids of the loaded catalog is run with a single `id IN (...)` query and with tiny chunk
+sizes, and the ids, `context` and `next` links of the offset pages (`page`) and of the keyset pages (the `next` links)
+must be the same. It exits with status 1 if a page differs.
+
+Usage:
+
+    # SQLite stand-in
+    PYTHONPATH=. python benchmarks/check_ids_chunks.py --db-url sqlite:////tmp/inpe-stac-bench.sqlite
+
+    # MySQL/MariaDB: the `DB_*` environment variables (or `--db-url`) choose the database
+    PYTHONPATH=. python benchmarks/check_ids_chunks.py --ids 200 --chunk-size 1 --chunk-size 7 --chunk-size 64
+"""
+
+from argparse import ArgumentParser
+from logging import CRITICAL, disable
+from os import environ
+from os.path import dirname
+from sys import exit, path
+
+path.insert(0, dirname(__file__))
+
+environ.setdefault('TIF_ROOT', 'http://www.example.com/tif')
+environ.setdefault('PNG_ROOT', 'http://www.example.com/png')
+# the pages must not be streamed or cached, then each search runs its queries
+environ['INPE_STAC_STREAM_MIN_LIMIT'] = '0'
+environ['INPE_STAC_SEARCH_CACHE'] = 'off'
+
+from bench_endpoints import use_database  # noqa: E402
+
+
+def get_sample_ids(count):
+    """Returns `count` ids spread over the catalog (then over its collections) and an id that does not exist."""
+
+    from inpe_stac.data import do_query
+
+    total, _ = do_query('SELECT COUNT(*) AS count FROM stac_item;')
+    step = max(total[0]['count'] // count, 1)
+
+    rows, _ = do_query('SELECT id FROM stac_item ORDER BY id LIMIT :limit;', limit=step * count)
+
+    return [row['id'] for row in rows[::step]][:count] + ['INPE_STAC_MISSING_ITEM']
+
+
+def get_page(client, body):
+    """Returns the ids, `context` and `next` link body of the page of the POST search `body`."""
+
+    response = client.post('/stac/search', json=body)
+
+    if response.status_code != 200:
+        return response.status_code, None, None
+
+    result = response.get_json()
+    next_body = next((link['body'] for link in result['links'] if link['rel'] == 'next'), None)
+
+    return [feature['id'] for feature in result['features']], result['context'], next_body
+
+
+def get_pages(client, body, pages):
+    """Returns the offset pages and the keyset pages (following the `next` links) of the search `body`."""
+
+    offset_pages = [get_page(client, {**body, 'page': page}) for page in range(1, pages + 1)]
+
+    keyset_pages = []
+    next_body = body
+
+    for _ in range(pages):
+        ids, context, next_body = get_page(client, next_body)
+        keyset_pages.append((ids, context, next_body))
+
+        if not ids or next_body is None:
+            break
+
+    return offset_pages, keyset_pages
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db-url', help='database of the catalog, by default the one of the DB_* variables')
+    parser.add_argument('--ids', type=int, default=60, help='number of ids of the searches')
+    parser.add_argument('--limit', type=int, action='append', help='page sizes (it can be repeated)')
+    parser.add_argument('--chunk-size', type=int, action='append', help='chunk sizes (it can be repeated)')
+    args = parser.parse_args()
+
+    if args.db_url:
+        use_database(args.db_url)
+
+    disable(CRITICAL)
+
+    import inpe_stac.data as data
+    from inpe_stac.app import app
+
+    client = app.test_client()
+    ids = get_sample_ids(args.ids)
+
+    searches = [
+        {'ids': ids, 'limit': limit, 'count': count}
+        for limit in args.limit or [1, 7, 25] for count in ('exact', 'off')
+    ] + [
+        # the ids of the previous search in the reverse order and with a filter
+        {'ids': ids[::-1], 'limit': 5, 'time': '2000-01-01/2100-01-01'}
+    ]
+
+    failures = 0
+
+    for search in searches:
+        pages = len(ids) // search['limit'] + 2
+
+        # a chunk larger than the list is the single `id IN (...)` query
+        data.INPE_STAC_IDS_CHUNK_SIZE = len(ids) + 1
+        expected = get_pages(client, search, pages)
+
+        for chunk_size in args.chunk_size or [1, 2, 7]:
+            data.INPE_STAC_IDS_CHUNK_SIZE = chunk_size
+            actual = get_pages(client, search, pages)
+
+            name = f'limit={search["limit"]} count={search.get("count", "exact")} chunk_size={chunk_size}'
+
+            for kind, expected_pages, actual_pages in zip(('offset', 'keyset'), expected, actual):
+                if actual_pages == expected_pages:
+                    print(f'ok      {kind:<8}{name} - pages: {len(actual_pages)}')
+                else:
+                    failures += 1
+                    print(f'FAILED  {kind:<8}{name}')
+
+    print(f'ids: {len(ids)} - searches: {len(searches)} - failures: {failures}')
+
+    exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compares two results of `bench_endpoints.py` (e.g. of two commits).
+
+Usage:
+
+    python benchmarks/compare.py benchmarks/results/<before>.json benchmarks/results/<after>.json
+"""
+
+from argparse import ArgumentParser
+from json import load
+
+
+def change(before, after):
+    if not before:
+        return ''
+
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def print_section(title, before, after, metrics):
+    print(f'\n{title:<26}' + ''.join(f'{metric:>14}{"":>10}' for metric in metrics))
+
+    for name in before:
+        if name not in after:
+            continue
+
+        row = f'{name:<26}'
+
+        for metric in metrics:
+            row += f'{after[name][metric]:>14.2f}{change(before[name][metric], after[name][metric]):>10}'
+
+        print(row)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = load(file)
+
+    with open(args.after) as file:
+        after = load(file)
+
+    for result in (before, after):
+        meta = result['meta']
+        print(f'{meta["commit"]}: {meta["date"]} - {meta["database"]} - {meta["items"]} items - '
+              f'concurrency {meta["concurrency"]}')
+
+    if before['meta']['environment'] != after['meta']['environment']:
+        print('warning: the INPE_STAC_* variables of the results are different')
+
+    print_section('endpoint', before['endpoints'], after['endpoints'], ['throughput', 'p50_ms', 'p99_ms'])
+    print_section('make_json_items', before['make_json_items'], after['make_json_items'], ['per_item_us', 'p90_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Records the MySQL `EXPLAIN` of the searches whose filters are bound as `IN (...)` lists, against a loaded catalog.
+
+The page and count queries of a search by `ids` (`id IN (...)`, a chunk of `INPE_STAC_IDS_CHUNK_SIZE` ids) and of a
+search by `collections` (`collection IN (...)`, in the 'fanout' and 'window' modes) are created by
+`inpe_stac.data.plan_collection_items`, then they are the queries that the service runs. Each `stac_item` access
+must use the expected index: `PRIMARY` to the ids and `stac_item_collection_date_id_idx` (`001_stac_item_keyset_index.sql`)
+to the collections. It exits with status 1 if an access does not use it. It needs MySQL/MariaDB, because the SQLite
+stand-in does not have the same plans.
+
+Usage:
+
+    # the `DB_*` environment variables (or `--db-url`) choose the database
+    PYTHONPATH=. python benchmarks/explain_in_lists.py --output explain.json
+"""
+
+from argparse import ArgumentParser
+from json import dump
+from logging import CRITICAL, disable
+from os import environ
+from os.path import dirname
+from sys import exit, path
+
+path.insert(0, dirname(__file__))
+
+environ.setdefault('TIF_ROOT', 'http://www.example.com/tif')
+environ.setdefault('PNG_ROOT', 'http://www.example.com/png')
+# the count is always a query, then its plan is recorded too
+environ['INPE_STAC_FOOTPRINT_INDEX'] = '0'
+
+from bench_endpoints import use_database  # noqa: E402
+
+
+PRIMARY_KEY = 'PRIMARY'
+KEYSET_INDEX = 'stac_item_collection_date_id_idx'
+
+
+def explain(sql, params):
+    """Returns the rows of the traditional `EXPLAIN` of `sql`."""
+
+    from inpe_stac.data import do_query
+
+    rows, _ = do_query('EXPLAIN ' + sql.strip().rstrip(';'), **params)
+
+    return rows or []
+
+
+def get_queries(plan):
+    """Returns the `(name, sql, params)` tuples of the page and count queries of `plan`."""
+
+    queries = [('page', plan['sql'], plan['params'])] if plan['sql'] is not None else []
+
+    return queries + [('count', sql, params) for sql, params in plan['count_queries']]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db-url', help='database of the catalog, by default the one of the DB_* variables')
+    parser.add_argument('--ids', type=int, help='number of ids of the search, by default INPE_STAC_IDS_CHUNK_SIZE')
+    parser.add_argument('--collections', type=int, default=3, help='number of collections of the search')
+    parser.add_argument('--output', help='JSON file of the recorded plans')
+    args = parser.parse_args()
+
+    if args.db_url:
+        use_database(args.db_url)
+
+    disable(CRITICAL)
+
+    import inpe_stac.data as data
+    from inpe_stac.data import do_query, plan_collection_items
+
+    ids, _ = do_query('SELECT id FROM stac_item LIMIT :limit;', limit=args.ids or data.INPE_STAC_IDS_CHUNK_SIZE)
+    collections, _ = do_query('SELECT id FROM stac_collection ORDER BY id LIMIT :limit;', limit=args.collections)
+
+    searches = [
+        ('id IN', PRIMARY_KEY, None, {'ids': [row['id'] for row in ids]}),
+        ('collection IN (fanout)', KEYSET_INDEX, 'fanout', {'collections': [row['id'] for row in collections]}),
+        ('collection IN (window)', KEYSET_INDEX, 'window', {'collections': [row['id'] for row in collections]})
+    ]
+
+    records = []
+    failures = 0
+
+    for name, expected_key, mode, search in searches:
+        if mode is not None:
+            data.INPE_STAC_COLLECTIONS_SEARCH = mode
+
+        plan = plan_collection_items(limit=10, count='exact', **search)
+
+        for query, sql, params in get_queries(plan):
+            rows = explain(sql, params)
+            # the derived tables (e.g. `page_0`) do not read `stac_item` directly
+            accesses = [row for row in rows if row.get('table') == 'stac_item']
+            ok = bool(accesses) and all(row.get('key') == expected_key for row in accesses)
+
+            failures += not ok
+
+            print(f'{"ok" if ok else "FAILED":<8}{name:<24}{query:<7}' + ', '.join(
+                f'{row.get("type")}/{row.get("key")} rows={row.get("rows")}' for row in accesses
+            ))
+
+            records.append({
+                'search': name, 'query': query, 'expected_key': expected_key, 'ok': ok, 'sql': sql, 'explain': rows
+            })
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            dump(records, output, indent=2, default=str)
+
+    exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Synthetic `stac_collection` and `stac_item` rows, similar to the ones of the INPE catalog.
+
+The rows are created by a seeded random generator, then the same arguments always create the same catalog.
+The items are yielded one at a time, then a catalog with millions of items is never kept in memory.
+"""
+
+from datetime import date, datetime, timedelta
+from json import dumps
+from math import cos, radians, sin
+from random import Random
+
+
+# (satellite, sensor, level, bands, footprint size in degrees)
+SENSORS = [
+    ('CBERS4', 'AWFI', 'L4', ['BAND13', 'BAND14', 'BAND15', 'BAND16'], 8.0),
+    ('CBERS4', 'MUX', 'L4', ['BAND5', 'BAND6', 'BAND7', 'BAND8'], 1.2),
+    ('CBERS4', 'PAN10M', 'L4', ['BAND2', 'BAND3', 'BAND4'], 1.0),
+    ('CBERS4', 'PAN5M', 'L4', ['BAND1'], 0.6),
+    ('CBERS4A', 'WFI', 'L4', ['BAND13', 'BAND14', 'BAND15', 'BAND16'], 7.0),
+    ('CBERS4A', 'MUX', 'L4', ['BAND5', 'BAND6', 'BAND7', 'BAND8'], 0.9),
+    ('CBERS4A', 'WPM', 'L4', ['BAND0', 'BAND1', 'BAND2', 'BAND3', 'BAND4'], 0.8),
+    ('LANDSAT8', 'OLI', 'L1', ['BAND1', 'BAND2', 'BAND3', 'BAND4', 'BAND5', 'BAND6', 'BAND7'], 1.8),
+    ('AMAZONIA1', 'WFI', 'L4', ['BAND1', 'BAND2', 'BAND3', 'BAND4'], 7.5),
+]
+
+# area covered by the catalog (about the Brazilian territory): min_x, min_y, max_x, max_y
+AREA = (-75.0, -34.0, -34.0, 6.0)
+
+# the grid of paths and rows of each sensor and the number of scenes acquired per day
+GRID_SIZE = 200
+SCENES_PER_DAY = 400
+
+FIRST_DATE = date(2016, 1, 1)
+
+
+def make_collections(count):
+    """Returns `count` collections, as dicts with the `id`, `satellite`, `sensor`, `bands`, `size` and `suffix` keys."""
+
+    collections = []
+
+    for index in range(count):
+        satellite, sensor, level, bands, size = SENSORS[index % len(SENSORS)]
+
+        # if there are more collections than sensors, then the sensors are repeated with a suffix
+        suffix = '' if index < len(SENSORS) else f'_{index // len(SENSORS)}'
+
+        collections.append({
+            'id': f'{satellite}_{sensor}_{level}_DN{suffix}', 'satellite': satellite, 'sensor': sensor,
+            'level': level, 'bands': bands, 'size': size, 'suffix': suffix
+        })
+
+    return collections
+
+
+def make_corners(center_x, center_y, size, angle):
+    """Returns the (tl, bl, br, tr) corners of a square footprint rotated by `angle` degrees."""
+
+    half = size / 2
+    corners = []
+
+    for dx, dy in ((-half, half), (-half, -half), (half, -half), (half, half)):
+        x = dx * cos(radians(angle)) - dy * sin(radians(angle))
+        y = dx * sin(radians(angle)) + dy * cos(radians(angle))
+
+        corners.append((round(center_x + x, 6), round(center_y + y, 6)))
+
+    return corners
+
+
+def make_items(collection, count, seed=0):
+    """
+    Yields `count` items of `collection` (a dict returned by `make_collections`). Each day has `SCENES_PER_DAY`
+    scenes with different paths and rows, then the ids are unique without keeping the created ones.
+    """
+
+    collection_id, satellite, sensor = collection['id'], collection['satellite'], collection['sensor']
+    random = Random(f'{seed}-{collection_id}')
+
+    min_x, min_y, max_x, max_y = AREA
+
+    for index in range(count):
+        day, scene = divmod(index, SCENES_PER_DAY)
+
+        # a different path and row to each scene of the day (7919 is a prime number)
+        path, row = divmod((scene * 7919 + day) % (GRID_SIZE * GRID_SIZE), GRID_SIZE)
+        path, row = path + 1, row + 1
+
+        acquired = datetime.combine(FIRST_DATE + timedelta(days=day), datetime.min.time()) + \
+            timedelta(seconds=random.randint(10 * 3600, 15 * 3600))
+
+        center_x = min_x + (max_x - min_x) * (path - 0.5) / GRID_SIZE
+        center_y = max_y - (max_y - min_y) * (row - 0.5) / GRID_SIZE
+        (tl, bl, br, tr) = make_corners(center_x, center_y, collection['size'], random.uniform(-12, -8))
+
+        scene_id = f'{satellite}_{sensor}_{acquired:%Y%m%d}_{path:03d}_{row:03d}_{collection["level"]}{collection["suffix"]}'
+        directory = f'/{satellite}/{acquired:%Y_%m}/{scene_id}'
+
+        yield {
+            'id': scene_id,
+            'collection': collection_id,
+            'date': acquired.date(),
+            'datetime': acquired,
+            'path': path,
+            'row': row,
+            'satellite': satellite,
+            'sensor': sensor,
+            'cloud_cover': random.randint(0, 100),
+            'sync_loss': None if random.random() < 0.9 else round(random.random(), 2),
+            'tl_longitude': tl[0], 'tl_latitude': tl[1],
+            'bl_longitude': bl[0], 'bl_latitude': bl[1],
+            'br_longitude': br[0], 'br_latitude': br[1],
+            'tr_longitude': tr[0], 'tr_latitude': tr[1],
+            'assets': dumps([
+                {'band': band, 'href': f'{directory}/{scene_id}_{band}.tif'} for band in collection['bands']
+            ]),
+            'thumbnail': f'{directory}/{scene_id}.png',
+            # about 1% of the items are flagged as deleted
+            'deleted': 1 if random.random() < 0.01 else 0
+        }
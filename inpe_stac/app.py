@@ -7,17 +7,40 @@ Specification: https://github.com/radiantearth/stac-spec/blob/master/api-spec/ap
 OpenAPI definition: https://stacspec.org/STAC-ext-api.html
 """
 
-from flask import Flask, jsonify, request
-from flasgger import Swagger
-from werkzeug.exceptions import BadRequest
+from datetime import timezone
+from hashlib import sha1
+from os import getpid
+from time import perf_counter
 
-from inpe_stac.data import get_collections, get_collection_items, get_links_property_to_stac_search, \
-                           make_json_collection, make_json_items, make_json_item_collection
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from flasgger import Swagger
+from werkzeug.exceptions import BadRequest, NotFound
+
+from inpe_stac.commands import backfill_footprints_command, invalidate_collections_cache_command, \
+                               rebuild_collection_summary_command, refresh_features_command
+from inpe_stac.data import check_keyset_index, clear_slow_queries, dump_slow_queries, dumps_item_collection, \
+                           export_collection_items, get_cache_stats, get_cached_search, \
+                           get_catalog_last_modified, get_collection_last_modified, \
+                           get_collections, get_collections_last_modified, \
+                           get_slow_queries, get_collection_items, get_footprint_index, get_item_last_modified, \
+                           get_items_by_keys, get_links_property_to_collection_items, \
+                           get_links_property_to_stac_search, guard_full_scan, invalidate_caches, \
+                           iter_items_by_keys, make_json_collection, make_json_context, make_json_items, \
+                           make_json_item_collection, set_cached_search, stream_collection_items, \
+                           stream_json_item_collection, stream_ndjson_features
 from inpe_stac.decorator import catch_generic_exceptions, \
-                                log_function_footer, log_function_header
-from inpe_stac.environment import BASE_URI, API_VERSION
+                                log_function_footer, log_function_header, require_admin_token
+from inpe_stac.environment import BASE_URI, API_VERSION, INPE_STAC_COUNT_MODE, INPE_STAC_FOOTPRINT_INDEX, \
+                                  INPE_STAC_CACHE_CONTROL_STAC, INPE_STAC_CACHE_CONTROL_COLLECTIONS, \
+                                  INPE_STAC_CACHE_CONTROL_COLLECTION, INPE_STAC_CACHE_CONTROL_ITEMS, \
+                                  INPE_STAC_CACHE_CONTROL_ITEM, INPE_STAC_CACHE_CONTROL_SEARCH, INPE_STAC_METRICS, \
+                                  INPE_STAC_SLOW_QUERY_DUMP_PATH, INPE_STAC_SLOW_QUERY_THRESHOLD_MS, \
+                                  INPE_STAC_BATCH_MAX_ITEMS, PNG_ROOT, TIF_ROOT
+from inpe_stac.fields import normalize_fields
 from inpe_stac.log import logging
-from inpe_stac.util import get_query_string
+from inpe_stac.metrics import get_timings, observe_request, record, render_metrics, set_collection, start_request
+from inpe_stac.serializer import JSON_ENCODER, dumps, loads
+from inpe_stac.util import is_stream, normalize_search_params
 
 
 app = Flask(__name__)
@@ -31,10 +54,340 @@ app.config["SWAGGER"] = {
 
 swagger = Swagger(app, template_file="./spec/api/v0.9.0/STAC.yaml")
 
+app.cli.add_command(invalidate_collections_cache_command)
+app.cli.add_command(rebuild_collection_summary_command)
+app.cli.add_command(backfill_footprints_command)
+app.cli.add_command(refresh_features_command)
+
+# the pages are sorted by the index of migrations/001, then the service does not start without it
+check_keyset_index()
+
+# start building the in-memory footprint index at startup, instead of at the first bbox search
+if INPE_STAC_FOOTPRINT_INDEX:
+    get_footprint_index()
+
+
+# `Cache-Control` header of each endpoint (i.e. view function)
+CACHE_CONTROL = {
+    'stac': INPE_STAC_CACHE_CONTROL_STAC,
+    'collections': INPE_STAC_CACHE_CONTROL_COLLECTIONS,
+    'collections_collections_id': INPE_STAC_CACHE_CONTROL_COLLECTION,
+    'collections_collections_id_items': INPE_STAC_CACHE_CONTROL_ITEMS,
+    'collections_collections_id_items_items_id': INPE_STAC_CACHE_CONTROL_ITEM,
+    'stac_search': INPE_STAC_CACHE_CONTROL_SEARCH
+}
+
+
+def json_response(data):
+    """
+    Returns `data` as a JSON response, encoded by the encoder of `INPE_STAC_JSON_ENCODER`.
+    If `data` is bytes, then it has already been encoded and it is sent as it is.
+    """
+
+    if isinstance(data, bytes):
+        return Response(data + b'\n', mimetype='application/json')
+
+    start_time = perf_counter()
+    body = dumps(data)
+    record('encode', perf_counter() - start_time)
+
+    return Response(body + b'\n', mimetype='application/json')
+
+
+def not_modified(last_modified):
+    """
+    Saves the validators (`ETag` and `Last-Modified`) of the current resource, which has changed at `last_modified`,
+    in order to `after_request` send them. If the client already has this version of the resource, then it returns
+    a '304 Not Modified' response, else None. If `last_modified` is None, then the resource has no validators.
+    """
+
+    if last_modified is None:
+        return None
+
+    # the representation depends on the resource version and on how it is created (including the roots of the
+    # assets and thumbnails `href`s), but not on its content, then the ETag is created without creating the response
+    etag = sha1(
+        f'{API_VERSION}|{BASE_URI}|{TIF_ROOT}|{PNG_ROOT}|{JSON_ENCODER}|{request.path}|'
+        f'{last_modified.isoformat()}'.encode('utf-8')
+    ).hexdigest()
+
+    g.validators = (etag, last_modified)
+
+    # `If-None-Match` has precedence over `If-Modified-Since`
+    if request.if_none_match:
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304)
+
+        return None
+
+    if_modified_since = request.if_modified_since
+
+    if if_modified_since is not None:
+        if if_modified_since.tzinfo is None:
+            if_modified_since = if_modified_since.replace(tzinfo=timezone.utc)
+
+        # HTTP dates do not have fractions of seconds
+        if last_modified.replace(microsecond=0) <= if_modified_since:
+            return Response(status=304)
+
+    return None
+
+
+def get_item_links():
+    """Returns the template of the links of each Item inside an ItemCollection."""
+
+    return [
+        {"href": f"{BASE_URI}collections/", "rel": "self"},
+        {"href": f"{BASE_URI}collections/", "rel": "parent"},
+        {"href": f"{BASE_URI}collections/", "rel": "collection"},
+        {"href": f"{BASE_URI}stac", "rel": "root"}
+    ]
+
+
+def get_items_params(collection_id, args):
+    """Returns the parameters of `/collections/{collection_id}/items` from the query string `args`."""
+
+    params = {
+        'collection_id': collection_id,
+        'bbox': args.get('bbox', None),
+        'time': args.get('time', None),
+        'ids': args.get('ids', None),
+        # 'intersects': args.get('intersects', None),  # not implemented yet
+        'page': int(args.get('page', 1)),
+        'limit': int(args.get('limit', 10)),
+        'next': args.get('next', None),
+        'count': args.get('count', INPE_STAC_COUNT_MODE),
+        # the `fields` extension receives a comma-separated list, e.g. 'id,geometry,-assets'
+        'fields': args.get('fields', None)
+    }
+
+    if params['bbox'] is not None:
+        # convert 'str' to list of floats
+        params['bbox'] = list(map(
+            lambda x: float(x), params['bbox'].split(',')
+        ))
+
+    # a search that can only run as a full scan may have its count capped
+    params['count'] = guard_full_scan(params)
+
+    set_collection(collection_id)
+
+    return params
+
+
+def get_search_params(method, args, request_json=None):
+    """
+    Returns the normalized parameters of `/stac/search` from the query string `args` of a GET request
+    or from the JSON body `request_json` of a POST request (it is None if the body is not JSON).
+    """
+
+    if method == 'GET':
+        params = {
+            'bbox': args.get('bbox', None),
+            'time': args.get('time', None),
+            'ids': args.get('ids', None),
+            'collections': args.get('collections', None),
+            'page': int(args.get('page', 1)),
+            'limit': int(args.get('limit', 10)),
+            'next': args.get('next', None),
+            'count': args.get('count', INPE_STAC_COUNT_MODE),
+            'fields': args.get('fields', None)
+        }
+
+        if params['collections'] is not None:
+            params['collections'] = params['collections'].split(',')
+
+        if params['bbox'] is not None:
+            # convert 'str' to list of floats
+            params['bbox'] = list(map(
+                lambda x: float(x), params['bbox'].split(',')
+            ))
+
+    elif method == "POST":
+        if request_json is None:
+            raise BadRequest('POST Request must be an application/json')
+
+        logging.info('get_search_params - request_json: %s', request_json)
+
+        params = {
+            'bbox': request_json.get('bbox', None),
+            'time': request_json.get('time', None),
+            'ids': request_json.get('ids', None),
+            'collections': request_json.get('collections', None),
+            'page': int(request_json.get('page', 1)),
+            'limit': int(request_json.get('limit', 10)),
+            'query': request_json.get('query', None),
+            'next': request_json.get('next', None),
+            'count': request_json.get('count', INPE_STAC_COUNT_MODE),
+            # the `fields` extension receives an object with the `include` and `exclude` lists
+            'fields': request_json.get('fields', None)
+        }
+
+        if params['ids'] is not None:
+            params['ids'] = ','.join(params['ids'])
+
+        if params['bbox'] is not None:
+            # convert list of values to list of floats
+            # because I can receive something is not float
+            params['bbox'] = list(map(
+                lambda x: float(x), params['bbox']
+            ))
+
+    else:
+        raise BadRequest(f'{method} method is not allowed')
+
+    if params['page'] < 1:
+        params['page'] = 1
+
+    if params['limit'] < 0:
+        params['limit'] = 0
+
+    # the same search has the same parameters, whatever the HTTP method or the order of the values
+    params = normalize_search_params(params)
+
+    # a search that can only run as a full scan may have its count capped
+    params['count'] = guard_full_scan(params)
+
+    set_collection(collections=params.get('collections'))
+
+    return params
+
+
+def get_batch_keys(request_json):
+    """Returns the (collection, id) pairs of the JSON body `request_json` of `/stac/items` or raises BadRequest."""
+
+    if not isinstance(request_json, dict):
+        raise BadRequest('POST Request must be an application/json')
+
+    items = request_json.get('items', None)
+
+    if not isinstance(items, list) or not items:
+        raise BadRequest('`items` field must be a non-empty list of {"collection": ..., "id": ...} objects')
+
+    if len(items) > INPE_STAC_BATCH_MAX_ITEMS:
+        raise BadRequest(f'`items` field must have at most {INPE_STAC_BATCH_MAX_ITEMS} objects')
+
+    keys = []
+
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('collection'), str) \
+                or not isinstance(item.get('id'), str):
+            raise BadRequest('`items` field must be a non-empty list of {"collection": ..., "id": ...} objects')
+
+        keys.append((item['collection'], item['id']))
+
+    set_collection(collections=sorted({collection for collection, _ in keys}))
+
+    return keys
+
+
+def make_items_body(collection_id, params, items, matched):
+    """Returns the encoded ItemCollection of `/collections/{collection_id}/items`."""
+
+    item_collection = make_json_items(
+        items, get_item_links(), item_stac_extensions=['eo'], fields=params['fields'], encoded=True
+    )
+
+    item_collection = make_json_item_collection(item_collection, params, matched)
+
+    # links to this ItemCollection
+    item_collection['links'] = get_links_property_to_collection_items(collection_id, params, items)
+
+    start_time = perf_counter()
+    body = dumps_item_collection(item_collection)
+    record('encode', perf_counter() - start_time)
+
+    return body
+
+
+def make_search_body(params, items, matched, metadata_related_to_collections):
+    """
+    Returns the encoded ItemCollection of `/stac/search`, without the links, which depend on the HTTP method,
+    and the keys of the returned rows, which are used to create the links by `add_search_links`.
+    """
+
+    item_collection = make_json_items(
+        items, get_item_links(), item_stac_extensions=['eo', 'query'], fields=params['fields'], encoded=True
+    )
+
+    item_collection = make_json_item_collection(
+        item_collection, params, matched, meta=metadata_related_to_collections
+    )
+
+    returned_rows = [{'collection': i['collection'], 'date': i['date'], 'id': i['id']} for i in items or []]
+
+    start_time = perf_counter()
+    body = dumps_item_collection(item_collection)
+    record('encode', perf_counter() - start_time)
+
+    return body, returned_rows
+
+
+def add_search_links(body, params, returned_rows, method):
+    """Returns the encoded ItemCollection `body` of `/stac/search` with its links."""
+
+    links = get_links_property_to_stac_search(params, returned_rows, method=method)
+
+    # remove the last '}' to write the links after the other properties
+    if links is not None:
+        body = body[:-1] + b',"links":' + dumps(links) + b'}'
+
+    return body
+
+
+@app.before_request
+def before_request():
+    if INPE_STAC_METRICS:
+        start_request()
+
+
+def finish_request_timings(response, endpoint):
+    """
+    Observes the timings of the current request by the histograms and sends them in the `Server-Timing` header.
+    The timings of a streamed response are observed after its last chunk, then they are not sent.
+    """
+
+    timings = get_timings()
+
+    if timings is None:
+        return
+
+    if response.is_streamed:
+        response.call_on_close(lambda: observe_request(timings, endpoint, timings.elapsed()))
+        return
+
+    total = timings.elapsed()
+
+    response.headers['Server-Timing'] = timings.server_timing(total)
+
+    observe_request(timings, endpoint, total)
+
 
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
+
+    if INPE_STAC_METRICS:
+        timings = get_timings()
+
+        # the collection of the other endpoints is in the URL
+        if timings is not None and timings.collection is None and request.view_args:
+            timings.collection = request.view_args.get('collection_id')
+
+        finish_request_timings(response, request.endpoint or 'not_found')
+
+    if response.status_code < 400:
+        validators = g.pop('validators', None)
+
+        if validators is not None:
+            response.set_etag(validators[0])
+            response.last_modified = validators[1]
+
+        cache_control = CACHE_CONTROL.get(request.endpoint)
+
+        if cache_control and 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = cache_control
+
     return response
 
 
@@ -86,6 +439,11 @@ def collections():
     Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/collection-spec/collection-spec.md#collection-fields
     """
 
+    response = not_modified(get_collections_last_modified())
+
+    if response is not None:
+        return response
+
     result = get_collections()
 
     collections = {
@@ -109,14 +467,20 @@ def collections_collections_id(collection_id):
     Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/collection-spec/collection-spec.md#collection-fields
     """
 
-    result = get_collections(collection_id)
+    last_modified = get_collection_last_modified(collection_id)
+    response = not_modified(last_modified)
+
+    if response is not None:
+        return response
+
+    result = get_collections(collection_id, last_modified)
 
     # if there is not a result, then it returns an empty collection
     if result is None:
         return jsonify({})
 
     # get the only one element inside the list and create the GeoJSON related to collection
-    collection = make_json_collection(result[0])
+    collection = make_json_collection(result[0], last_modified)
 
     return jsonify(collection)
 
@@ -133,15 +497,55 @@ def collections_collections_id_items(collection_id):
 
     logging.info('collections_collections_id_items')
 
+    params = get_items_params(collection_id, request.args)
+
+    logging.info('collections_collections_id_items - params: %s', params)
+
+    # if the page is large, then the items are streamed while they are read from the database
+    if is_stream(params):
+        items, get_matched = stream_collection_items(**params)
+
+        def make_tail(returned_rows):
+            matched, _ = get_matched(returned_rows)
+
+            return {
+                'context': make_json_context(params, matched, len(returned_rows)),
+                'links': get_links_property_to_collection_items(collection_id, params, returned_rows)
+            }
+
+        return Response(
+            stream_with_context(
+                stream_json_item_collection(items, get_item_links(), ['eo'], make_tail, fields=params['fields'])
+            ),
+            mimetype='application/json'
+        )
+
+    items, matched, _ = get_collection_items(**params)
+
+    return Response(make_items_body(collection_id, params, items, matched) + b'\n', mimetype='application/json')
+
+
+@app.route("/collections/<collection_id>/items.ndjson", methods=["GET"])
+@log_function_header
+@log_function_footer
+@catch_generic_exceptions
+def collections_collections_id_items_ndjson(collection_id):
+    """
+    Exports all the items of the collection that match the filters as newline-delimited STAC Items,
+    sorted by (date, id). The `after` parameter receives the id of the last received item to resume an export.
+    """
+
+    logging.info('collections_collections_id_items_ndjson')
+
     # parameters
     params = {
         'collection_id': collection_id,
         'bbox': request.args.get('bbox', None),
         'time': request.args.get('time', None),
-        'ids': request.args.get('ids', None),
-        # 'intersects': request.args.get('intersects', None),  # not implemented yet
-        'page': int(request.args.get('page', 1)),
-        'limit': int(request.args.get('limit', 10))
+        # the `query` extension receives a JSON object, e.g. '{"cloud_cover": {"lte": 10}}'
+        'query': request.args.get('query', None),
+        'after': request.args.get('after', None),
+        'fields': request.args.get('fields', None)
     }
 
     if params['bbox'] is not None:
@@ -150,46 +554,23 @@ def collections_collections_id_items(collection_id):
             lambda x: float(x), params['bbox'].split(',')
         ))
 
-    logging.info(f'collections_collections_id_items - params: {params}')
+    if params['query'] is not None:
+        try:
+            params['query'] = loads(params['query'])
+        except ValueError:
+            raise BadRequest('`query` field is not a valid JSON object')
 
-    items, matched, _ = get_collection_items(**params)
+        if not isinstance(params['query'], dict):
+            raise BadRequest('`query` field is not a valid JSON object')
 
-    # links to each Item inside ItemCollection
-    links = [
-        {"href": f"{BASE_URI}collections/", "rel": "self"},
-        {"href": f"{BASE_URI}collections/", "rel": "parent"},
-        {"href": f"{BASE_URI}collections/", "rel": "collection"},
-        {"href": f"{BASE_URI}stac", "rel": "root"}
-    ]
+    logging.info('collections_collections_id_items_ndjson - params: %s', params)
 
-    item_collection = make_json_items(
-        items, links, item_stac_extensions=['eo']
-    )
+    items = export_collection_items(**params)
 
-    item_collection = make_json_item_collection(item_collection, params, matched)
-
-    # remove unnecessary property to build the URL below
-    del params['collection_id']
-
-    if params['bbox'] is not None:
-        params['bbox'] = ','.join(list(map(
-            # convert the floats to str before joining the elements
-            lambda x: str(x), params['bbox']
-        )))
-
-    # convert 'params' from dict to str to add to the URL
-    params = get_query_string(params)
-
-    # links to this ItemCollection
-    item_collection['links'] = [
-        {"href": f"{BASE_URI}collections/{collection_id}/items?{params}", "rel": "self"},
-        {"href": f"{BASE_URI}collections/{collection_id}/items", "rel": "child"},
-        {"href": f"{BASE_URI}collections/{collection_id}", "rel": "collection"},
-        {"href": f"{BASE_URI}collections", "rel": "parent"},
-        {"href": f"{BASE_URI}stac", "rel": "root"}
-    ]
-
-    return jsonify(item_collection)
+    return Response(
+        stream_with_context(stream_ndjson_features(items, get_item_links(), ['eo'], fields=params['fields'])),
+        mimetype='application/x-ndjson'
+    )
 
 
 @app.route("/collections/<collection_id>/items/<item_id>", methods=["GET"])
@@ -199,20 +580,20 @@ def collections_collections_id_items(collection_id):
 def collections_collections_id_items_items_id(collection_id, item_id):
     logging.info('collections_collections_id_items_items_id')
 
-    logging.info(f'collections_collections_id_items_items_id - collection_id: {collection_id}')
-    logging.info(f'collections_collections_id_items_items_id - item_id: {item_id}')
+    logging.info('collections_collections_id_items_items_id - collection_id: %s', collection_id)
+    logging.info('collections_collections_id_items_items_id - item_id: %s', item_id)
 
-    item, _, _ = get_collection_items(collection_id=collection_id, item_id=item_id)
+    response = not_modified(get_item_last_modified(collection_id, item_id))
 
-    links = [
-        {"href": f"{BASE_URI}collections/", "rel": "self"},
-        {"href": f"{BASE_URI}collections/", "rel": "parent"},
-        {"href": f"{BASE_URI}collections/", "rel": "collection"},
-        {"href": f"{BASE_URI}stac", "rel": "root"}
-    ]
+    if response is not None:
+        return response
+
+    # the number of matched items is not returned, then I do not count them
+    item, _, _ = get_collection_items(collection_id=collection_id, item_id=item_id, count='off')
 
+    # the feature is encoded by the serializer, then it may be spliced from its rendered feature
     item_collection = make_json_items(
-        item, links, item_stac_extensions=['eo']
+        item, get_item_links(), item_stac_extensions=['eo'], encoded=True
     )
 
     # if an item was not returned, then I return an empty item
@@ -224,7 +605,7 @@ def collections_collections_id_items_items_id(collection_id, item_id):
         # then I get this one feature in order to return it
         item = item_collection['features'][0]
 
-    return jsonify(item)
+    return json_response(item)
 
 
 ##################################################
@@ -241,6 +622,11 @@ def stac():
     Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/catalog-spec/catalog-spec.md#catalog-fields
     """
 
+    response = not_modified(get_catalog_last_modified())
+
+    if response is not None:
+        return response
+
     collections = get_collections()
 
     catalog = {
@@ -285,89 +671,206 @@ def stac_search():
 
     logging.info('stac_search')
 
-    logging.info(f'stac_search - method: {request.method}')
+    logging.info('stac_search - method: %s', request.method)
 
     if request.method == 'GET':
         logging.info('stac_search() - request.args: %s', request.args)
 
-        params = {
-            'bbox': request.args.get('bbox', None),
-            'time': request.args.get('time', None),
-            'ids': request.args.get('ids', None),
-            'collections': request.args.get('collections', None),
-            'page': int(request.args.get('page', 1)),
-            'limit': int(request.args.get('limit', 10))
-        }
+    params = get_search_params(request.method, request.args, request.get_json() if request.is_json else None)
 
-        if params['collections'] is not None:
-            params['collections'] = params['collections'].split(',')
-
-        if params['bbox'] is not None:
-            # convert 'str' to list of floats
-            params['bbox'] = list(map(
-                lambda x: float(x), params['bbox'].split(',')
-            ))
+    logging.info('stac_search() - params: %s', params)
 
-    elif request.method == "POST":
-        if request.is_json:
-            request_json = request.get_json()
+    # if the page is large, then the items are streamed while they are read from the database
+    if is_stream(params):
+        items, get_matched = stream_collection_items(**params)
 
-            logging.info(f'stac_search - request_json: {request_json}')
+        def make_tail(returned_rows):
+            matched, metadata_related_to_collections = get_matched(returned_rows)
 
-            params = {
-                'bbox': request_json.get('bbox', None),
-                'time': request_json.get('time', None),
-                'ids': request_json.get('ids', None),
-                'collections': request_json.get('collections', None),
-                'page': int(request_json.get('page', 1)),
-                'limit': int(request_json.get('limit', 10)),
-                'query': request_json.get('query', None)
+            tail = {
+                'context': make_json_context(
+                    params, matched, len(returned_rows), meta=metadata_related_to_collections
+                )
             }
 
-            if params['ids'] is not None:
-                params['ids'] = ','.join(params['ids'])
+            links = get_links_property_to_stac_search(params, returned_rows)
 
-            if params['bbox'] is not None:
-                # convert list of values to list of floats
-                # because I can receive something is not float
-                params['bbox'] = list(map(
-                    lambda x: float(x), params['bbox']
-                ))
+            if links is not None:
+                tail['links'] = links
 
-        else:
-            raise BadRequest('POST Request must be an application/json')
+            return tail
 
-    if params['page'] < 1:
-        params['page'] = 1
+        return Response(
+            stream_with_context(stream_json_item_collection(
+                items, get_item_links(), ['eo', 'query'], make_tail, fields=params['fields']
+            )),
+            mimetype='application/json'
+        )
 
-    if params['limit'] < 0:
-        params['limit'] = 0
+    # the cached response does not have the links, because they depend on the HTTP method
+    cache_key, cached = get_cached_search(params)
 
-    logging.info(f'stac_search() - params: {params}')
+    if cached is not None:
+        logging.info('stac_search() - the response has been found in the cache')
 
-    items, matched, metadata_related_to_collections = get_collection_items(**params)
+        body, returned_rows = cached
+    else:
+        items, matched, metadata_related_to_collections = get_collection_items(**params)
 
-    links = [
-        {'href': f'{BASE_URI}collections/', 'rel': 'self'},
-        {'href': f'{BASE_URI}collections/', 'rel': 'parent'},
-        {'href': f'{BASE_URI}collections/', 'rel': 'collection'},
-        {'href': f'{BASE_URI}stac', 'rel': 'root'}
-    ]
+        body, returned_rows = make_search_body(params, items, matched, metadata_related_to_collections)
+
+        set_cached_search(cache_key, body, returned_rows)
+
+    body = add_search_links(body, params, returned_rows, request.method)
+
+    return Response(body + b'\n', mimetype='application/json')
+
+
+@app.route("/stac/items", methods=["POST"])
+@log_function_header
+@log_function_footer
+@catch_generic_exceptions
+def stac_items():
+    """
+    Returns the items of a list of (collection, id) pairs as an ItemCollection, in the order of the list and
+    without the missing ones, e.g. '{"items": [{"collection": "CBERS4A_MUX_L2_DN", "id": "CBERS4A_MUX..."}]}'.
+    The items are read by the primary key and they are not counted. A large list is streamed, unless the body
+    has '"stream": false'.
+    """
+
+    logging.info('stac_items')
+
+    request_json = request.get_json() if request.is_json else None
+
+    keys = get_batch_keys(request_json)
+
+    stream = request_json.get('stream', is_stream({'limit': len(keys)}))
+
+    if not isinstance(stream, bool):
+        raise BadRequest('`stream` field must be a boolean')
+
+    # the `fields` field is validated now, because a stream would only read it after the response has started
+    fields = normalize_fields(request_json.get('fields', None))
+
+    logging.info('stac_items - items: %s - stream: %s - fields: %s', len(keys), stream, fields)
+
+    # the `context` extension reports how many distinct items were requested and found
+    requested = len(set(keys))
+
+    if stream:
+        def make_tail(returned_rows):
+            return {'context': {'requested': requested, 'returned': len(returned_rows)}}
+
+        return Response(
+            stream_with_context(
+                stream_json_item_collection(
+                    iter_items_by_keys(keys, fields), get_item_links(), ['eo'], make_tail, fields=fields
+                )
+            ),
+            mimetype='application/json'
+        )
 
     item_collection = make_json_items(
-        items, links, item_stac_extensions=['eo', 'query']
+        get_items_by_keys(keys, fields), get_item_links(), item_stac_extensions=['eo'], fields=fields, encoded=True
     )
 
-    item_collection = make_json_item_collection(
-        item_collection, params, matched, meta=metadata_related_to_collections
-    )
+    item_collection['stac_extensions'].append('context')
+    item_collection['context'] = {'requested': requested, 'returned': len(item_collection['features'])}
 
-    links = get_links_property_to_stac_search(params)
+    start_time = perf_counter()
+    body = dumps_item_collection(item_collection)
+    record('encode', perf_counter() - start_time)
 
-    if links is not None:
-        item_collection['links'] = links
+    return json_response(body)
+
+
+##################################################
+# Metrics Endpoints
+##################################################
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Returns the duration of the requests of the worker (and of their phases) in the Prometheus text format."""
+
+    if not INPE_STAC_METRICS:
+        raise NotFound()
+
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+##################################################
+# Admin Endpoints
+##################################################
+
+@app.route("/admin/cache/invalidate", methods=["POST"])
+@log_function_header
+@log_function_footer
+@require_admin_token
+def admin_cache_invalidate():
+    """
+    Removes all the entries of the in-process caches of the worker that receives the request.
+    In order to refresh all the workers, use the `flask invalidate-collections-cache` command.
+    """
+
+    invalidate_caches()
+
+    return jsonify({'code': '200', 'description': 'The caches have been invalidated'})
+
+
+@app.route("/admin/cache", methods=["GET"])
+@log_function_header
+@log_function_footer
+@require_admin_token
+def admin_cache():
+    """Returns the number of entries, weight, hits and misses of the in-process caches of the worker."""
+
+    return jsonify(get_cache_stats())
+
+
+@app.route("/admin/slow-queries", methods=["GET"])
+@log_function_header
+@log_function_footer
+@require_admin_token
+def admin_slow_queries():
+    """Returns the last slow queries of the worker, from the newest to the oldest one, with their plans."""
 
-    return jsonify(item_collection)
+    limit = request.args.get('limit', None)
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise BadRequest('`limit` field must be an integer')
+
+    return json_response({
+        'pid': getpid(),
+        'threshold_ms': INPE_STAC_SLOW_QUERY_THRESHOLD_MS,
+        'queries': get_slow_queries(limit)
+    })
+
+
+@app.route("/admin/slow-queries/dump", methods=["POST"])
+@log_function_header
+@log_function_footer
+@require_admin_token
+def admin_slow_queries_dump():
+    """Appends the last slow queries of the worker to its `<INPE_STAC_SLOW_QUERY_DUMP_PATH>-<pid>.ndjson` file."""
+
+    path = f'{INPE_STAC_SLOW_QUERY_DUMP_PATH}-{getpid()}.ndjson'
+
+    return jsonify({'path': path, 'written': dump_slow_queries(path)})
+
+
+@app.route("/admin/slow-queries/clear", methods=["POST"])
+@log_function_header
+@log_function_footer
+@require_admin_token
+def admin_slow_queries_clear():
+    """Removes the saved slow queries of the worker, e.g. after dumping them."""
+
+    clear_slow_queries()
+
+    return jsonify({'code': '200', 'description': 'The slow queries have been removed'})
 
 
 ##################################################
@@ -382,6 +885,14 @@ def handle_bad_request(e):
     return resp
 
 
+@app.errorhandler(403)
+def handle_forbidden(e):
+    resp = jsonify({'code': '403', 'description': 'Forbidden - {}'.format(e.description)})
+    resp.status_code = 403
+
+    return resp
+
+
 @app.errorhandler(404)
 def handle_page_not_found(e):
     resp = jsonify({'code': '404', 'description': 'Page not found'})
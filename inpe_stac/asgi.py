@@ -0,0 +1,164 @@
+"""
+ASGI application, e.g. `uvicorn inpe_stac.asgi:app --host=0.0.0.0 --port=5000`.
+
+It exposes the same routes of the WSGI application (`inpe_stac.app`). The pages of `/collections/{collection_id}/items`
+and `/stac/search` are served asynchronously, then a worker serves other requests while it waits for MySQL.
+Any other route and the streamed pages are served by the WSGI application.
+"""
+
+from abc import ABC, abstractmethod
+from json import loads
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import BadRequest, HTTPException, InternalServerError
+
+from inpe_stac.app import app as wsgi_app, CACHE_CONTROL, add_search_links, get_items_params, \
+                          get_search_params, make_items_body, make_search_body
+from inpe_stac.data import get_cached_search, set_cached_search
+from inpe_stac.data_async import close_pool, get_collection_items
+from inpe_stac.environment import INPE_STAC_METRICS
+from inpe_stac.log import logging
+from inpe_stac.metrics import observe_request, start_request
+from inpe_stac.util import is_stream
+
+
+wsgi = WSGIMiddleware(wsgi_app)
+
+
+def make_error_response(error):
+    """
+    Returns the response of the HTTP error `error` (e.g. `BadRequest`), created by the error handlers
+    of the WSGI application, then it has the same body of the WSGI mode.
+    """
+
+    with wsgi_app.test_request_context():
+        response = wsgi_app.handle_http_exception(error)
+
+        # if the WSGI application does not have a handler to this error, then it is the default error page
+        if isinstance(response, HTTPException):
+            return Response(error.get_body(), status_code=error.code, media_type='text/html')
+
+        return Response(response.get_data(), status_code=response.status_code, media_type=response.mimetype)
+
+
+class AsyncEndpoint(ABC):
+    """
+    ASGI endpoint whose requests are served by `handle`. If `handle` returns None (e.g. the page is streamed),
+    then the request is served by the WSGI application. An HTTP error (e.g. `BadRequest`) is sent with its
+    status code and any other exception is logged and sent as '500 Internal Server Error', as the WSGI mode does.
+    """
+
+    # name of the view function of `inpe_stac.app`, which defines the `Cache-Control` header
+    endpoint = None
+
+    @abstractmethod
+    async def handle(self, request, body):
+        """Returns the response to `request`, whose `body` has already been read, or None to the WSGI application."""
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        body = await request.body()
+
+        timings = start_request() if INPE_STAC_METRICS else None
+
+        try:
+            response = await self.handle(request, body)
+        except HTTPException as error:
+            logging.info('%s() - async - %s', self.endpoint, error)
+            response = make_error_response(error)
+        except Exception as error:
+            logging.exception('%s() - async - an unexpected error ocurred', self.endpoint)
+            response = make_error_response(InternalServerError(str(error)))
+
+        if response is None:
+            # the body has already been read, then it is sent again to the WSGI application
+            async def replay_receive():
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            await wsgi(scope, replay_receive, send)
+            return
+
+        response.headers['Access-Control-Allow-Origin'] = '*'
+
+        if response.status_code < 400 and CACHE_CONTROL.get(self.endpoint):
+            response.headers['Cache-Control'] = CACHE_CONTROL[self.endpoint]
+
+        if timings is not None:
+            total = timings.elapsed()
+
+            response.headers['Server-Timing'] = timings.server_timing(total)
+
+            observe_request(timings, self.endpoint, total)
+
+        await response(scope, receive, send)
+
+
+class CollectionItemsEndpoint(AsyncEndpoint):
+    """`/collections/{collection_id}/items`"""
+
+    endpoint = 'collections_collections_id_items'
+
+    async def handle(self, request, body):
+        collection_id = request.path_params['collection_id']
+
+        params = get_items_params(collection_id, request.query_params)
+
+        if is_stream(params):
+            return None
+
+        items, matched, _ = await get_collection_items(**params)
+
+        return Response(make_items_body(collection_id, params, items, matched) + b'\n', media_type='application/json')
+
+
+class SearchEndpoint(AsyncEndpoint):
+    """`/stac/search`"""
+
+    endpoint = 'stac_search'
+
+    async def handle(self, request, body):
+        request_json = None
+
+        if request.method == 'POST' and request.headers.get('content-type', '').startswith('application/json'):
+            try:
+                request_json = loads(body)
+            except ValueError:
+                # the same error of `flask.Request.get_json`
+                raise BadRequest()
+
+        params = get_search_params(request.method, request.query_params, request_json)
+
+        if is_stream(params):
+            return None
+
+        # the cache may be a file or may probe the database for changes, then it does not block the event loop
+        cache_key, cached = await run_in_threadpool(get_cached_search, params)
+
+        if cached is not None:
+            body, returned_rows = cached
+        else:
+            items, matched, metadata_related_to_collections = await get_collection_items(**params)
+
+            body, returned_rows = make_search_body(params, items, matched, metadata_related_to_collections)
+
+            if cache_key is not None:
+                await run_in_threadpool(set_cached_search, cache_key, body, returned_rows)
+
+        body = add_search_links(body, params, returned_rows, request.method)
+
+        return Response(body + b'\n', media_type='application/json')
+
+
+app = Starlette(
+    routes=[
+        Route('/collections/{collection_id}/items', CollectionItemsEndpoint(), methods=['GET']),
+        Route('/stac/search', SearchEndpoint(), methods=['GET', 'POST']),
+        Mount('/', app=wsgi)
+    ],
+    on_shutdown=[close_pool]
+)
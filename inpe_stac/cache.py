@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from json import dumps, loads
+from os import O_CREAT, O_RDWR, close, getpid, getuid, makedirs, open as os_open, stat
+from os.path import dirname
+import sqlite3
+from threading import Lock, local
+from time import monotonic, time
+
+
+class TTLCache:
+    """
+    Thread-safe cache bounded by `maxsize` entries, whose entries expire after `ttl` seconds.
+    When the cache is full, the least recently used entry is removed.
+
+    If `maxweight` is greater than zero, then the sum of the `weight` of the entries (e.g. their size in bytes)
+    is bounded by it too. `hits` and `misses` count the results of `get`.
+    """
+
+    def __init__(self, maxsize=128, ttl=300, maxweight=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (expiration time, value, weight)
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value, weight = entry
+
+            # if the entry has expired, then I remove it
+            if expires_at <= monotonic():
+                del self.__entries[key]
+                self.weight -= weight
+                self.misses += 1
+                return default
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value, weight=0):
+        # a cache without space or time to live does not save anything
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+
+        # an entry heavier than the whole cache would remove all the other entries
+        if self.maxweight > 0 and weight > self.maxweight:
+            return
+
+        with self.__lock:
+            old_entry = self.__entries.pop(key, None)
+
+            if old_entry is not None:
+                self.weight -= old_entry[2]
+
+            self.__entries[key] = (monotonic() + self.ttl, value, weight)
+            self.weight += weight
+
+            while len(self.__entries) > self.maxsize or (self.maxweight > 0 and self.weight > self.maxweight):
+                _, (_, _, removed_weight) = self.__entries.popitem(last=False)
+                self.weight -= removed_weight
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.weight = 0
+
+    def stats(self):
+        """Returns the number of entries, their weight and the number of hits and misses."""
+
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'weight': self.weight,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class SQLiteCache:
+    """
+    Cache saved in a SQLite database file, then its entries are shared by all the workers of the same host.
+    It has the same interface of `TTLCache`, but its values are `(body, rows)` tuples of an encoded response
+    (bytes) and a list of JSON values (dates are saved as strings) and, when there are more than `maxsize` entries,
+    the ones that expire first are removed. `hits` and `misses` are counted by each process.
+
+    The values are never unpickled, and the file is created with mode 0600 in a directory with mode 0700,
+    because a file that another user can write must not run code in the workers. An existing file of another
+    user is refused.
+    """
+
+    def __init__(self, path, maxsize=1024, ttl=300):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.__lock = Lock()
+
+        # each thread of each process has its own connection
+        self.__local = local()
+
+        if dirname(path):
+            makedirs(dirname(path), mode=0o700, exist_ok=True)
+
+        close(os_open(path, O_RDWR | O_CREAT, 0o600))
+
+        if stat(path).st_uid != getuid():
+            raise ValueError(f'the cache file `{path}` belongs to another user')
+
+    def __get_connection(self):
+        connection = getattr(self.__local, 'connection', None)
+
+        # a connection inherited from the parent process must not be used
+        if connection is None or self.__local.pid != getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL;')
+            connection.execute('PRAGMA synchronous = NORMAL;')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY, body BLOB NOT NULL, rows TEXT NOT NULL, expires_at REAL NOT NULL
+                );
+            ''')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS response_cache_expires_at_idx ON response_cache (expires_at);'
+            )
+
+            self.__local.connection = connection
+            self.__local.pid = getpid()
+
+        return connection
+
+    def get(self, key, default=None):
+        row = self.__get_connection().execute(
+            'SELECT body, rows FROM response_cache WHERE key = ? AND expires_at > ?;', (key, time())
+        ).fetchone()
+
+        with self.__lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if row is None:
+            return default
+
+        return bytes(row[0]), loads(row[1])
+
+    def set(self, key, value, weight=0):
+        # a cache without space or time to live does not save anything
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+
+        body, rows = value
+
+        now = time()
+        connection = self.__get_connection()
+
+        connection.execute(
+            'INSERT OR REPLACE INTO response_cache (key, body, rows, expires_at) VALUES (?, ?, ?, ?);',
+            (key, body, dumps(rows, separators=(',', ':'), default=str), now + self.ttl)
+        )
+
+        # remove the expired entries and the ones that exceed the maximum size
+        connection.execute('DELETE FROM response_cache WHERE expires_at <= ?;', (now,))
+        connection.execute('''
+            DELETE FROM response_cache
+            WHERE key IN (SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?);
+        ''', (self.maxsize,))
+
+    def clear(self):
+        self.__get_connection().execute('DELETE FROM response_cache;')
+
+    def stats(self):
+        """Returns the number of entries, their weight and the number of hits and misses."""
+
+        entries = len(self)
+
+        with self.__lock:
+            return {
+                'entries': entries,
+                'weight': 0,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def __len__(self):
+        return self.__get_connection().execute('SELECT COUNT(*) FROM response_cache;').fetchone()[0]
@@ -0,0 +1,58 @@
+"""
+Command line interface of the service. The commands are available through `flask <command>`.
+"""
+
+import click
+
+from inpe_stac.data import backfill_footprints, do_execute, rebuild_collection_summary, refresh_features
+from inpe_stac.environment import INPE_STAC_CHANGE_TRACKING
+
+
+@click.command('invalidate-collections-cache')
+def invalidate_collections_cache_command():
+    """Makes all the workers refresh their collection metadata cache."""
+
+    if not INPE_STAC_CHANGE_TRACKING:
+        raise click.ClickException(
+            'INPE_STAC_CHANGE_TRACKING is disabled, then use the `POST /admin/cache/invalidate` endpoint instead.'
+        )
+
+    # the workers refresh their cache when the change detection probe finds a new `updated` value
+    do_execute('UPDATE stac_collection SET updated = CURRENT_TIMESTAMP(6);')
+
+    click.echo('The collection metadata cache will be refreshed by the next change detection probe of each worker.')
+
+
+@click.command('rebuild-collection-summary')
+def rebuild_collection_summary_command():
+    """Recreates the `stac_collection_summary` table from all the items."""
+
+    collections = rebuild_collection_summary()
+
+    click.echo(f'The summary of {collections} collections has been rebuilt.')
+
+
+@click.command('backfill-footprints')
+@click.option('--batch-size', default=10000, show_default=True, help='Number of items updated by each statement.')
+def backfill_footprints_command(batch_size):
+    """Fills the `footprint` column of the items from their corners."""
+
+    items = backfill_footprints(batch_size=batch_size)
+
+    click.echo(f'The footprint of {items} items has been filled.')
+
+
+@click.command('refresh-features')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of items rendered by each statement.')
+@click.option('--prune', is_flag=True, help='Delete the rendered features of the removed items too.')
+def refresh_features_command(batch_size, prune):
+    """Renders the features of the new and changed items to the `stac_item_feature` table."""
+
+    if not INPE_STAC_CHANGE_TRACKING:
+        raise click.ClickException(
+            'INPE_STAC_CHANGE_TRACKING is disabled, then the changed items can not be found.'
+        )
+
+    rendered, deleted = refresh_features(batch_size=batch_size, prune=prune)
+
+    click.echo(f'The feature of {rendered} items has been rendered and {deleted} old features have been deleted.')
@@ -1,33 +1,364 @@
 
+from array import array
 from collections import OrderedDict
-from copy import deepcopy
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timedelta, timezone
 from functools import reduce
 from json import loads
+from re import findall
 from pprint import PrettyPrinter
-from os import getenv
+from os import getpid
+from threading import BoundedSemaphore, Lock, Thread
 
 from flask import request
 import sqlalchemy
-from sqlalchemy.sql import text
-from time import time
+from sqlalchemy import event, exc
+from sqlalchemy.sql import bindparam, text
+from time import perf_counter, sleep, time
 from werkzeug.exceptions import BadRequest, InternalServerError
 
-from inpe_stac.log import logging
+from inpe_stac.cache import SQLiteCache, TTLCache
+from inpe_stac.log import logging, sql_logger
 from inpe_stac.decorator import log_function_header
+from inpe_stac.fields import format_fields, parse_fields
+from inpe_stac.footprint_index import FootprintIndex
+from inpe_stac.metrics import record
+from inpe_stac.query import compile_query
+from inpe_stac.serializer import FeatureSerializer, PNG_ROOT_PLACEHOLDER, TIF_ROOT_PLACEHOLDER, dumps
+from inpe_stac.slow_queries import SlowQueryLog
 from inpe_stac.environment import API_VERSION, BASE_URI, \
-                                  DB_USER, DB_PASS, DB_HOST, DB_NAME
-from inpe_stac.util import calc_offset, get_query_string, \
-                           insert_deleted_flag_to_where, len_result
+                                  DB_USER, DB_PASS, DB_HOST, DB_NAME, \
+                                  DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, \
+                                  DB_POOL_RECYCLE, DB_POOL_PRE_PING, \
+                                  INPE_STAC_COUNT_CAP, INPE_STAC_COUNT_CACHE_SIZE, \
+                                  INPE_STAC_COUNT_CACHE_TTL, DB_QUERY_WORKERS, \
+                                  INPE_STAC_CHANGE_TRACKING, INPE_STAC_COLLECTIONS_CACHE_SIZE, \
+                                  INPE_STAC_COLLECTIONS_CACHE_TTL, INPE_STAC_COLLECTIONS_PROBE_INTERVAL, \
+                                  INPE_STAC_FEATURE_CACHE_SIZE, INPE_STAC_FEATURE_CACHE_MAX_BYTES, \
+                                  INPE_STAC_FEATURE_CACHE_TTL, INPE_STAC_SEARCH_CACHE, INPE_STAC_SEARCH_CACHE_PATH, \
+                                  INPE_STAC_SEARCH_CACHE_SIZE, INPE_STAC_SEARCH_CACHE_TTL, \
+                                  INPE_STAC_COLLECTION_SUMMARY, INPE_STAC_BBOX_MODE, \
+                                  INPE_STAC_FOOTPRINT_INDEX, INPE_STAC_FOOTPRINT_INDEX_MAX_CANDIDATES, \
+                                  INPE_STAC_FOOTPRINT_INDEX_POLL_INTERVAL, INPE_STAC_FOOTPRINT_INDEX_REBUILD_INTERVAL, \
+                                  INPE_STAC_SLOW_QUERY_EXPLAIN, INPE_STAC_SLOW_QUERY_LOG_SIZE, \
+                                  INPE_STAC_SLOW_QUERY_THRESHOLD_MS, INPE_STAC_IDS_CHUNK_SIZE, \
+                                  INPE_STAC_FULL_SCAN_POLICY, INPE_STAC_COLLECTIONS_SEARCH, \
+                                  INPE_STAC_PRERENDERED_FEATURES
+from inpe_stac.util import calc_offset, decode_next_token, get_query_string, \
+                           insert_deleted_flag_to_where, len_result, make_next_token, make_search_cache_key
 
 
 pp = PrettyPrinter(indent=4)
 
+# process-wide engine, it is lazily created by `get_engine` and shared by all requests
+__engine = None
+# PID of the process that created `__engine`
+__engine_pid = None
+__engine_lock = Lock()
+
+# process-wide thread pool to run queries at the same time, it is lazily created by `get_query_executor`
+__query_executor = None
+# PID of the process that created `__query_executor`
+__query_executor_pid = None
+# free slots of `__query_executor`, a query that does not get a slot runs in the caller thread
+__query_slots = BoundedSemaphore(DB_QUERY_WORKERS)
+
+# available strategies to compute the `matched` property of a search
+COUNT_MODES = ('exact', 'estimated', 'capped', 'cached', 'off')
+
+# results of the 'cached' count strategy, the key is the WHERE clause with its parameters
+__count_cache = TTLCache(maxsize=INPE_STAC_COUNT_CACHE_SIZE, ttl=INPE_STAC_COUNT_CACHE_TTL)
+
+# collection metadata: the rows returned by `get_collections` and the JSONs created by `make_json_collection`
+__collections_cache = TTLCache(maxsize=INPE_STAC_COLLECTIONS_CACHE_SIZE, ttl=INPE_STAC_COLLECTIONS_CACHE_TTL)
+# last value returned by the change detection probe and when it has been executed
+__collections_marker = None
+__collections_probe_time = 0
+__collections_probe_lock = Lock()
+
+# it differs a missing entry from a cached None
+__MISSING = object()
+
+# created STAC Items (and their encoded JSON) shared by all the requests of this process
+__feature_cache = TTLCache(
+    maxsize=INPE_STAC_FEATURE_CACHE_SIZE, ttl=INPE_STAC_FEATURE_CACHE_TTL,
+    maxweight=INPE_STAC_FEATURE_CACHE_MAX_BYTES
+)
+
+SEARCH_CACHES = ('off', 'memory', 'sqlite')
+
+FULL_SCAN_POLICIES = ('allow', 'cap', 'reject')
+
+COLLECTIONS_SEARCHES = ('fanout', 'window')
+
+if INPE_STAC_COLLECTIONS_SEARCH not in COLLECTIONS_SEARCHES:
+    raise ValueError(
+        f'INPE_STAC_COLLECTIONS_SEARCH must be one of the following values: {", ".join(COLLECTIONS_SEARCHES)}'
+    )
+
+# a rendered feature is just served while its `updated` value is the same of its item
+if INPE_STAC_PRERENDERED_FEATURES and not INPE_STAC_CHANGE_TRACKING:
+    raise ValueError('INPE_STAC_PRERENDERED_FEATURES needs INPE_STAC_CHANGE_TRACKING')
+
+# a bbox search is limited to the candidates of the footprint index, then the items added or changed after its
+# build must be polled, otherwise they are missing from the results until the next build
+if INPE_STAC_FOOTPRINT_INDEX and not INPE_STAC_CHANGE_TRACKING:
+    raise ValueError('INPE_STAC_FOOTPRINT_INDEX needs INPE_STAC_CHANGE_TRACKING')
+
+# number of streamed rows whose rendered features are read at once
+PRERENDERED_FEATURES_CHUNK_SIZE = 100
+
+# `refresh_features` reads again the items changed a bit before its watermark, because the transaction that
+# has changed an item may be committed after the ones of items with later `updated` values
+REFRESH_FEATURES_OVERLAP = timedelta(minutes=5)
+
+if INPE_STAC_FULL_SCAN_POLICY not in FULL_SCAN_POLICIES:
+    raise ValueError(
+        f'INPE_STAC_FULL_SCAN_POLICY must be one of the following values: {", ".join(FULL_SCAN_POLICIES)}'
+    )
+
+# responses of `/stac/search`, without their links, which depend on the HTTP method
+if INPE_STAC_SEARCH_CACHE == 'memory':
+    __search_cache = TTLCache(maxsize=INPE_STAC_SEARCH_CACHE_SIZE, ttl=INPE_STAC_SEARCH_CACHE_TTL)
+elif INPE_STAC_SEARCH_CACHE == 'sqlite':
+    __search_cache = SQLiteCache(
+        INPE_STAC_SEARCH_CACHE_PATH, maxsize=INPE_STAC_SEARCH_CACHE_SIZE, ttl=INPE_STAC_SEARCH_CACHE_TTL
+    )
+elif INPE_STAC_SEARCH_CACHE == 'off':
+    __search_cache = None
+else:
+    raise ValueError(f'INPE_STAC_SEARCH_CACHE must be one of the following values: {", ".join(SEARCH_CACHES)}')
+
+# last slow queries of this process, if the threshold is '0', then the queries are not saved
+if INPE_STAC_SLOW_QUERY_THRESHOLD_MS > 0:
+    __slow_query_log = SlowQueryLog(
+        maxlen=INPE_STAC_SLOW_QUERY_LOG_SIZE, threshold=INPE_STAC_SLOW_QUERY_THRESHOLD_MS / 1000,
+        explain=(lambda sql, params: explain_query(sql, **params)) if INPE_STAC_SLOW_QUERY_EXPLAIN else None
+    )
+else:
+    __slow_query_log = None
+
+# in-memory footprint index of this process, it is built and updated by a thread started by `get_footprint_index`
+__footprint_index = None
+# PID of the process that started the thread
+__footprint_index_pid = None
+
+
+def invalidate_caches():
+    """Removes all the entries of the in-process caches."""
+
+    logging.info('invalidate_caches - removing all the cached entries')
+
+    __collections_cache.clear()
+    __count_cache.clear()
+    __feature_cache.clear()
+
+    # the 'sqlite' search cache is shared, then it is cleared to all the workers of the host
+    if __search_cache is not None:
+        __search_cache.clear()
+
+
+def get_cache_stats():
+    """Returns the number of entries, weight, hits and misses of each in-process cache."""
+
+    stats = {
+        'collections': __collections_cache.stats(),
+        'count': __count_cache.stats(),
+        'feature': __feature_cache.stats()
+    }
+
+    if __search_cache is not None:
+        stats['search'] = __search_cache.stats()
+
+    return stats
+
+
+def get_cached_search(params):
+    """
+    Returns the key of the search with the normalized `params` and the cached `(body, returned_rows)` tuple of it,
+    which is None if it is not cached. The key has the last `updated` marker of the collections and items,
+    then the new items are found after `INPE_STAC_COLLECTIONS_PROBE_INTERVAL` seconds, at most.
+    If the cache is disabled, then the key is None.
+    """
+
+    if __search_cache is None:
+        return None, None
+
+    key = make_search_cache_key(params, __probe_collections_cache())
+
+    return key, __search_cache.get(key)
+
+
+def set_cached_search(key, body, returned_rows):
+    """Saves the encoded ItemCollection of a search, without `links`, and the keys of its rows."""
+
+    if __search_cache is None or key is None:
+        return
+
+    __search_cache.set(key, (body, returned_rows), weight=len(body))
+
+
+def __probe_collections_cache():
+    """
+    Invalidates the collection metadata cache when the last `updated` value of `stac_collection`, `stac_item`
+    or `stac_collection_summary` (if `INPE_STAC_COLLECTION_SUMMARY` is enabled) has changed. The probe runs
+    at most once each `INPE_STAC_COLLECTIONS_PROBE_INTERVAL` seconds and a request never waits for another one.
+    It returns the last known `(collections, items, summaries)` marker, as UNIX timestamps, or None.
+    """
+
+    global __collections_marker, __collections_probe_time
+
+    if not INPE_STAC_CHANGE_TRACKING:
+        return None
+
+    # the first probe of the process runs even if the interval is disabled, then there is always a marker
+    if __collections_marker is not None and (
+            INPE_STAC_COLLECTIONS_PROBE_INTERVAL <= 0 or
+            time() - __collections_probe_time < INPE_STAC_COLLECTIONS_PROBE_INTERVAL):
+        return __collections_marker
+
+    # if another thread is already probing, then I do not wait for it
+    if not __collections_probe_lock.acquire(blocking=False):
+        return __collections_marker
+
+    summaries = 'SELECT UNIX_TIMESTAMP(MAX(updated)) FROM stac_collection_summary' \
+        if INPE_STAC_COLLECTION_SUMMARY else 'SELECT NULL'
+
+    try:
+        result, _ = do_query(f'''
+            SELECT
+                (SELECT UNIX_TIMESTAMP(MAX(updated)) FROM stac_collection) AS collections,
+                (SELECT UNIX_TIMESTAMP(MAX(updated)) FROM stac_item) AS items,
+                ({summaries}) AS summaries;
+        ''')
+
+        marker = (result[0]['collections'], result[0]['items'], result[0]['summaries'])
+
+        if __collections_marker is not None and marker != __collections_marker:
+            logging.info('__probe_collections_cache - the collections have changed: %s', marker)
+            __collections_cache.clear()
+
+        __collections_marker = marker
+        __collections_probe_time = time()
+
+        return marker
+    finally:
+        __collections_probe_lock.release()
+
+
+def __from_unix_timestamp(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(float(timestamp), timezone.utc)
+
+
+def __max_timestamp(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+
+    return __from_unix_timestamp(max(timestamps)) if timestamps else None
+
+
+def get_catalog_last_modified():
+    """
+    Returns when a collection has changed for the last time (an UTC datetime), or None if `INPE_STAC_CHANGE_TRACKING`
+    is disabled. The catalog (`/stac`) just lists the collections, then the items do not change it. The time comes
+    from the marker of the collection metadata cache, then it is as recent as the cached collections.
+    """
+
+    marker = __probe_collections_cache()
+
+    return None if marker is None else __max_timestamp(marker[0])
+
+
+def get_collections_last_modified():
+    """
+    Returns when a collection or its summary has changed for the last time (an UTC datetime), or None if
+    `INPE_STAC_CHANGE_TRACKING` is disabled. Without `INPE_STAC_COLLECTION_SUMMARY`, the items just give the bands
+    of their collection, which do not change. The time comes from the marker of the collection metadata cache,
+    then it is as recent as the cached collections.
+    """
+
+    marker = __probe_collections_cache()
+
+    if marker is None:
+        return None
+
+    collections, _, summaries = marker
+
+    return __max_timestamp(collections, summaries)
+
+
+def get_collection_last_modified(collection_id):
+    """
+    Returns when the collection `collection_id` or its summary has changed for the last time (an UTC datetime),
+    or None if the collection does not exist or `INPE_STAC_CHANGE_TRACKING` is disabled. It is read by primary key,
+    then the changes of the other collections and of their items do not change it.
+    """
+
+    if not INPE_STAC_CHANGE_TRACKING:
+        return None
+
+    if INPE_STAC_COLLECTION_SUMMARY:
+        query = '''
+            SELECT UNIX_TIMESTAMP(sc.updated) AS collection, UNIX_TIMESTAMP(s.updated) AS items
+            FROM stac_collection sc
+            LEFT JOIN stac_collection_summary s
+            ON sc.id = s.collection
+            WHERE sc.id = :collection_id;
+        '''
+    else:
+        query = '''
+            SELECT UNIX_TIMESTAMP(updated) AS collection, NULL AS items
+            FROM stac_collection
+            WHERE id = :collection_id;
+        '''
+
+    result, _ = do_query(query, collection_id=collection_id)
+
+    if not result:
+        return None
+
+    return __max_timestamp(result[0]['collection'], result[0]['items'])
+
+
+def get_item_last_modified(collection_id, item_id):
+    """
+    Returns when an item has changed for the last time (an UTC datetime), or None if the item does not exist
+    or `INPE_STAC_CHANGE_TRACKING` is disabled. A removed (i.e. `deleted`) item has changed too.
+    """
+
+    if not INPE_STAC_CHANGE_TRACKING:
+        return None
+
+    result, _ = do_query('''
+        SELECT UNIX_TIMESTAMP(updated) AS updated
+        FROM stac_item
+        WHERE id = :item_id AND collection = :collection_id;
+    ''', item_id=item_id, collection_id=collection_id)
+
+    if not result:
+        return None
+
+    return __from_unix_timestamp(result[0]['updated'])
+
 
 @log_function_header
-def get_collections(collection_id=None):
+def get_collections(collection_id=None, version=None):
+    """
+    Returns the rows of the collections, or of the collection `collection_id`, from the collection metadata cache.
+    `version` (e.g. the `get_collection_last_modified` time) is part of the key of the cached rows,
+    then the rows of an older version are not returned.
+    """
+
     logging.info('get_collections')
-    logging.info(f'get_collections - collection_id: {collection_id}')
+    logging.info('get_collections - collection_id: %s', collection_id)
+
+    __probe_collections_cache()
+
+    result = __collections_cache.get(('rows', collection_id, version), __MISSING)
+
+    if result is not __MISSING:
+        logging.info('get_collections - len(result): %s (cached)', len_result(result))
+        return result
 
     kwargs = {}
     sc_where = si_where = ''
@@ -38,51 +369,311 @@ def get_collections(collection_id=None):
         si_where = 'WHERE collection = :collection_id'
         kwargs = { 'collection_id': collection_id }
 
-    query = f'''
-        SELECT *
-        FROM stac_collection sc
-        LEFT JOIN (
-            SELECT collection, assets
-            FROM `stac_item`
-            {si_where}
-            GROUP BY collection
-        ) si
-        ON sc.id = si.collection
-        {sc_where};
-    '''
+    # if the summary table exists, then I read the items information from it instead of grouping `stac_item`
+    if INPE_STAC_COLLECTION_SUMMARY:
+        query = f'''
+            SELECT sc.*, s.bands, s.item_count, s.deleted_count,
+                s.min_cloud_cover, s.max_cloud_cover,
+                s.min_x AS summary_min_x, s.min_y AS summary_min_y,
+                s.max_x AS summary_max_x, s.max_y AS summary_max_y,
+                s.start_date AS summary_start_date, s.end_date AS summary_end_date
+            FROM stac_collection sc
+            LEFT JOIN stac_collection_summary s
+            ON sc.id = s.collection
+            {sc_where};
+        '''
+    else:
+        query = f'''
+            SELECT *
+            FROM stac_collection sc
+            LEFT JOIN (
+                SELECT collection, assets
+                FROM `stac_item`
+                {si_where}
+                GROUP BY collection
+            ) si
+            ON sc.id = si.collection
+            {sc_where};
+        '''
 
-    logging.info(f'get_collections - query: {query}')
+    sql_logger.info('get_collections - query: %s', query)
 
     result, elapsed_time = do_query(query, **kwargs)
 
-    logging.info(f'get_collections - elapsed_time - query: {timedelta(seconds=elapsed_time)}')
+    sql_logger.info('get_collections - elapsed_time - query: %s', timedelta(seconds=elapsed_time))
 
-    logging.info(f'get_collections - len(result): {len_result(result)}')
+    logging.info('get_collections - len(result): %s', len_result(result))
     # logging.debug(f'get_collections - result: {result}')
 
+    __collections_cache.set(('rows', collection_id, version), result)
+
     return result
 
 
+def __get_keyset_where(position, prefix, with_collection=True):
+    """
+    Returns a WHERE clause that seeks the rows after `position`, using the (collection, date, id) order.
+    The clause is written with ORs instead of a row constructor, then MySQL can use a range on the index.
+    """
+
+    params = {}
+    seek = f'(date > :{prefix}date OR (date = :{prefix}date AND id > :{prefix}id))'
+
+    if with_collection:
+        params[f'{prefix}collection'], params[f'{prefix}date'], params[f'{prefix}id'] = position
+        seek = f'(collection > :{prefix}collection OR (collection = :{prefix}collection AND {seek}))'
+    else:
+        params[f'{prefix}date'], params[f'{prefix}id'] = position
+
+    return seek, params
+
+
+def __get_count_queries(where, params, count):
+    """
+    Returns the queries (`(sql, params)` tuples) that count the rows of each collection that match `where`,
+    based on the `count` strategy, and the key of their result in the count cache, if it is cached:
+        - 'exact': counts all the rows;
+        - 'estimated': uses the number of rows estimated by the query plan (EXPLAIN) of each collection;
+        - 'capped': counts up to `INPE_STAC_COUNT_CAP` rows of each collection;
+        - 'cached': counts all the rows, but saves the result during `INPE_STAC_COUNT_CACHE_TTL` seconds;
+        - 'off': does not count the rows.
+    """
+
+    if count == 'off':
+        return [], None
+
+    # just the parameters used by the WHERE clause change the number of rows
+    count_params = {name: params[name] for name in findall(r':(\w+)', where) if name in params}
+
+    if count == 'estimated':
+        sql_count = f'''
+            EXPLAIN
+            SELECT id
+            FROM stac_item
+            WHERE
+                {where};
+        '''
+
+        # if the user is looking for collections, then I estimate each one of them
+        if 'collections' in count_params:
+            return [
+                (sql_count, {**count_params, 'collections': [collection]})
+                for collection in count_params['collections']
+            ], None
+
+        return [(sql_count, count_params)], None
+
+    if count == 'capped':
+        sql_count = f'''
+            SELECT collection, COUNT(id) as matched
+            FROM (
+                SELECT collection, id
+                FROM stac_item
+                WHERE
+                    {where}
+                LIMIT :count_cap
+            ) t
+            GROUP BY collection;
+        '''
+
+        count_params['count_cap'] = INPE_STAC_COUNT_CAP
+
+        # the cap is applied to each collection, then its `matched` does not depend on the rows read first
+        if 'collections' in count_params:
+            return [
+                (sql_count, {**count_params, 'collections': [collection]})
+                for collection in count_params['collections']
+            ], None
+
+    else:
+        # add just where clause to query, because I want to get the number of total results
+        sql_count = f'''
+            SELECT collection, COUNT(id) as matched
+            FROM stac_item
+            WHERE
+                {where}
+            GROUP BY collection;
+        '''
+
+    key = None
+
+    if count == 'cached':
+        # lists are not hashable, then I convert them to tuples
+        key = (where, tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value) for name, value in count_params.items()
+        )))
+
+    return [(sql_count, count_params)], key
+
+
+def __make_result_count(count, queries, results):
+    """Returns the number of rows of each collection from the `results` of the count `queries`."""
+
+    if count != 'estimated':
+        # the capped count of several collections runs one query per collection
+        if len(results) > 1:
+            return [row for result in results for row in result or []]
+
+        return results[0]
+
+    result_count = []
+
+    for (_, count_params), plan in zip(queries, results):
+        # the number of rows that will be read times the percentage of them that will be filtered by the condition
+        matched = int(plan[0]['rows'] * (plan[0].get('filtered') or 100) / 100) if plan else 0
+
+        collections = count_params.get('collections')
+
+        result_count.append({'collection': collections[0] if collections else None, 'matched': matched})
+
+    return result_count
+
+
+def __get_cached_count(key):
+    if key is None:
+        return None
+
+    result_count = __count_cache.get(key)
+
+    if result_count is not None:
+        logging.info('__get_cached_count - the count has been found in the cache')
+        # return a copy, because the caller changes the list
+        return list(result_count)
+
+    return None
+
+
+def __set_cached_count(key, result_count):
+    if key is not None:
+        __count_cache.set(key, list(result_count or []))
+
+
 @log_function_header
-def __search_stac_item_view(where, params):
-    logging.info('__search_stac_item_view')
+def __count_stac_item_view(where, params, count):
+    """Returns the number of rows of each collection that match `where`, based on the `count` strategy."""
+
+    logging.info('__count_stac_item_view - count: %s', count)
+
+    queries, key = __get_count_queries(where, params, count)
+
+    if not queries:
+        return None
+
+    result_count = __get_cached_count(key)
+
+    if result_count is not None:
+        return result_count
+
+    results = []
+
+    for sql_count, count_params in queries:
+        sql_logger.info('__count_stac_item_view - sql_count: %s', sql_count)
+
+        result, elapsed_time = do_query(sql_count, **count_params)
+        sql_logger.info('__count_stac_item_view - elapsed_time - sql_count: %s', timedelta(seconds=elapsed_time))
+
+        results.append(result)
+
+    result_count = __make_result_count(count, queries, results)
+
+    __set_cached_count(key, result_count)
+
+    return result_count
+
+
+def __get_collection_subqueries(where, params, keyset=None, columns='*'):
+    """
+    Returns the page query of each collection of the search as `(collection, sql)` tuples. Each one of them reads
+    its rows in the order of the (collection, date, id) index and stops at the end of the page, then its cost depends
+    on the size of the page instead of on the number of matched rows. `params` receives the parameters of the queries.
+    The queries read the `columns` of `stac_item` (a SELECT list).
+    """
+
+    subqueries = []
+
+    for index, collection in enumerate(params['collections']):
+        params[f'next_collection_{index}'] = collection
+        seek = ''
+        limit = 'LIMIT :offset, :limit'
+
+        # each collection is paginated independently, then I seek each one of them by its own last key
+        if keyset is not None:
+            limit = 'LIMIT :limit'
+
+            if collection in keyset:
+                # if the collection has been exhausted in the previous page, then I skip it
+                if keyset[collection] is None:
+                    continue
+
+                seek, seek_params = __get_keyset_where(keyset[collection], f'next_{index}_', with_collection=False)
+                seek = f'AND {seek}'
+                params.update(seek_params)
+
+        subqueries.append((collection, f'''
+                SELECT {columns}
+                FROM stac_item
+                WHERE
+                    {where}
+                    AND collection = :next_collection_{index}
+                    {seek}
+                ORDER BY date, id
+                {limit}
+            '''))
+
+    return subqueries
+
+
+def __get_search_sql(where, params, keyset=None, columns='*'):
+    """
+    Returns the WHERE clause created from the `where` list and the query that searches the page.
+    The query is None when there is not a page to search. `params` receives the parameters of the query.
+    The query reads the `columns` of `stac_item` (a SELECT list, e.g. the columns of the `fields` extension).
+    """
 
     insert_deleted_flag_to_where(where)
 
     # create the WHERE clause
     where = '\nAND '.join(where)
 
+    # if there is a `next` token or the search fans out, then each collection is searched by its own query
+    if 'collections' in params and (keyset is not None or INPE_STAC_COLLECTIONS_SEARCH == 'fanout'):
+        subqueries = __get_collection_subqueries(where, params, keyset, columns)
+
+        sql = None
+
+        if subqueries:
+            # each page is a derived table, because a parenthesized query with LIMIT is not portable (e.g. SQLite)
+            sql = '\nUNION ALL\n'.join(
+                f'SELECT * FROM ({subquery}) page_{index}' for index, (_, subquery) in enumerate(subqueries)
+            ) + '\nORDER BY collection, date, id;'
+
+    elif keyset is not None:
+        seek, seek_params = __get_keyset_where(keyset, 'next_')
+        params.update(seek_params)
+
+        sql = f'''
+            SELECT {columns}
+            FROM stac_item
+            WHERE
+                {where}
+                AND {seek}
+            ORDER BY collection, date, id
+            LIMIT :limit
+        '''
+
     # if the user is looking for more than one collection, then I search by partition
-    if 'collections' in params:
+    elif 'collections' in params:
+        # it numbers all the matched rows of each collection before skipping the previous pages
         sql = f'''
             SELECT *
             FROM (
-                SELECT *, row_number() over (partition by collection) rn
+                SELECT {columns}, row_number() over (partition by collection order by date, id) rn
                 FROM stac_item
                 WHERE
                     {where}
             ) t
-            WHERE rn >= :first_index AND rn <= :last_index;
+            WHERE rn > :first_index AND rn <= :last_index
+            ORDER BY collection, date, id;
         '''
         # create the first and last index
         params['first_index'] = params['offset']
@@ -94,67 +685,396 @@ def __search_stac_item_view(where, params):
     # else, I search with a normal query
     else:
         sql = f'''
-            SELECT *
+            SELECT {columns}
             FROM stac_item
             WHERE
                 {where}
+            ORDER BY collection, date, id
             LIMIT :offset, :limit
         '''
 
-    # add just where clause to query, because I want to get the number of total results
-    sql_count = f'''
-        SELECT collection, COUNT(id) as matched
+    return where, sql
+
+
+def __fill_result_count(result_count, params, count):
+    # if `result_count` is None, then I return an empty list instead
+    if result_count is None:
+        result_count = []
+
+    if 'collections' in params:
+        for collection in params['collections']:
+            if not any(d['collection'] == collection for d in result_count):
+                result_count.append(
+                    # if the count is off, then the collection has not been counted
+                    {'collection': collection, 'matched': None if count == 'off' else 0}
+                )
+
+        result_count = sorted(result_count, key=lambda key: key['collection'])
+
+    return result_count
+
+
+def __search_ids_in_chunks(where, params, keyset=None, count='exact', columns='*'):
+    """
+    It works like `__search_stac_item_view`, but the `ids` are searched in chunks of `INPE_STAC_IDS_CHUNK_SIZE` ids,
+    then MySQL does not receive a huge `IN` list. Each chunk returns its rows up to the end of the page, because
+    any one of them may be in the page, and the page is sliced from the merged rows. The ids are unique,
+    then the number of rows of each collection is the sum of the counts of the chunks.
+    """
+
+    where, sql = __get_search_sql(where, params, keyset, columns)
+
+    ids = params['ids']
+    chunks = []
+
+    for start in range(0, len(ids), INPE_STAC_IDS_CHUNK_SIZE):
+        chunk_params = {**params, 'ids': ids[start:start + INPE_STAC_IDS_CHUNK_SIZE]}
+
+        # a keyset page is sought by its last key, then it does not skip rows
+        if keyset is None:
+            chunk_params['offset'], chunk_params['limit'] = 0, params['offset'] + params['limit']
+
+        chunks.append(chunk_params)
+
+    logging.info('__search_ids_in_chunks - ids: %s - chunks: %s', len(ids), len(chunks))
+
+    results = do_concurrently(
+        *[lambda p=chunk_params: __count_stac_item_view(where, p, count) for chunk_params in chunks],
+        *[lambda p=chunk_params: do_query(sql, **p)[0] for chunk_params in chunks]
+    )
+
+    count_results, page_results = results[:len(chunks)], results[len(chunks):]
+
+    record('count', max(elapsed_time for _, elapsed_time in count_results))
+    record('page', max(elapsed_time for _, elapsed_time in page_results))
+
+    result_count = None
+
+    if count != 'off':
+        matched = OrderedDict()
+
+        for chunk_count, _ in count_results:
+            for d in chunk_count or []:
+                matched[d['collection']] = matched.get(d['collection'], 0) + d['matched']
+
+        result_count = [{'collection': collection, 'matched': m} for collection, m in matched.items()]
+
+    rows = sorted(
+        (i for result, _ in page_results for i in result or []),
+        key=lambda i: (i['collection'], i['date'], i['id'])
+    )
+
+    offset = 0 if keyset is not None else params['offset']
+    result = rows[offset:offset + params['limit']]
+
+    logging.info('__search_ids_in_chunks - returned: %s', len(result))
+
+    return result, __fill_result_count(result_count, params, count)
+
+
+def __search_collections_fanout(where, params, keyset=None, count='exact', columns='*'):
+    """
+    It works like `__search_stac_item_view` for a search by collections, but the page and the count of each collection
+    are separate queries, which run at the same time in pooled connections, and their results are merged.
+    """
+
+    where, _ = __get_search_sql(where, params, keyset)
+
+    subqueries = __get_collection_subqueries(where, params, keyset, columns)
+    collections = params['collections']
+
+    logging.info('__search_collections_fanout - collections: %s - pages: %s', len(collections), len(subqueries))
+
+    results = do_concurrently(
+        *[lambda c=collection: __count_stac_item_view(where, {**params, 'collections': [c]}, count)
+          for collection in collections],
+        *[lambda sql=subquery: do_query(sql, **params)[0] for _, subquery in subqueries]
+    )
+
+    count_results, page_results = results[:len(collections)], results[len(collections):]
+
+    record('count', max(elapsed_time for _, elapsed_time in count_results))
+    record('page', max((elapsed_time for _, elapsed_time in page_results), default=0))
+
+    result_count = None
+
+    if count != 'off':
+        result_count = [d for collection_count, _ in count_results for d in collection_count or []]
+
+    # the rows are sorted by (collection, date, id), as the rows of a single query
+    pages = sorted(zip((collection for collection, _ in subqueries), page_results), key=lambda page: page[0])
+    result = [i for _, (rows, _) in pages for i in rows or []]
+
+    logging.info('__search_collections_fanout - returned: %s', len(result))
+
+    return result, __fill_result_count(result_count, params, count)
+
+
+def __select_candidates_page(keys, params, keyset=None):
+    """
+    Returns the keys of the page from the `keys` of the candidates, which are sorted by (collection, date, id).
+    A search by collections paginates each collection independently, as `__get_collection_subqueries`.
+    """
+
+    offset, limit = (0, params['limit']) if keyset is not None else (params['offset'], params['limit'])
+
+    if 'collections' not in params:
+        if keyset is not None:
+            position = tuple(keyset)
+            keys = [key for key in keys if key > position]
+
+        return keys[offset:offset + limit]
+
+    page = []
+
+    for collection in params['collections']:
+        collection_keys = [key for key in keys if key[0] == collection]
+
+        if keyset is not None and collection in keyset:
+            # if the collection has been exhausted in the previous page, then I skip it
+            if keyset[collection] is None:
+                continue
+
+            position = tuple(keyset[collection])
+            collection_keys = [key for key in collection_keys if key[1:] > position]
+
+        page.extend(collection_keys[offset:offset + limit])
+
+    return page
+
+
+def __get_candidates_sql(where):
+    """Returns the query that reads the keys of the footprint candidates (`footprint_ids`) that match `where`."""
+
+    insert_deleted_flag_to_where(where)
+
+    where = '\nAND '.join(where)
+
+    return f'''
+        SELECT collection, date, id
         FROM stac_item
         WHERE
             {where}
-        GROUP BY collection;
     '''
 
+
+def __page_candidates(candidates, params, keyset=None, count='exact'):
+    """
+    Returns the keys of the page and the count of each collection from the rows of the candidates query.
+    The candidates are a few thousand at most, then they are counted and paginated in memory.
+    """
+
+    # the dates are compared as the strings of the `next` token
+    keys = sorted((i['collection'], str(i['date']), i['id']) for i in candidates or [])
+
+    result_count = None
+
+    if count != 'off':
+        matched = OrderedDict()
+
+        for collection, _, _ in keys:
+            matched[collection] = matched.get(collection, 0) + 1
+
+        if count == 'capped':
+            matched = OrderedDict((collection, min(m, INPE_STAC_COUNT_CAP)) for collection, m in matched.items())
+
+        result_count = [{'collection': collection, 'matched': m} for collection, m in matched.items()]
+
+    page = __select_candidates_page(keys, params, keyset)
+
+    logging.info('__page_candidates - matched: %s - page: %s', len(keys), len(page))
+
+    return page, __fill_result_count(result_count, params, count)
+
+
+def __get_page_by_keys_sql(page, columns='*'):
+    """Returns the query that reads the rows of the `page` keys by primary key, and its parameters."""
+
+    if not page:
+        return None, {}
+
+    return f'SELECT {columns} FROM stac_item WHERE id IN :page_ids', {'page_ids': [key[2] for key in page]}
+
+
+def __sort_page(page, rows):
+    """Returns the `rows` in the order of the `page` keys."""
+
+    rows_by_id = {i['id']: i for i in rows or []}
+
+    return [rows_by_id[key[2]] for key in page if key[2] in rows_by_id]
+
+
+def __search_footprint_candidates(where, params, keyset=None, count='exact', columns='*'):
+    """
+    It works like `__search_stac_item_view` when the in-memory footprint index has answered the bbox.
+    The keys of the candidates that match the other filters are read by primary key, the matched rows
+    are counted and paginated from them instead of by a COUNT query and a sorted scan, and the rows of
+    the page are read by primary key too.
+    """
+
+    sql = __get_candidates_sql(where)
+
+    candidates, candidates_elapsed_time = __timed(lambda: do_query(sql, **params)[0])
+    record('count', candidates_elapsed_time)
+
+    page, result_count = __page_candidates(candidates, params, keyset, count)
+
+    page_sql, page_params = __get_page_by_keys_sql(page, columns)
+
+    result = []
+
+    if page_sql is not None:
+        rows, page_elapsed_time = __timed(lambda: do_query(page_sql, **page_params)[0])
+        record('page', page_elapsed_time)
+
+        result = __sort_page(page, rows)
+
+    logging.info('__search_footprint_candidates - returned: %s', len(result))
+
+    return result, result_count
+
+
+@log_function_header
+def __search_stac_item_view(where, params, keyset=None, count='exact', columns='*'):
+    logging.info('__search_stac_item_view')
+
+    if 'footprint_ids' in params:
+        return __search_footprint_candidates(where, params, keyset, count, columns)
+
+    if 'collections' in params and INPE_STAC_COLLECTIONS_SEARCH == 'fanout':
+        return __search_collections_fanout(where, params, keyset, count, columns)
+
+    if len(params.get('ids') or ()) > INPE_STAC_IDS_CHUNK_SIZE:
+        return __search_ids_in_chunks(where, params, keyset, count, columns)
+
+    where, sql = __get_search_sql(where, params, keyset, columns)
+
     # logging.info(f'__search_stac_item_view - where: {where}')
-    logging.info(f'__search_stac_item_view - params: {params}')
+    sql_logger.info('__search_stac_item_view - params: %s', params)
+    sql_logger.info('__search_stac_item_view - sql: %s', sql)
 
-    logging.info(f'__search_stac_item_view - sql_count: {sql_count}')
-    logging.info(f'__search_stac_item_view - sql: {sql}')
+    # execute the queries at the same time, each one of them in its own pooled connection
+    calls = [lambda: __count_stac_item_view(where, params, count)]
 
-    # execute the queries
-    result_count, elapsed_time = do_query(sql_count, **params)
-    logging.info(f'__search_stac_item_view - elapsed_time - sql_count: {timedelta(seconds=elapsed_time)}')
+    # if all collections have been exhausted, then there is not a page to search
+    if sql is not None:
+        calls.append(lambda: do_query(sql, **params)[0])
 
-    result, elapsed_time = do_query(sql, **params)
-    logging.info(f'__search_stac_item_view - elapsed_time - sql: {timedelta(seconds=elapsed_time)}')
+    start_time = time()
 
-    # if `result` or `result_count` is None, then I return an empty list instead
-    if result is None:
-        result = []
+    results = do_concurrently(*calls)
 
-    if result_count is None:
-        result_count = []
+    elapsed_time = time() - start_time
 
-    if 'collections' in params:
-        for collection in params['collections'].split(','):
-            if not any(d['collection'] == collection for d in result_count):
-                result_count.append(
-                    {'collection': collection, 'matched': 0}
-                )
+    result_count, count_elapsed_time = results[0]
+    result, sql_elapsed_time = results[1] if sql is not None else (None, 0)
 
-        result_count = sorted(result_count, key=lambda key: key['collection'])
+    record('count', count_elapsed_time)
+    record('page', sql_elapsed_time)
+
+    sql_logger.info('__search_stac_item_view - elapsed_time - sql_count: %s', timedelta(seconds=count_elapsed_time))
+    sql_logger.info('__search_stac_item_view - elapsed_time - sql: %s', timedelta(seconds=sql_elapsed_time))
+    # overlap is the time saved by running the queries at the same time instead of one after the other
+    sql_logger.info(
+        '__search_stac_item_view - elapsed_time - queries: %s (overlap: %s)', timedelta(seconds=elapsed_time),
+        timedelta(seconds=max(count_elapsed_time + sql_elapsed_time - elapsed_time, 0))
+    )
+
+    # if `result` is None, then I return an empty list instead
+    if result is None:
+        result = []
+
+    result_count = __fill_result_count(result_count, params, count)
 
     # logging.debug(f'__search_stac_item_view - result: \n{result}\n')
-    logging.info(f'__search_stac_item_view - returned: {len_result(result)}')
-    logging.info(f'__search_stac_item_view - result_count: {result_count}')
+    logging.info('__search_stac_item_view - returned: %s', len_result(result))
+    logging.info('__search_stac_item_view - result_count: %s', result_count)
 
     return result, result_count
 
 
 @log_function_header
-def get_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
-                         intersects=None, page=1, limit=10, ids=None, collections=None,
-                         query=None):
-    logging.info('get_collection_items()')
+def __stream_stac_item_view(where, params, keyset=None, count='exact', columns='*'):
+    """
+    Returns an iterator over the rows of the page, which are read from a server-side cursor, and a function
+    that waits for the count. The count runs in the shared thread pool while the rows are read.
+    """
 
-    result = []
-    metadata_related_to_collections = []
-    matched = 0
+    logging.info('__stream_stac_item_view')
+
+    # the page of the footprint candidates is read by primary key, then it is not worth streaming
+    if 'footprint_ids' in params:
+        result, result_count = __search_footprint_candidates(where, params, keyset, count, columns)
+
+        return iter(result), lambda: result_count
+
+    where, sql = __get_search_sql(where, params, keyset, columns)
+
+    sql_logger.info('__stream_stac_item_view - params: %s', params)
+    sql_logger.info('__stream_stac_item_view - sql: %s', sql)
+
+    wait_count = do_in_background(lambda: __count_stac_item_view(where, params, count))
+
+    # if all collections have been exhausted, then there is not a page to search
+    items = iter_query(sql, **params) if sql is not None else iter(())
+
+    def get_result_count():
+        result_count, elapsed_time = wait_count()
+        sql_logger.info('__stream_stac_item_view - elapsed_time - sql_count: %s', timedelta(seconds=elapsed_time))
+
+        record('count', elapsed_time)
+
+        return __fill_result_count(result_count, params, count)
+
+    return items, get_result_count
+
+
+def __get_keyset(token, key):
+    """Returns the keyset saved on `token` to the search type `key` ('k' or 'c')."""
+
+    if token is None:
+        return None
+
+    keyset = token.get(key)
+
+    if key == 'k':
+        is_valid = isinstance(keyset, list) and len(keyset) == 3
+    else:
+        is_valid = isinstance(keyset, dict) and all(
+            position is None or (isinstance(position, list) and len(position) == 2)
+            for position in keyset.values()
+        )
+
+    if not is_valid:
+        raise BadRequest('`next` token does not belong to this search')
+
+    return keyset
+
+
+def __get_search_type(collection_id=None, item_id=None, ids=None, collections=None):
+    """
+    Returns the type of a search, the same one returned by `__prepare_search`: 'k' if it searches by ids, even with
+    collections, because the ids filter has precedence, 'c' if it searches by collections, which are paginated
+    independently, or 'k' otherwise. The `next` token of a page must be created to the type of its search.
+    """
+
+    if item_id is not None or ids is not None:
+        return 'k'
+
+    if collection_id is not None or collections is not None:
+        return 'c'
+
+    return 'k'
+
+
+def __prepare_search(collection_id=None, item_id=None, bbox=None, time=None,
+                     intersects=None, page=1, limit=10, ids=None, collections=None,
+                     query=None):
+    """
+    Returns the list of conditions of the WHERE clause, the parameters of the search, the type
+    of the search: 'c' if it searches by collections, which are paginated independently, or 'k' otherwise,
+    and the non-sargable filters if none of the conditions can use an index (i.e. it is a full scan), else None.
+    """
 
     params = {
         'offset': calc_offset(page, limit),
@@ -162,8 +1082,10 @@ def get_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
     }
 
     default_where = []
+    # the search can use an index if it filters by the collection, the footprint or an indexed field
+    indexed = False
 
-    logging.info(f'get_collection_items() - params: {params}')
+    sql_logger.info('__prepare_search() - params: %s', params)
 
     # search for ids
     if item_id is not None or ids is not None:
@@ -171,21 +1093,26 @@ def get_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
             default_where.append('id = :item_id')
             params['item_id'] = item_id
         elif ids is not None:
-            default_where.append('FIND_IN_SET(id, :ids)')
-            params['ids'] = ids
-
-        logging.info(f'get_collection_items() - default_where: {default_where}')
+            # an expanding parameter, i.e. `id IN (...)`, which MySQL seeks by the primary key
+            default_where.append('id IN :ids')
+            params['ids'] = ids.split(',') if isinstance(ids, str) else list(ids)
 
-        __result, __matched = __search_stac_item_view(default_where, params)
+        sql_logger.info('__prepare_search() - default_where: %s', default_where)
 
-        result += __result
-        matched += reduce(lambda x, y: x + y['matched'], __matched, 0) if __matched else 0
+        return default_where, params, 'k', None
 
-    else:
-        if bbox is not None:
-            try:
-                params['min_x'], params['min_y'], params['max_x'], params['max_y'] = bbox
+    if bbox is not None:
+        try:
+            params['min_x'], params['min_y'], params['max_x'], params['max_y'] = bbox
 
+            # if `stac_item` has the `footprint` column, then the SPATIAL index finds the intersected items
+            if INPE_STAC_BBOX_MODE == 'footprint':
+                indexed = True
+                default_where.append(
+                    'MBRIntersects(footprint, ST_Envelope(LineString(Point(:min_x, :min_y), Point(:max_x, :max_y))))'
+                )
+            # else, I compare the corners of the items, but it scans the whole table
+            else:
                 # replace method removes extra espace caused by multi-line String
                 default_where.append(
                     '''(
@@ -196,124 +1123,588 @@ def get_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
                     ((:max_x >= bl_longitude and :max_y >= bl_latitude)
                     or
                     (:max_x >= tl_longitude and :max_y >= br_latitude))
-                    )'''.replace('                ', '')
+                    )'''.replace('                    ', '')
                 )
-            except:
-                raise (InvalidBoundingBoxError())
-
-        if time is not None:
-            if not (isinstance(time, str) or isinstance(time, list)):
-                raise BadRequest('`time` field is not a string or list')
-
-            # if time is a string, then I convert it to list by splitting it
-            if isinstance(time, str):
-                time = time.split('/')
-
-            # if there is time_start and time_end, then get them
-            if len(time) == 2:
-                params['time_start'], params['time_end'] = time
-                default_where.append('date <= :time_end')
-            # if there is just time_start, then get it
-            elif len(time) == 1:
-                params['time_start'] = time[0]
-
-            default_where.append('date >= :time_start')
-
-        logging.info(f'get_collection_items() - default_where: {default_where}')
-
-        # if query is a dict, then get all available fields to search
-        # Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/api-spec/extensions/query/README.md
-        if isinstance(query, dict):
-            for field, value in query.items():
-                # eq, neq, lt, lte, gt, gte
-                if 'eq' in value:
-                    default_where.append(f'{field} = {value["eq"]}')
-                if 'neq' in value:
-                    default_where.append(f'{field} != {value["neq"]}')
-                if 'lt' in value:
-                    default_where.append(f'{field} < {value["lt"]}')
-                if 'lte' in value:
-                    default_where.append(f'{field} <= {value["lte"]}')
-                if 'gt' in value:
-                    default_where.append(f'{field} > {value["gt"]}')
-                if 'gte' in value:
-                    default_where.append(f'{field} >= {value["gte"]}')
-                # startsWith, endsWith, contains
-                if 'startsWith' in value:
-                    default_where.append(f'{field} LIKE \'{value["startsWith"]}%\'')
-                if 'endsWith' in value:
-                    default_where.append(f'{field} LIKE \'%{value["endsWith"]}\'')
-                if 'contains' in value:
-                    default_where.append(f'{field} LIKE \'%{value["contains"]}%\'')
-
-        if collection_id is not None and isinstance(collection_id, str):
-            collections = [collection_id]
-
-        # search for collections
-        if collections is not None:
-            logging.info(f'get_collection_items() - collections: {collections}')
-
-            # append the query at the beginning of the list
-            default_where.insert(0, 'FIND_IN_SET(collection, :collections)')
-            params['collections'] = ','.join(collections)
-
-            __result, __matched = __search_stac_item_view(default_where, params)
-
-            result += __result
-            # sum all `matched` keys from the `__matched` list. initialize the first `x` with `0`
-            # source: https://stackoverflow.com/a/42453184
-            matched += reduce(lambda x, y: x + y['matched'], __matched, 0) if __matched else 0
-
-            metadata_related_to_collections = [
-                {
-                    'name': d['collection'],
-                    'context': {
-                        'page': page,
-                        'limit': limit,
-                        'matched': d['matched'],
-                        # count just the results related to the selected collection
-                        'returned': len(list(filter(
-                            lambda x: x['collection'] == d['collection'],
-                            result
-                        )))
-                    }
-                # d - dictionary
-                } for d in __matched
-            ]
-
-        # search for anything else
-        else:
-            __result, __matched = __search_stac_item_view(default_where, params)
+        except:
+            raise (InvalidBoundingBoxError())
+
+        # if the in-memory footprint index is ready, then the items are fetched by primary key
+        footprint_index = get_footprint_index() if INPE_STAC_FOOTPRINT_INDEX else None
+
+        if footprint_index is not None:
+            footprint_ids = footprint_index.query(
+                params['min_x'], params['min_y'], params['max_x'], params['max_y']
+            )
+
+            logging.info('__prepare_search() - footprint index candidates: %s', len(footprint_ids))
+
+            # if the bbox is too large, then it is better to let MySQL scan the table
+            if len(footprint_ids) <= INPE_STAC_FOOTPRINT_INDEX_MAX_CANDIDATES:
+                indexed = True
+                default_where.append('id IN :footprint_ids')
+                params['footprint_ids'] = footprint_ids
+
+    if time is not None:
+        if not (isinstance(time, str) or isinstance(time, list)):
+            raise BadRequest('`time` field is not a string or list')
+
+        # if time is a string, then I convert it to list by splitting it
+        if isinstance(time, str):
+            time = time.split('/')
+
+        # if there is time_start and time_end, then get them
+        if len(time) == 2:
+            params['time_start'], params['time_end'] = time
+            default_where.append('date <= :time_end')
+        # if there is just time_start, then get it
+        elif len(time) == 1:
+            params['time_start'] = time[0]
+
+        default_where.append('date >= :time_start')
+
+    sql_logger.info('__prepare_search() - default_where: %s', default_where)
+
+    non_sargable = []
+
+    # the `query` extension is compiled to conditions with bound parameters
+    # Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/api-spec/extensions/query/README.md
+    if query is not None:
+        query_where, query_params, query_indexed, non_sargable = compile_query(query)
+
+        default_where.extend(query_where)
+        params.update(query_params)
+        indexed = indexed or query_indexed
+
+        if non_sargable:
+            logging.info('__prepare_search() - non-sargable filters: %s', non_sargable)
+
+    if collection_id is not None and isinstance(collection_id, str):
+        collections = [collection_id]
+
+    # search for collections
+    if collections is not None:
+        logging.info('__prepare_search() - collections: %s', collections)
+
+        # append the query at the beginning of the list
+        default_where.insert(0, 'collection IN :collections')
+        params['collections'] = list(collections)
+
+        return default_where, params, 'c', None
+
+    # search for anything else
+    return default_where, params, 'k', None if indexed else non_sargable
+
+
+def __guard_full_scan(full_scan, count):
+    """
+    Returns the count strategy of a search based on `INPE_STAC_FULL_SCAN_POLICY`. If the search can only run
+    as a full scan (`full_scan` is the list of its non-sargable filters), then it may be capped or rejected.
+    """
+
+    if full_scan is None or INPE_STAC_FULL_SCAN_POLICY == 'allow':
+        return count
+
+    if INPE_STAC_FULL_SCAN_POLICY == 'reject':
+        message = 'The search can only run as a full scan, then it must filter by `collections`, `ids` ' \
+                  'or an indexed `query` field'
+
+        if full_scan:
+            message += f' (the following filters can not use an index: {", ".join(full_scan)})'
+
+        raise BadRequest(message)
+
+    # 'cap': the page stops at its last row, but an exact count reads all the rows of the table
+    logging.info('__guard_full_scan - the search is a full scan, then its count is capped')
+
+    return 'capped' if count in ('exact', 'cached') else count
+
+
+def guard_full_scan(params):
+    """
+    Returns the count strategy of the search of `params` (the parameters of `get_collection_items`) based on
+    `INPE_STAC_FULL_SCAN_POLICY`, in order to report the used strategy, or raises BadRequest if it is rejected.
+    """
+
+    if INPE_STAC_FULL_SCAN_POLICY == 'allow':
+        return params['count']
+
+    search_params = ('collection_id', 'item_id', 'bbox', 'time', 'ids', 'collections', 'query')
+
+    _, _, _, full_scan = __prepare_search(**{name: params[name] for name in search_params if name in params})
+
+    return __guard_full_scan(full_scan, params['count'])
+
+
+def __make_metadata_related_to_collections(result_count, returned_rows, page, limit):
+    return [
+        {
+            'name': d['collection'],
+            'context': __make_context(
+                page, limit, d['matched'],
+                # count just the results related to the selected collection
+                len(list(filter(
+                    lambda x: x['collection'] == d['collection'],
+                    returned_rows
+                )))
+            )
+        # d - dictionary
+        } for d in result_count
+    ]
+
+
+def __sum_matched(result_count, count):
+    # if the count is off, then there is not a `matched` property
+    if count == 'off':
+        return None
+
+    # sum all `matched` keys from the `result_count` list. initialize the first `x` with `0`
+    # source: https://stackoverflow.com/a/42453184
+    return reduce(lambda x, y: x + (y['matched'] or 0), result_count, 0) if result_count else 0
+
+
+def __get_columns(fields):
+    """Returns the SELECT list of the columns of `stac_item` that create the fields chosen by `fields`."""
+
+    fields = parse_fields(fields)
+
+    return fields.columns if fields is not None else '*'
+
+
+@log_function_header
+def get_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
+                         intersects=None, page=1, limit=10, ids=None, collections=None,
+                         query=None, next=None, count='exact', fields=None):
+    logging.info('get_collection_items()')
+
+    if count not in COUNT_MODES:
+        raise BadRequest(f'`count` field must be one of the following values: {", ".join(COUNT_MODES)}')
+
+    metadata_related_to_collections = []
+
+    # `next` is an opaque token with the last key of the previous page, if it exists, `page` is ignored
+    token = decode_next_token(next) if next is not None else None
+
+    default_where, params, search_type, full_scan = __prepare_search(
+        collection_id=collection_id, item_id=item_id, bbox=bbox, time=time, intersects=intersects,
+        page=page, limit=limit, ids=ids, collections=collections, query=query
+    )
+
+    count = __guard_full_scan(full_scan, count)
+
+    result, result_count = __search_stac_item_view(
+        default_where, params, __get_keyset(token, search_type), count, __get_columns(fields)
+    )
+
+    # the features with chosen fields are created from their columns
+    if fields is None:
+        __attach_features(result)
+
+    matched = __sum_matched(result_count, count)
+
+    if search_type == 'c':
+        metadata_related_to_collections = __make_metadata_related_to_collections(
+            result_count, result, page, limit
+        )
+
+    logging.info('get_collection_items() - matched: %s', matched)
+    # logging.debug(f'get_collection_items() - result: \n{result}\n')
+    logging.debug('get_collection_items() - metadata: %s', metadata_related_to_collections)
+
+    return result, matched, metadata_related_to_collections
+
+
+@log_function_header
+def stream_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
+                            intersects=None, page=1, limit=10, ids=None, collections=None,
+                            query=None, next=None, count='exact', fields=None):
+    """
+    It works like `get_collection_items`, but it returns an iterator over the rows, which are read from
+    the database while they are consumed, and a function that receives the returned rows and returns
+    `matched` and the metadata related to collections.
+    """
+
+    logging.info('stream_collection_items()')
+
+    if count not in COUNT_MODES:
+        raise BadRequest(f'`count` field must be one of the following values: {", ".join(COUNT_MODES)}')
+
+    token = decode_next_token(next) if next is not None else None
+
+    default_where, params, search_type, full_scan = __prepare_search(
+        collection_id=collection_id, item_id=item_id, bbox=bbox, time=time, intersects=intersects,
+        page=page, limit=limit, ids=ids, collections=collections, query=query
+    )
+
+    count = __guard_full_scan(full_scan, count)
+
+    items, get_result_count = __stream_stac_item_view(
+        default_where, params, __get_keyset(token, search_type), count, __get_columns(fields)
+    )
+
+    if INPE_STAC_PRERENDERED_FEATURES and fields is None:
+        items = __iter_with_features(items)
+
+    def get_matched(returned_rows):
+        result_count = get_result_count()
+
+        metadata_related_to_collections = []
+
+        if search_type == 'c':
+            metadata_related_to_collections = __make_metadata_related_to_collections(
+                result_count, returned_rows, page, limit
+            )
+
+        return __sum_matched(result_count, count), metadata_related_to_collections
+
+    return items, get_matched
+
+
+def plan_collection_items(collection_id=None, item_id=None, bbox=None, time=None,
+                          intersects=None, page=1, limit=10, ids=None, collections=None,
+                          query=None, next=None, count='exact', fields=None):
+    """
+    Returns the plan of the search of `get_collection_items`, without executing it, in order to execute
+    its queries by another driver (e.g. the asynchronous one of `inpe_stac.data_async`). The plan is a dict
+    with the page query (`sql` and `params`, `sql` is None when there is not a page) and the count queries
+    (`count_queries`, a list of `(sql, params)` tuples, which is empty when the count is off or cached).
+    If `candidates` is set, then `sql` reads the keys of the footprint candidates instead of the page,
+    and `plan_candidates_page` and `finish_candidates_page` make the page from them.
+    After executing them, `finish_collection_items` receives their results. If `features` is True, then
+    the rendered features of the rows must be read by the query of `get_features_query` and attached to them.
+    """
+
+    logging.info('plan_collection_items()')
+
+    if count not in COUNT_MODES:
+        raise BadRequest(f'`count` field must be one of the following values: {", ".join(COUNT_MODES)}')
+
+    token = decode_next_token(next) if next is not None else None
+
+    default_where, params, search_type, full_scan = __prepare_search(
+        collection_id=collection_id, item_id=item_id, bbox=bbox, time=time, intersects=intersects,
+        page=page, limit=limit, ids=ids, collections=collections, query=query
+    )
+
+    count = __guard_full_scan(full_scan, count)
+
+    keyset = __get_keyset(token, search_type)
+
+    # the footprint candidates are counted and paginated from their keys, see `plan_candidates_page`
+    if 'footprint_ids' in params:
+        return {
+            'page': page,
+            'limit': limit,
+            'count': count,
+            'search_type': search_type,
+            'sql': __get_candidates_sql(default_where),
+            'params': params,
+            'count_queries': [],
+            'count_key': None,
+            'cached_count': None,
+            'features': INPE_STAC_PRERENDERED_FEATURES and fields is None,
+            'candidates': {'keyset': keyset, 'columns': __get_columns(fields)}
+        }
+
+    where, sql = __get_search_sql(default_where, params, keyset, __get_columns(fields))
+
+    count_queries, count_key = __get_count_queries(where, params, count)
+    cached_count = __get_cached_count(count_key)
+
+    return {
+        'page': page,
+        'limit': limit,
+        'count': count,
+        'search_type': search_type,
+        'sql': sql,
+        'params': params,
+        'count_queries': [] if cached_count is not None else count_queries,
+        'count_key': count_key,
+        'cached_count': cached_count,
+        'features': INPE_STAC_PRERENDERED_FEATURES and fields is None,
+        'candidates': None
+    }
+
+
+def plan_candidates_page(plan, candidates):
+    """
+    Returns the query that reads the rows of the page by primary key, and its parameters, from the rows of
+    the candidates query of a `plan` whose `candidates` is set (i.e. the in-memory footprint index has answered
+    the bbox). The query is None when the page is empty. The count of the plan is made from the candidates.
+    """
+
+    page, plan['cached_count'] = __page_candidates(
+        candidates, plan['params'], plan['candidates']['keyset'], plan['count']
+    )
+    plan['candidates']['page'] = page
+
+    return __get_page_by_keys_sql(page, plan['candidates']['columns'])
+
+
+def finish_candidates_page(plan, rows):
+    """Returns the rows of the page query of `plan_candidates_page` in the order of the page."""
+
+    return __sort_page(plan['candidates']['page'], rows)
+
+
+def finish_collection_items(plan, result, count_results):
+    """
+    Returns the same values of `get_collection_items` from the `plan` created by `plan_collection_items`,
+    the rows of its page query (`result`) and the results of its count queries (`count_results`).
+    """
+
+    count = plan['count']
+
+    if plan['count_queries']:
+        result_count = __make_result_count(count, plan['count_queries'], count_results)
+        __set_cached_count(plan['count_key'], result_count)
+    else:
+        result_count = plan['cached_count']
+
+    result = result or []
+    result_count = __fill_result_count(result_count, plan['params'], count)
+
+    metadata_related_to_collections = []
+
+    if plan['search_type'] == 'c':
+        metadata_related_to_collections = __make_metadata_related_to_collections(
+            result_count, result, plan['page'], plan['limit']
+        )
+
+    return result, __sum_matched(result_count, count), metadata_related_to_collections
+
+
+@log_function_header
+def export_collection_items(collection_id, bbox=None, time=None, query=None, after=None, fields=None):
+    """
+    Returns an iterator over all the rows of the collection that match the filters, sorted by (date, id).
+    The rows are read from a server-side cursor, without counting them or skipping rows by offset.
+    If `after` is an item id, then just the rows after this item are returned (e.g. to resume an export).
+    The rows just have the columns of the fields chosen by `fields` (the `fields` extension).
+    """
+
+    logging.info('export_collection_items()')
+
+    # an export reads a collection, then it is never a full scan
+    where, params, _, _ = __prepare_search(bbox=bbox, time=time, query=query)
+
+    # the whole collection is exported, then there is not a page
+    del params['offset']
+    del params['limit']
+
+    insert_deleted_flag_to_where(where)
+
+    where.insert(0, 'collection = :collection')
+    params['collection'] = collection_id
+
+    if after is not None:
+        result, _ = do_query(
+            'SELECT date FROM stac_item WHERE collection = :collection AND id = :id;',
+            collection=collection_id, id=after
+        )
+
+        if not result:
+            raise BadRequest('`after` field is not an item of the collection')
+
+        seek, seek_params = __get_keyset_where((result[0]['date'], after), 'after_', with_collection=False)
+        where.append(seek)
+        params.update(seek_params)
+
+    where = '\nAND '.join(where)
+
+    sql = f'''
+        SELECT {__get_columns(fields)}
+        FROM stac_item
+        WHERE
+            {where}
+        ORDER BY date, id;
+    '''
+
+    sql_logger.info('export_collection_items() - params: %s', params)
+    sql_logger.info('export_collection_items() - sql: %s', sql)
+
+    items = iter_query(sql, **params)
+
+    return __iter_with_features(items) if INPE_STAC_PRERENDERED_FEATURES and fields is None else items
+
+
+def __chunk_keys(keys):
+    """Returns the `keys` without the repeated ones, in chunks of `INPE_STAC_IDS_CHUNK_SIZE` keys."""
+
+    keys = list(OrderedDict.fromkeys(keys))
+
+    return [keys[start:start + INPE_STAC_IDS_CHUNK_SIZE] for start in range(0, len(keys), INPE_STAC_IDS_CHUNK_SIZE)]
+
+
+def __get_items_chunk(chunk, columns='*'):
+    """Returns the rows (with the `columns` of `stac_item`) of the `chunk` keys that exist, in the order of `chunk`."""
+
+    # `id` is the primary key, then the rows are sought by it and `collection` just discards the wrong pairs
+    where = ['id IN :ids', 'collection IN :collections']
+
+    insert_deleted_flag_to_where(where)
+
+    where = '\nAND '.join(where)
+
+    result, _ = do_query(f'''
+        SELECT {columns}
+        FROM stac_item
+        WHERE
+            {where};
+    ''', ids=[id for _, id in chunk], collections=sorted({collection for collection, _ in chunk}))
+
+    # the rendered features just replace the items with all their fields
+    if columns == '*':
+        __attach_features(result)
+
+    rows = {(i['collection'], i['id']): i for i in result or []}
+
+    return [rows[key] for key in chunk if key in rows]
+
+
+@log_function_header
+def get_items_by_keys(keys, fields=None):
+    """
+    Returns the rows of the items of `keys`, a list of (collection, id) pairs, in the same order and without the
+    missing and the repeated ones. The chunks of `INPE_STAC_IDS_CHUNK_SIZE` keys are read by the primary key
+    at the same time and the items are not counted. The rows just have the columns of the fields chosen by `fields`.
+    """
+
+    chunks = __chunk_keys(keys)
+    columns = __get_columns(fields)
+
+    logging.info('get_items_by_keys() - keys: %s - chunks: %s', len(keys), len(chunks))
+
+    if not chunks:
+        return []
+
+    results = do_concurrently(*[lambda c=chunk: __get_items_chunk(c, columns) for chunk in chunks])
+
+    record('page', max(elapsed_time for _, elapsed_time in results))
+
+    return [i for result, _ in results for i in result]
+
+
+def iter_items_by_keys(keys, fields=None):
+    """
+    It works like `get_items_by_keys`, but it yields the rows. The chunks are read one after the other,
+    and the next chunk is read in background while the rows of the current one are consumed.
+    """
+
+    chunks = __chunk_keys(keys)
+    columns = __get_columns(fields)
+
+    logging.info('iter_items_by_keys() - keys: %s - chunks: %s', len(keys), len(chunks))
+
+    wait = do_in_background(lambda: __get_items_chunk(chunks[0], columns)) if chunks else None
+
+    for index in range(len(chunks)):
+        result, elapsed_time = wait()
+
+        record('page', elapsed_time)
+
+        if index + 1 < len(chunks):
+            wait = do_in_background(lambda c=chunks[index + 1]: __get_items_chunk(c, columns))
+
+        yield from result
+
+
+def get_features_query(items):
+    """Returns the query (`sql` and `params`) that reads the rendered features of the `items` rows."""
+
+    sql = '''
+        SELECT collection, id, updated, feature
+        FROM stac_item_feature
+        WHERE
+            id IN :ids
+        AND collection IN :collections;
+    '''
+
+    return sql, {'ids': [i['id'] for i in items], 'collections': sorted({i['collection'] for i in items})}
+
+
+def attach_features(items, result):
+    """
+    Adds the rendered features of the `result` rows (read by the query of `get_features_query`) to the `items` rows,
+    as their `feature` key. A feature that has been rendered before its item has changed is not added.
+    """
+
+    features = {(f['collection'], f['id']): f for f in result or []}
+
+    for i in items:
+        feature = features.get((i['collection'], i['id']))
+
+        if feature is not None and feature['updated'] == i['updated']:
+            i['feature'] = feature['feature']
+
+
+def __attach_features(items):
+    """Adds the rendered features to the `items` rows, if `INPE_STAC_PRERENDERED_FEATURES` is enabled."""
+
+    if not INPE_STAC_PRERENDERED_FEATURES or not items:
+        return
+
+    sql, params = get_features_query(items)
+
+    result, elapsed_time = do_query(sql, **params)
 
-            result += __result
-            matched += reduce(lambda x, y: x + y['matched'], __matched, 0) if __matched else 0
+    record('rendered', elapsed_time)
 
-    logging.info(f'get_collection_items() - matched: {matched}')
-    # logging.debug(f'get_collection_items() - result: \n{result}\n')
-    logging.debug(f'get_collection_items() - metadata: {metadata_related_to_collections}')
+    attach_features(items, result)
 
-    return result, matched, metadata_related_to_collections
 
+def __iter_with_features(items):
+    """Yields the `items` rows with their rendered features, which are read for chunks of rows."""
+
+    chunk = []
+
+    for i in items:
+        chunk.append(i)
+
+        if len(chunk) == PRERENDERED_FEATURES_CHUNK_SIZE:
+            __attach_features(chunk)
+            yield from chunk
+            chunk = []
+
+    __attach_features(chunk)
+    yield from chunk
+
+
+def make_json_collection(collection_result, version=None):
+    """
+    Returns the STAC Collection related to `collection_result`, whose `version` is the one given to `get_collections`.
+    The result is cached, then it is shared by the requests and it must not be changed.
+    """
 
-def make_json_collection(collection_result):
     collection_id = collection_result['id']
 
-    start_date = collection_result['start_date'].isoformat()
-    end_date = None if collection_result['end_date'] is None else collection_result['end_date'].isoformat()
+    collection = __collections_cache.get(('json', collection_id, version))
 
-    eo_bands = []
+    if collection is not None:
+        return collection
 
-    # collection_result["assets"] is a string, then I convert it to a list with dictionaries
-    assets = loads(collection_result["assets"])
+    # if the collection does not have an extent, then I use the extent of its items from the summary table
+    extent = {
+        key: collection_result[key] if collection_result[key] is not None else collection_result.get(f'summary_{key}')
+        for key in ('min_x', 'min_y', 'max_x', 'max_y', 'start_date', 'end_date')
+    }
 
-    # I create the 'eo:bands' property based on 'assets'
-    for asset in assets:
-        eo_bands.append(
-            {
-                'name': asset['band'],
-                'common_name': asset['band']
-            }
-        )
+    start_date = extent['start_date'].isoformat()
+    end_date = None if extent['end_date'] is None else extent['end_date'].isoformat()
+
+    # if the row comes from the summary table, then `bands` is a string with the list of band names
+    if 'bands' in collection_result:
+        bands = loads(collection_result['bands'] or '[]')
+    # else, collection_result["assets"] is a string, then I convert it to a list with dictionaries
+    else:
+        bands = [asset['band'] for asset in loads(collection_result['assets'])]
+
+    # I create the 'eo:bands' property based on the bands
+    eo_bands = [
+        {
+            'name': band,
+            'common_name': band
+        } for band in bands
+    ]
 
     collection = {
         'stac_version': API_VERSION,
@@ -324,8 +1715,8 @@ def make_json_collection(collection_result):
         'license': None,
         'extent': {
             'spatial': [
-                collection_result['min_x'], collection_result['min_y'],
-                collection_result['max_x'], collection_result['max_y']
+                extent['min_x'], extent['min_y'],
+                extent['max_x'], extent['max_y']
             ],
             'temporal': [ start_date, end_date ]
         },
@@ -341,10 +1732,35 @@ def make_json_collection(collection_result):
         ]
     }
 
+    # the summary table has the range of the items cloud cover
+    # Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/collection-spec/collection-spec.md#summaries
+    if collection_result.get('min_cloud_cover') is not None:
+        collection['summaries'] = {
+            'eo:cloud_cover': {
+                'min': collection_result['min_cloud_cover'],
+                'max': collection_result['max_cloud_cover']
+            }
+        }
+
+    __collections_cache.set(('json', collection_id, version), collection)
+
     return collection
 
 
-def make_json_items(items, links, item_stac_extensions=None):
+def make_json_feature(i, links, item_stac_extensions=None):
+    """Returns the STAC Item (GeoJSON Feature) related to the `i` row of `stac_item`."""
+
+    return FeatureSerializer(links, item_stac_extensions, cache=__feature_cache).feature(i)
+
+
+def make_json_items(items, links, item_stac_extensions=None, fields=None, encoded=False):
+    """
+    Returns the ItemCollection (GeoJSON FeatureCollection) of the `items` rows. If `fields` (the `fields` extension)
+    is given, then the features just have the chosen fields. If `encoded` is True, then the features are
+    already encoded as JSON (e.g. from their rendered features) and `dumps_item_collection` encodes the
+    ItemCollection.
+    """
+
     # logging.debug(f'make_geojson - items: {items}')
     # logging.debug(f'make_geojson - links: {links}')
 
@@ -365,106 +1781,74 @@ def make_json_items(items, links, item_stac_extensions=None):
         gjson['features'] = features
         return gjson
 
+    # the links and bands templates are shared by all the items
+    serializer = FeatureSerializer(links, item_stac_extensions, cache=__feature_cache, fields=parse_fields(fields))
+    make_feature = serializer.encoded_feature if encoded else serializer.feature
+
+    start_time = perf_counter()
+
     for i in items:
         # logging.info('make_json_items - id: %s', i['id'])
         # logging.info('make_json_items - item:')
         # pp.pprint(i)
         # print('\n\n')
 
-        feature = OrderedDict()
-
-        feature['stac_version'] = API_VERSION
-        feature['stac_extensions'] = item_stac_extensions
-        feature['type'] = 'Feature'
-        feature['id'] = i['id']
-        feature['collection'] = i['collection']
-
-        geometry = dict()
-        geometry['type'] = 'Polygon'
-        geometry['coordinates'] = [
-          [[i['tl_longitude'], i['tl_latitude']],
-           [i['bl_longitude'], i['bl_latitude']],
-           [i['br_longitude'], i['br_latitude']],
-           [i['tr_longitude'], i['tr_latitude']],
-           [i['tl_longitude'], i['tl_latitude']]]
-        ]
-        feature['geometry'] = geometry
-        feature['bbox'] = bbox(feature['geometry']['coordinates'])
-
-        ##################################################
-        # properties
-        ##################################################
-
-        feature['properties'] = {
-            # format the datetime
-            'datetime': datetime.fromisoformat(str(i['datetime'] )).isoformat(),
-            'path': i['path'],
-            'row': i['row'],
-            'satellite': i['satellite'],
-            'sensor': i['sensor'],
-            'cloud_cover': i['cloud_cover'],
-            'sync_loss': i['sync_loss'],
-            'eo:gsd': -1
-            # 'eo:bands' is going to be added below
-        }
+        features.append(make_feature(i))
 
-        ##################################################
-        # assets
-        ##################################################
+    record('features', perf_counter() - start_time)
 
-        feature['assets'] = {}
-        eo_bands = []
+    gjson['features'] = features
 
-        # convert string json to dict json
-        i['assets'] = loads(i['assets'])
+    # logging.debug(f'make_geojson - gjson: {gjson}')
 
-        for asset in i['assets']:
-            eo_bands.append(
-                {
-                    'name': asset['band'],
-                    'common_name': asset['band']
-                }
-            )
+    return gjson
 
-            feature['assets'][asset['band']] = {
-                'href': getenv('TIF_ROOT') + asset['href'],
-                'type': 'image/tiff; application=geotiff',
-                # get index of the last added item
-                'eo:bands': [len(eo_bands) - 1]
-            }
-            feature['assets'][asset['band'] + '_xml'] = {
-                'href': getenv('TIF_ROOT') + asset['href'].replace('.tif', '.xml'),
-                'type': 'application/xml'
-            }
 
-        feature['assets']['thumbnail'] = {
-            'href': getenv('PNG_ROOT') + i['thumbnail'],
-            'type': 'image/png'
-        }
+def dumps_item_collection(item_collection):
+    """Returns the ItemCollection created by `make_json_items` with `encoded=True` as JSON bytes."""
 
-        # add eo:bands to properties
-        feature['properties']['eo:bands'] = eo_bands
+    features = item_collection['features']
 
-        ##################################################
-        # links
-        ##################################################
+    # the features are written inside the encoded envelope, `features` is its first list
+    body = dumps({**item_collection, 'features': []})
 
-        feature['links'] = deepcopy(links)
-        feature['links'][0]['href'] += i['collection'] + '/items/' + i['id']
-        feature['links'][1]['href'] += i['collection']
-        feature['links'][2]['href'] += i['collection']
+    return body.replace(b'"features":[]', b'"features":[' + b','.join(features) + b']', 1)
 
-        features.append(feature)
 
-        # print('\nfeature: ')
-        # pp.pprint(feature)
-        # print('\n')
+def __make_context(page, limit, matched, returned, count=None):
+    context = {
+        'page': page,
+        'limit': limit
+    }
 
-    gjson['features'] = features
+    # `matched` is optional, then it is not returned when the count is off
+    if matched is not None:
+        context['matched'] = matched
 
-    # logging.debug(f'make_geojson - gjson: {gjson}')
+    context['returned'] = returned
+
+    # report how `matched` has been computed
+    if count is not None:
+        context['matched_mode'] = count
+
+        if count == 'capped':
+            context['matched_cap'] = INPE_STAC_COUNT_CAP
+
+    return context
 
-    return gjson
+
+def make_json_context(params, matched, returned, meta=None):
+    """
+    Returns the 'context' extension of an ItemCollection.
+    Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/api-spec/extensions/context/README.md#context-extension-specification
+    """
+
+    context = __make_context(
+        params['page'], params['limit'], matched, returned, count=params.get('count', 'exact')
+    )
+    context['meta'] = None if not meta else meta
+
+    return context
 
 
 def make_json_item_collection(item_collection, params, matched, meta=None):
@@ -474,34 +1858,133 @@ def make_json_item_collection(item_collection, params, matched, meta=None):
     # Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/api-spec/extensions/context/README.md#context-extension-specification
     item_collection['stac_extensions'].append('context')
 
-    item_collection['context'] = {
-        'page': params['page'],
-        'limit': params['limit'],
-        'matched': matched,
-        'returned': len(item_collection['features']),
-        'meta': None if not meta else meta
-    }
+    item_collection['context'] = make_json_context(
+        params, matched, len(item_collection['features']), meta=meta
+    )
 
     return item_collection
 
 
-def get_links_property_to_stac_search(params):
-    """Returns `links` property based on `params` field and HTTP method used."""
+def stream_json_item_collection(items, links, item_stac_extensions, make_tail, fields=None):
+    """
+    Yields the ItemCollection of `items` as JSON chunks, with the same structure created by `make_json_items`
+    and `make_json_item_collection`. The features are created and encoded one at a time, then the rows can be
+    read from the database while they are sent. After the last feature, `make_tail` receives the
+    `collection`, `date` and `id` keys of the returned rows and returns the properties that are written
+    after `features` (e.g. `context` and `links`). The features just have the fields chosen by `fields`.
+    """
+
+    head = OrderedDict()
+    head['stac_version'] = API_VERSION
+    # the 'context' extension is added by `make_tail`
+    head['stac_extensions'] = ['context']
+    head['type'] = 'FeatureCollection'
+
+    # remove the last '}' to write the features inside the envelope
+    yield dumps(head)[:-1] + b',"features":['
+
+    serializer = FeatureSerializer(links, item_stac_extensions, cache=__feature_cache, fields=parse_fields(fields))
+    returned_rows = []
+    # the features are built and encoded together, then their time is recorded as 'features'
+    features_time = 0
+
+    for index, i in enumerate(items):
+        returned_rows.append({'collection': i['collection'], 'date': i['date'], 'id': i['id']})
+
+        start_time = perf_counter()
+        feature = serializer.encoded_feature(i)
+        features_time += perf_counter() - start_time
+
+        yield (b',' if index else b'') + feature
+
+    record('features', features_time)
+
+    tail = make_tail(returned_rows)
+
+    # remove the first '{' to write the properties after the features
+    yield b']' + (b',' + dumps(tail)[1:] if tail else b'}') + b'\n'
+
+
+def stream_ndjson_features(items, links, item_stac_extensions=None, fields=None):
+    """Yields the STAC Items of `items` as newline-delimited JSON, one encoded feature at a time."""
+
+    # an export reads the whole collection once, then its items do not replace the cached ones
+    serializer = FeatureSerializer(links, item_stac_extensions, fields=parse_fields(fields))
+
+    for i in items:
+        yield serializer.encoded_feature(i) + b'\n'
+
+
+def get_links_property_to_collection_items(collection_id, params, items=None):
+    """
+    Returns `links` property of the ItemCollection of `/collections/{collection_id}/items`.
+    The `next` link has the token to seek the page after `items`, when there is one.
+    """
 
-    logging.info(f'stac_search_get_links_property - params: {params}')
+    # remove unnecessary property to build the URL below
+    params = {k: v for k, v in params.items() if k != 'collection_id'}
 
-    if request.method == 'GET':
+    if params['bbox'] is not None:
+        params['bbox'] = ','.join(list(map(
+            # convert the floats to str before joining the elements
+            lambda x: str(x), params['bbox']
+        )))
+
+    # convert 'params' from dict to str to add to the URL
+    params_self = get_query_string(params)
+
+    # a search by ids is not paginated by collection, then its token does not have the position of the collection
+    search_type = __get_search_type(collection_id=collection_id, ids=params.get('ids'))
+
+    # increase the 'page' property and add the token to go to the next page
+    params['page'] += 1
+    params['next'] = make_next_token(items, [collection_id] if search_type == 'c' else None, params['limit'])
+    params_next = get_query_string(params)
+
+    return [
+        {"href": f"{BASE_URI}collections/{collection_id}/items?{params_self}", "rel": "self"},
+        {"href": f"{BASE_URI}collections/{collection_id}/items?{params_next}", "rel": "next"},
+        {"href": f"{BASE_URI}collections/{collection_id}/items", "rel": "child"},
+        {"href": f"{BASE_URI}collections/{collection_id}", "rel": "collection"},
+        {"href": f"{BASE_URI}collections", "rel": "parent"},
+        {"href": f"{BASE_URI}stac", "rel": "root"}
+    ]
+
+
+def get_links_property_to_stac_search(params, items=None, method=None):
+    """
+    Returns `links` property based on `params` field and HTTP `method` used (by default, the one of the request).
+    The `next` link has the token to seek the page after `items`, when there is one.
+    """
+
+    logging.info('stac_search_get_links_property - params: %s', params)
+
+    if method is None:
+        method = request.method
+
+    search_type = __get_search_type(ids=params.get('ids'), collections=params['collections'])
+
+    next_token = make_next_token(items, params['collections'] if search_type == 'c' else None, params['limit'])
+
+    if method == 'GET':
         if params['bbox'] is not None:
             params['bbox'] = ','.join(list(map(
                 # convert the floats to str before joining the elements
                 lambda x: str(x), params['bbox']
             )))
 
+        if params['collections'] is not None:
+            params['collections'] = ','.join(params['collections'])
+
+        if params.get('fields') is not None:
+            params['fields'] = format_fields(params['fields'])
+
         # convert 'params' from dict to str to add to the URL
         params_self = get_query_string(params)
 
-        # increase the 'page' property to go to the next page
+        # increase the 'page' property and add the token to go to the next page
         params['page'] += 1
+        params['next'] = next_token
         params_next = get_query_string(params)
 
         # create 'links' property based on 'params' field
@@ -510,7 +1993,7 @@ def get_links_property_to_stac_search(params):
             {"href": f"{BASE_URI}stac/search?{params_next}", "rel": "next"},
             {"href": f"{BASE_URI}stac", "rel": "root"}
         ]
-    elif request.method == "POST":
+    elif method == "POST":
         if params['ids'] is not None:
             params['ids'] = params['ids'].split(',')
 
@@ -519,6 +2002,12 @@ def get_links_property_to_stac_search(params):
         # copy the values and increase the 'page' property to go to the next page
         body_next = {**body_self, 'page': body_self['page'] + 1}
 
+        # replace the token of the current page by the one of the next page
+        body_next.pop('next', None)
+
+        if next_token is not None:
+            body_next['next'] = next_token
+
         # create 'links' property based on 'params' field
         return [
             {
@@ -542,38 +2031,568 @@ def get_links_property_to_stac_search(params):
         return None
 
 
-def do_query(sql, **kwargs):
+def __on_connect(dbapi_connection, connection_record):
+    # session settings are applied just once per connection, when the pool opens it,
+    # instead of once per query
+    cursor = dbapi_connection.cursor()
+    cursor.execute('SET @@group_concat_max_len = 1000000;')
+    cursor.close()
+
+    connection_record.info['pid'] = getpid()
+
+
+def __on_checkout(dbapi_connection, connection_record, connection_proxy):
+    # a connection opened by the parent process must not be shared with a forked worker,
+    # then I invalidate it and the pool opens a new one to this process
+    # Source: https://docs.sqlalchemy.org/en/13/core/pooling.html#using-connection-pools-with-multiprocessing
+    pid = getpid()
+
+    if connection_record.info['pid'] != pid:
+        connection_record.connection = connection_proxy.connection = None
+
+        raise exc.DisconnectionError(
+            f'Connection record belongs to pid {connection_record.info["pid"]}, '
+            f'attempting to check out in pid {pid}'
+        )
+
+
+def get_engine():
+    """Returns the process-wide engine, creating it on the first call of each process."""
+
+    global __engine, __engine_pid
+
+    # if the process has been forked, then the child process creates its own engine
+    if __engine is None or __engine_pid != getpid():
+        with __engine_lock:
+            if __engine is None or __engine_pid != getpid():
+                connection = f'mysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}'
+
+                engine = sqlalchemy.create_engine(
+                    connection,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=DB_POOL_PRE_PING
+                )
+
+                event.listen(engine, 'connect', __on_connect)
+                event.listen(engine, 'checkout', __on_checkout)
+
+                logging.info(
+                    'get_engine - pool_size: %s, max_overflow: %s, pool_recycle: %s, pool_pre_ping: %s',
+                    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+                )
+
+                __engine, __engine_pid = engine, getpid()
+
+    return __engine
+
+
+def set_engine(engine):
+    """Replaces the process-wide engine by `engine`, e.g. by the SQLite stand-in of the benchmarks."""
+
+    global __engine, __engine_pid
+
+    with __engine_lock:
+        __engine, __engine_pid = engine, getpid()
+
+
+def check_keyset_index():
+    """
+    Checks that `stac_item` has the (collection, date, id) index of `migrations/001_stac_item_keyset_index.sql`.
+    The pages (including the `page` ones, whose last rows create the `next` tokens) are sorted by these columns,
+    then without the index MySQL sorts all the matched rows of a search in order to return just one page.
+    """
+
+    try:
+        indexes = sqlalchemy.inspect(get_engine()).get_indexes('stac_item')
+    except exc.SQLAlchemyError:
+        # the database may be down while the service starts, then the check does not stop it
+        logging.exception('check_keyset_index - the indexes of `stac_item` could not be read')
+        return
+
+    if not any(index['column_names'][:3] == ['collection', 'date', 'id'] for index in indexes):
+        raise RuntimeError(
+            'stac_item does not have the (collection, date, id) index, apply migrations/001_stac_item_keyset_index.sql'
+        )
+
+
+def get_query_executor():
+    """Returns the process-wide thread pool used to run queries, creating it on the first call of each process."""
+
+    global __query_executor, __query_executor_pid, __query_slots
+
+    # threads are not copied to a forked process, then the child process creates its own pool
+    if __query_executor is None or __query_executor_pid != getpid():
+        with __engine_lock:
+            if __query_executor is None or __query_executor_pid != getpid():
+                __query_executor = ThreadPoolExecutor(
+                    max_workers=DB_QUERY_WORKERS, thread_name_prefix='inpe_stac_query'
+                )
+                __query_slots = BoundedSemaphore(DB_QUERY_WORKERS)
+                __query_executor_pid = getpid()
+
+    return __query_executor
+
+
+def __timed(call):
     start_time = time()
 
-    connection = f'mysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}'
-    engine = sqlalchemy.create_engine(connection)
+    result = call()
+
+    return result, time() - start_time
+
+
+def __timed_in_slot(call):
+    try:
+        return __timed(call)
+    finally:
+        __query_slots.release()
+
+
+def do_in_background(call):
+    """
+    Starts `call` (a function without arguments) in the shared thread pool and returns a function
+    that waits for its `(result, elapsed_time)` tuple. If the pool is saturated, then `call` runs in
+    the caller thread when the returned function is called.
+    """
+
+    executor = get_query_executor()
+
+    if __query_slots.acquire(blocking=False):
+        # the call runs in the context of the caller, e.g. it records its timings to the caller request
+        return executor.submit(copy_context().run, __timed_in_slot, call).result
+
+    logging.info('do_in_background - the thread pool is saturated, then the call runs sequentially')
+
+    return lambda: __timed(call)
+
+
+def do_concurrently(*calls):
+    """
+    Runs `calls` (functions without arguments) at the same time and returns a list with the
+    `(result, elapsed_time)` tuple of each one of them, in the same order.
+    The first call runs in the caller thread and the others run in the shared thread pool.
+    If the pool is saturated, then the calls that do not get a slot run in the caller thread, one after the other.
+    """
+
+    waits = [do_in_background(call) for call in calls[1:]]
+
+    return [__timed(calls[0])] + [wait() for wait in waits]
+
 
+def __text(sql, kwargs):
     sql = text(sql)
-    engine.execute('SET @@group_concat_max_len = 1000000;')
 
-    result = engine.execute(sql, kwargs)
-    result = result.fetchall()
+    # lists are bound as expanding parameters, e.g. `id IN :ids` becomes `id IN (%s, %s, ...)`
+    expanding = [bindparam(key, expanding=True) for key, value in kwargs.items() if isinstance(value, (list, tuple))]
 
-    engine.dispose()
+    if expanding:
+        sql = sql.bindparams(*expanding)
+
+    return sql
+
+
+def do_query(sql, **kwargs):
+    start_time = time()
+
+    sql = __text(sql, kwargs)
+
+    connect_time = perf_counter()
+
+    # the connection is given back to the pool when the block ends
+    with get_engine().connect() as connection:
+        record('connect', perf_counter() - connect_time)
+
+        result = connection.execute(sql, kwargs)
+        result = result.fetchall()
+
+    rows_time = perf_counter()
 
     result = [ dict(row) for row in result ]
 
+    record('rows', perf_counter() - rows_time)
+
     elapsed_time = time() - start_time
 
+    if __slow_query_log is not None:
+        __slow_query_log.add(sql.text, kwargs, len(result), elapsed_time)
+
     if len(result) > 0:
         return result, elapsed_time
     else:
         return None, elapsed_time
 
 
-def bbox(coord_list):
-    box = []
+def explain_query(sql, **kwargs):
+    """Returns the plan of the `sql` SELECT statement created by `EXPLAIN FORMAT=JSON`."""
+
+    sql = 'EXPLAIN FORMAT=JSON ' + sql.strip().rstrip(';')
+
+    with get_engine().connect() as connection:
+        row = connection.execute(__text(sql, kwargs), kwargs).fetchone()
+
+    return loads(row[0])
+
+
+def get_slow_queries(limit=None):
+    """Returns the last slow queries of this process, from the newest to the oldest one."""
+
+    if __slow_query_log is None:
+        return []
+
+    return __slow_query_log.entries(limit)
+
+
+def clear_slow_queries():
+    if __slow_query_log is not None:
+        __slow_query_log.clear()
+
+
+def dump_slow_queries(path):
+    """Appends the last slow queries of this process to the `path` file and returns how many were written."""
+
+    if __slow_query_log is None:
+        return 0
+
+    return __slow_query_log.dump(path)
+
+
+def iter_query(sql, batch_size=1000, **kwargs):
+    """
+    Yields the rows of `sql` one at a time. The rows are read from a server-side cursor,
+    `batch_size` rows at a time, then the whole result is never kept in memory.
+    """
+
+    connect_time = perf_counter()
+
+    with get_engine().connect() as connection:
+        record('connect', perf_counter() - connect_time)
+
+        result = connection.execution_options(stream_results=True).execute(__text(sql, kwargs), kwargs)
+
+        while True:
+            rows = result.fetchmany(batch_size)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield dict(row)
+
+
+def do_execute(sql, **kwargs):
+    """Executes `sql` statements that do not return rows (e.g. INSERT, UPDATE) in one transaction."""
+
+    start_time = time()
+
+    # the transaction is committed when the block ends
+    with get_engine().begin() as connection:
+        for statement in ([sql] if isinstance(sql, str) else sql):
+            result = connection.execute(__text(statement, kwargs), kwargs)
+
+    return result.rowcount, time() - start_time
+
+
+@log_function_header
+def rebuild_collection_summary():
+    """Recreates the `stac_collection_summary` table from scratch, based on all the rows of `stac_item`."""
+
+    corners = {
+        'x': 'tl_longitude, bl_longitude, br_longitude, tr_longitude',
+        'y': 'tl_latitude, bl_latitude, br_latitude, tr_latitude'
+    }
+
+    # the statements run in one transaction, then the readers do not see an empty table
+    rowcount, elapsed_time = do_execute([
+        'DELETE FROM stac_collection_summary;',
+        f'''
+            INSERT INTO stac_collection_summary (
+                collection, bands, min_x, min_y, max_x, max_y, start_date, end_date,
+                item_count, deleted_count, min_cloud_cover, max_cloud_cover
+            )
+            SELECT
+                collection,
+                JSON_EXTRACT(MIN(assets), '$[*].band'),
+                MIN(IF(deleted = 0, LEAST({corners['x']}), NULL)),
+                MIN(IF(deleted = 0, LEAST({corners['y']}), NULL)),
+                MAX(IF(deleted = 0, GREATEST({corners['x']}), NULL)),
+                MAX(IF(deleted = 0, GREATEST({corners['y']}), NULL)),
+                MIN(IF(deleted = 0, date, NULL)),
+                MAX(IF(deleted = 0, date, NULL)),
+                SUM(deleted = 0),
+                SUM(deleted <> 0),
+                MIN(IF(deleted = 0, cloud_cover, NULL)),
+                MAX(IF(deleted = 0, cloud_cover, NULL))
+            FROM stac_item
+            GROUP BY collection;
+        '''
+    ])
+
+    logging.info('rebuild_collection_summary - collections: %s', rowcount)
+    logging.info('rebuild_collection_summary - elapsed_time: %s', timedelta(seconds=elapsed_time))
+
+    return rowcount
+
+
+# bounds of an item footprint, created from its corners
+FOOTPRINT_BOUNDS_COLUMNS = '''
+    LEAST(tl_longitude, bl_longitude, br_longitude, tr_longitude) AS min_x,
+    LEAST(tl_latitude, bl_latitude, br_latitude, tr_latitude) AS min_y,
+    GREATEST(tl_longitude, bl_longitude, br_longitude, tr_longitude) AS max_x,
+    GREATEST(tl_latitude, bl_latitude, br_latitude, tr_latitude) AS max_y
+'''
+
+
+def __build_footprint_index():
+    where = []
+    insert_deleted_flag_to_where(where)
+
+    start_time = time()
+
+    id_data = bytearray()
+    id_offsets = array('Q', [0])
+    bounds = array('d')
+
+    # the rows are streamed, then just the compact arrays are kept in memory
+    for row in iter_query(f'''
+        SELECT id, {FOOTPRINT_BOUNDS_COLUMNS}
+        FROM stac_item
+        {'WHERE ' + ' AND '.join(where) if where else ''};
+    ''', batch_size=10000):
+        id_data += row['id'].encode('utf-8')
+        id_offsets.append(len(id_data))
+        bounds.extend((row['min_x'], row['min_y'], row['max_x'], row['max_y']))
+
+    footprint_index = FootprintIndex(id_data, id_offsets, bounds)
+
+    logging.info(
+        '__build_footprint_index - items: %s - elapsed_time: %s',
+        len(id_offsets) - 1, timedelta(seconds=time() - start_time)
+    )
+
+    return footprint_index
+
+
+def __poll_footprint_index(footprint_index, watermark):
+    """Applies the items changed since `watermark` to `footprint_index` and returns the new watermark."""
+
+    where = []
+    insert_deleted_flag_to_where(where)
+
+    # `>=` gets again the rows updated at the same time as the watermark, because the update is idempotent
+    result, _ = do_query(f'''
+        SELECT id, updated, {' AND '.join(where) if where else '1'} AS visible, {FOOTPRINT_BOUNDS_COLUMNS}
+        FROM stac_item
+        WHERE updated >= :watermark;
+    ''', watermark=watermark)
+
+    if result is None:
+        return watermark
+
+    footprint_index.update([
+        (
+            row['id'],
+            # if the item is not visible anymore (e.g. it has been flagged as `deleted`), then it is removed
+            (row['min_x'], row['min_y'], row['max_x'], row['max_y']) if row['visible'] else None
+        ) for row in result
+    ])
+
+    logging.info('__poll_footprint_index - changed items: %s', len(result))
+
+    return max(row['updated'] for row in result)
+
+
+def __maintain_footprint_index():
+    global __footprint_index
+
+    watermark = None
+    built_at = 0
+
+    while True:
+        try:
+            if __footprint_index is None or time() - built_at >= INPE_STAC_FOOTPRINT_INDEX_REBUILD_INTERVAL:
+                # the changes made during the build are polled after it
+                result, _ = do_query('SELECT MAX(updated) AS updated FROM stac_item;')
+                watermark = result[0]['updated'] if result else None
+
+                __footprint_index = __build_footprint_index()
+                built_at = time()
+
+            elif watermark is not None:
+                watermark = __poll_footprint_index(__footprint_index, watermark)
+
+        except Exception:
+            logging.exception('__maintain_footprint_index - the footprint index could not be updated')
+
+        sleep(INPE_STAC_FOOTPRINT_INDEX_POLL_INTERVAL)
+
+
+def get_footprint_index():
+    """
+    Returns the in-memory footprint index of this process or None if it has not been built yet.
+    The first call of each process starts the thread that builds the index and keeps it updated.
+    """
+
+    global __footprint_index, __footprint_index_pid
+
+    # threads are not copied to a forked process, then the child process starts its own thread
+    if __footprint_index_pid != getpid():
+        with __engine_lock:
+            if __footprint_index_pid != getpid():
+                __footprint_index = None
+                __footprint_index_pid = getpid()
+
+                Thread(
+                    target=__maintain_footprint_index, name='inpe_stac_footprint_index', daemon=True
+                ).start()
+
+    return __footprint_index
+
+
+# footprint of an item, created from its corners, in the same SRID (0) used by the corners comparison
+FOOTPRINT_EXPRESSION = '''Polygon(LineString(
+    Point(tl_longitude, tl_latitude), Point(bl_longitude, bl_latitude),
+    Point(br_longitude, br_latitude), Point(tr_longitude, tr_latitude),
+    Point(tl_longitude, tl_latitude)
+))'''
+
+
+@log_function_header
+def backfill_footprints(batch_size=10000):
+    """
+    Fills the `footprint` column of the items that do not have it, `batch_size` items at a time,
+    then the table is not locked for a long time. It returns the number of filled items.
+    """
+
+    # if the `updated` column exists, then I keep its value, because the items have not really changed
+    keep_updated = ', updated = updated' if INPE_STAC_CHANGE_TRACKING else ''
+
+    total = 0
+
+    while True:
+        rowcount, elapsed_time = do_execute(
+            f'''
+                UPDATE stac_item
+                SET footprint = {FOOTPRINT_EXPRESSION}{keep_updated}
+                WHERE footprint IS NULL
+                LIMIT :batch_size;
+            ''',
+            batch_size=batch_size
+        )
+
+        total += rowcount
+
+        logging.info(
+            'backfill_footprints - filled: %s - elapsed_time - batch: %s', total, timedelta(seconds=elapsed_time)
+        )
+
+        if rowcount < batch_size:
+            return total
+
+
+@log_function_header
+def refresh_features(batch_size=1000, prune=False):
+    """
+    Renders the features of the items that do not have a rendered feature in `stac_item_feature` or whose item
+    has changed since it was rendered, `batch_size` items at a time, in the order of their `updated` values.
+    Just the items changed since the last rendered one (less `REFRESH_FEATURES_OVERLAP`) are read, by the `updated`
+    index, then the whole table is just read when `stac_item_feature` is empty. If `prune` is True, then the features
+    of the removed items are deleted too. It returns the numbers of rendered and deleted features.
+    """
+
+    # the roots of the assets are placeholders and the links are added when the features are served
+    serializer = FeatureSerializer([], tif_root=TIF_ROOT_PLACEHOLDER, png_root=PNG_ROOT_PLACEHOLDER)
+
+    # the items are rendered in the order of their `updated` values, then the last rendered one is the watermark
+    # (the `stac_item_feature_updated_idx` index finds it), even if the previous run has been interrupted
+    watermark, _ = do_query('SELECT updated FROM stac_item_feature ORDER BY updated DESC LIMIT 1;')
+
+    # (updated, id) of the last read item, if it is None, then all the items are read
+    after = None
+
+    if watermark:
+        after = (watermark[0]['updated'] - REFRESH_FEATURES_OVERLAP, '')
+
+    logging.info('refresh_features - watermark: %s', watermark[0]['updated'] if watermark else None)
+
+    where = ['(f.id IS NULL OR f.updated <> i.updated)']
+
+    insert_deleted_flag_to_where(where)
+
+    def get_sql(seek):
+        return f'''
+            SELECT i.*
+            FROM stac_item i
+            LEFT JOIN stac_item_feature f ON f.id = i.id AND f.collection = i.collection
+            WHERE
+                {' AND '.join(where + seek)}
+            ORDER BY i.updated, i.id
+            LIMIT :batch_size;
+        '''
+
+    rendered = 0
+
+    while True:
+        if after is None:
+            result, elapsed_time = do_query(get_sql([]), batch_size=batch_size)
+        else:
+            result, elapsed_time = do_query(
+                get_sql(['(i.updated > :after_updated OR (i.updated = :after_updated AND i.id > :after_id))']),
+                after_updated=after[0], after_id=after[1], batch_size=batch_size
+            )
+
+        result = result or []
+
+        values, params = [], {}
+
+        for index, i in enumerate(result):
+            try:
+                feature = serializer.fragment(i)
+            except (KeyError, TypeError, ValueError) as error:
+                # an item that can not be rendered is created from its columns when it is served
+                logging.warning('refresh_features - item: %s - error: %s', i['id'], error)
+                continue
+
+            values.append(f'(:collection_{index}, :id_{index}, :updated_{index}, :feature_{index})')
+            params.update({
+                f'collection_{index}': i['collection'], f'id_{index}': i['id'],
+                f'updated_{index}': i['updated'], f'feature_{index}': feature
+            })
+
+        if values:
+            # REPLACE inserts the new features and replaces the old ones
+            do_execute(
+                f'REPLACE INTO stac_item_feature (collection, id, updated, feature) VALUES {", ".join(values)};',
+                **params
+            )
+
+        rendered += len(values)
+
+        logging.info(
+            'refresh_features - rendered: %s - elapsed_time - batch: %s', rendered, timedelta(seconds=elapsed_time)
+        )
+
+        if len(result) < batch_size:
+            break
+
+        after = (result[-1]['updated'], result[-1]['id'])
+
+    deleted = 0
+
+    if prune:
+        deleted, elapsed_time = do_execute('''
+            DELETE FROM stac_item_feature
+            WHERE NOT EXISTS (
+                SELECT 1 FROM stac_item i
+                WHERE i.id = stac_item_feature.id AND i.collection = stac_item_feature.collection
+            );
+        ''')
 
-    for i in (0, 1):
-        res = sorted(coord_list[0], key=lambda x: x[i])
-        box.append((res[0][i], res[-1][i]))
+        logging.info('refresh_features - deleted: %s - elapsed_time: %s', deleted, timedelta(seconds=elapsed_time))
 
-    return [box[0][0], box[1][0], box[0][1], box[1][1]]
+    return rendered, deleted
 
 
 class InvalidBoundingBoxError(Exception):
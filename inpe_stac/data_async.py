@@ -0,0 +1,184 @@
+"""
+Asynchronous access to the database, used by the ASGI application (`inpe_stac.asgi`).
+
+The queries are created by `inpe_stac.data` and executed by `aiomysql`, then the count and the page
+of a search run at the same time without blocking a thread while they wait for MySQL.
+"""
+
+from asyncio import Lock, gather, get_event_loop
+from datetime import timedelta
+from re import compile
+from time import perf_counter, time
+
+import aiomysql
+
+from inpe_stac.data import attach_features, finish_candidates_page, finish_collection_items, get_features_query, \
+                           plan_candidates_page, plan_collection_items
+from inpe_stac.environment import DB_USER, DB_PASS, DB_HOST, DB_NAME, \
+                                  DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
+from inpe_stac.log import logging, sql_logger
+from inpe_stac.metrics import record
+
+
+# named parameters (e.g. `:limit`) of the queries created for `sqlalchemy.text`
+BIND_PARAMETER = compile(r'(?<![:\w\\]):(\w+)(?!:)')
+
+# pool of the event loop that has created it, it is lazily created by `get_pool`
+__pool = None
+__pool_loop = None
+__pool_lock = None
+
+
+def to_pyformat(sql, params):
+    """
+    Converts `sql`, whose parameters are named like `:name`, to the 'pyformat' style used by `aiomysql`
+    (e.g. `%(name)s`) and returns it with its arguments. Lists are expanded like `sqlalchemy` does,
+    e.g. `id IN :ids` becomes `id IN (%(ids_0)s, %(ids_1)s, ...)`.
+    """
+
+    args = {}
+
+    def replace(match):
+        name = match.group(1)
+
+        if name not in params:
+            return match.group(0)
+
+        value = params[name]
+
+        if isinstance(value, (list, tuple)):
+            names = [f'{name}_{index}' for index in range(len(value))]
+            args.update(zip(names, value))
+
+            # an empty list does not match any row
+            return '(' + ', '.join(f'%({name})s' for name in names) + ')' if names else '(NULL)'
+
+        args[name] = value
+
+        return f'%({name})s'
+
+    # the '%' characters of the query (e.g. LIKE 'A%') are escaped before adding the parameters
+    return BIND_PARAMETER.sub(replace, sql.replace('%', '%%')), args
+
+
+async def get_pool():
+    """Returns the pool of connections of the current event loop, creating it on the first call."""
+
+    global __pool, __pool_loop, __pool_lock
+
+    loop = get_event_loop()
+
+    # a pool can not be used by another event loop (e.g. of another worker thread)
+    if __pool_loop is not loop:
+        __pool, __pool_loop, __pool_lock = None, loop, Lock()
+
+    if __pool is None:
+        async with __pool_lock:
+            if __pool is None:
+                __pool = await aiomysql.create_pool(
+                    host=DB_HOST, user=DB_USER, password=DB_PASS, db=DB_NAME,
+                    minsize=1, maxsize=DB_POOL_SIZE + DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE,
+                    autocommit=True, init_command='SET @@group_concat_max_len = 1000000;'
+                )
+
+                logging.info(
+                    'get_pool - maxsize: %s, pool_recycle: %s', DB_POOL_SIZE + DB_MAX_OVERFLOW, DB_POOL_RECYCLE
+                )
+
+    return __pool
+
+
+async def close_pool():
+    """Closes the pool of connections, e.g. when the application shuts down."""
+
+    global __pool
+
+    if __pool is not None:
+        __pool.close()
+        await __pool.wait_closed()
+        __pool = None
+
+
+async def do_query(sql, **kwargs):
+    """It works like `inpe_stac.data.do_query`, but asynchronously."""
+
+    start_time = time()
+
+    sql, args = to_pyformat(sql, kwargs)
+
+    pool = await get_pool()
+
+    connect_time = perf_counter()
+
+    # the connection is given back to the pool when the block ends
+    async with pool.acquire() as connection:
+        record('connect', perf_counter() - connect_time)
+
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, args)
+            result = list(await cursor.fetchall())
+
+    elapsed_time = time() - start_time
+
+    if len(result) > 0:
+        return result, elapsed_time
+    else:
+        return None, elapsed_time
+
+
+async def get_collection_items(**params):
+    """
+    It works like `inpe_stac.data.get_collection_items`, but the count and page queries are executed
+    asynchronously and at the same time, each one of them in its own pooled connection.
+    """
+
+    logging.info('get_collection_items() - async')
+
+    plan = plan_collection_items(**params)
+
+    calls = [do_query(sql, **count_params) for sql, count_params in plan['count_queries']]
+
+    # if all collections have been exhausted, then there is not a page to search
+    if plan['sql'] is not None:
+        calls.append(do_query(plan['sql'], **plan['params']))
+
+    start_time = time()
+
+    results = await gather(*calls)
+
+    sql_logger.info(
+        'get_collection_items() - async - elapsed_time - queries: %s', timedelta(seconds=time() - start_time)
+    )
+
+    if plan['sql'] is not None:
+        result, sql_elapsed_time = results.pop()
+        # the keys of the footprint candidates are the count of the search
+        record('page' if plan['candidates'] is None else 'count', sql_elapsed_time)
+    else:
+        result = None
+
+    # the count queries run at the same time, then the count takes as long as the slowest one
+    if results:
+        record('count', max(elapsed_time for _, elapsed_time in results))
+
+    # the keys of the footprint candidates have been read, then the rows of the page are read by primary key
+    if plan['candidates'] is not None:
+        sql, page_params = plan_candidates_page(plan, result)
+        result = None
+
+        if sql is not None:
+            rows, sql_elapsed_time = await do_query(sql, **page_params)
+            record('page', sql_elapsed_time)
+
+            result = finish_candidates_page(plan, rows)
+
+    # the rendered features are read by the keys of the page, then they are read after it
+    if plan['features'] and result:
+        sql, features_params = get_features_query(result)
+
+        features, features_elapsed_time = await do_query(sql, **features_params)
+        record('rendered', features_elapsed_time)
+
+        attach_features(result, features)
+
+    return finish_collection_items(plan, result, [count_result for count_result, _ in results])
@@ -1,18 +1,21 @@
 
 from functools import wraps
+from hmac import compare_digest
 from time import time, strftime, gmtime
 from datetime import timedelta
 from traceback import format_exc, print_stack
-from werkzeug.exceptions import InternalServerError
+from flask import request
+from werkzeug.exceptions import Forbidden, HTTPException, InternalServerError, NotFound
 
-from inpe_stac.log import logging
+from inpe_stac.environment import INPE_STAC_ADMIN_TOKEN
+from inpe_stac.log import function_logger, logging
 
 
 def log_function_header(function):
 
     @wraps(function)
     def wrapper(*args, **kwargs):
-        logging.info('{0}() - execution'.format(function.__name__))
+        function_logger.info('%s() - execution', function.__name__)
 
         return function(*args, **kwargs)
 
@@ -29,10 +32,7 @@ def log_function_footer(function):
 
         elapsed_time = time() - start_time
 
-        logging.info('{0}() - elapsed time: {1}'.format(
-            function.__name__,
-            timedelta(seconds=elapsed_time)
-        ))
+        function_logger.info('%s() - elapsed time: %s', function.__name__, timedelta(seconds=elapsed_time))
 
         return result
 
@@ -47,6 +47,10 @@ def catch_generic_exceptions(function):
             # try to execute the function
             return function(*args, **kwargs)
 
+        # HTTP errors (e.g. BadRequest) already have their status code and description
+        except HTTPException:
+            raise
+
         # generic exception
         except Exception as error:
             error_message = 'An unexpected error ocurred. Please, contact the administrator.' + '\nError: ' + str(error)
@@ -61,3 +65,23 @@ def catch_generic_exceptions(function):
             raise InternalServerError(error_message + 'Error: ' + str(error))
 
     return wrapper
+
+
+def require_admin_token(function):
+    """Allows the request just if it has the `Authorization: Bearer <INPE_STAC_ADMIN_TOKEN>` header."""
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # if there is not a token, then the admin endpoints do not exist
+        if not INPE_STAC_ADMIN_TOKEN:
+            raise NotFound()
+
+        authorization = request.headers.get('Authorization', '')
+
+        if not compare_digest(authorization, f'Bearer {INPE_STAC_ADMIN_TOKEN}'):
+            logging.info('%s() - invalid admin token', function.__name__)
+            raise Forbidden('Invalid admin token')
+
+        return function(*args, **kwargs)
+
+    return wrapper
@@ -1,5 +1,6 @@
 
 from os import getenv
+from os.path import expanduser, join
 from logging import DEBUG, INFO
 
 
@@ -11,15 +12,144 @@ FLASK_ENV = getenv('FLASK_ENV', 'production')
 
 INPE_STAC_DELETED = getenv('INPE_STAC_DELETED', '0')
 
+# prefixes of the assets `href`
+TIF_ROOT = getenv('TIF_ROOT', '')
+PNG_ROOT = getenv('PNG_ROOT', '')
+
+# 'json' encodes the responses with the standard library, as `flask.jsonify`, 'orjson' opts in to `orjson`
+# (its output is not byte-identical) and 'auto' uses `orjson` if it is installed
+INPE_STAC_JSON_ENCODER = getenv('INPE_STAC_JSON_ENCODER', 'json')
+
+# default strategy to compute the `matched` property of a search: 'exact', 'estimated', 'capped', 'cached' or 'off'
+INPE_STAC_COUNT_MODE = getenv('INPE_STAC_COUNT_MODE', 'exact')
+# maximum number of rows counted by the 'capped' strategy
+INPE_STAC_COUNT_CAP = int(getenv('INPE_STAC_COUNT_CAP', '10000'))
+# time to live (in seconds) and maximum number of entries saved by the 'cached' strategy
+INPE_STAC_COUNT_CACHE_TTL = int(getenv('INPE_STAC_COUNT_CACHE_TTL', '300'))
+INPE_STAC_COUNT_CACHE_SIZE = int(getenv('INPE_STAC_COUNT_CACHE_SIZE', '1024'))
+
+# if it is '1', then `stac_collection` and `stac_item` tables have the `updated` column (migrations/002)
+INPE_STAC_CHANGE_TRACKING = getenv('INPE_STAC_CHANGE_TRACKING', '0') == '1'
+
+# if it is '1', then the collections are read from the `stac_collection_summary` table (migrations/003)
+INPE_STAC_COLLECTION_SUMMARY = getenv('INPE_STAC_COLLECTION_SUMMARY', '0') == '1'
+
+# if it is '1', then the features rendered by `flask refresh-features` are read from the `stac_item_feature` table
+# (migrations/006), it needs INPE_STAC_CHANGE_TRACKING
+INPE_STAC_PRERENDERED_FEATURES = getenv('INPE_STAC_PRERENDERED_FEATURES', '0') == '1'
+
+# 'footprint' filters the bbox by the SPATIAL index of the `stac_item.footprint` column (migrations/004 and 005),
+# 'corners' compares the corners of the items, it works with databases that have not been migrated
+INPE_STAC_BBOX_MODE = getenv('INPE_STAC_BBOX_MODE', 'corners')
+
+# if it is '1', then each worker keeps an in-memory R-tree of the items footprint to prefilter the bbox,
+# for databases whose schema can not change
+INPE_STAC_FOOTPRINT_INDEX = getenv('INPE_STAC_FOOTPRINT_INDEX', '0') == '1'
+# seconds between two polls for changed items (it needs INPE_STAC_CHANGE_TRACKING) and between two full rebuilds
+INPE_STAC_FOOTPRINT_INDEX_POLL_INTERVAL = int(getenv('INPE_STAC_FOOTPRINT_INDEX_POLL_INTERVAL', '30'))
+INPE_STAC_FOOTPRINT_INDEX_REBUILD_INTERVAL = int(getenv('INPE_STAC_FOOTPRINT_INDEX_REBUILD_INTERVAL', '86400'))
+# if the bbox intersects more items than this value, then the items are not fetched by primary key
+INPE_STAC_FOOTPRINT_INDEX_MAX_CANDIDATES = int(getenv('INPE_STAC_FOOTPRINT_INDEX_MAX_CANDIDATES', '5000'))
+
+# time to live (in seconds) and maximum number of entries of the collection metadata cache
+INPE_STAC_COLLECTIONS_CACHE_TTL = int(getenv('INPE_STAC_COLLECTIONS_CACHE_TTL', '3600'))
+INPE_STAC_COLLECTIONS_CACHE_SIZE = int(getenv('INPE_STAC_COLLECTIONS_CACHE_SIZE', '256'))
+# minimum number of seconds between two checks for changed collections (it needs INPE_STAC_CHANGE_TRACKING)
+INPE_STAC_COLLECTIONS_PROBE_INTERVAL = int(getenv('INPE_STAC_COLLECTIONS_PROBE_INTERVAL', '60'))
+
+# token to access the admin endpoints, if it is empty, then the admin endpoints are disabled
+INPE_STAC_ADMIN_TOKEN = getenv('INPE_STAC_ADMIN_TOKEN', '')
+
+# maximum number of entries, maximum size (in bytes of encoded JSON) and time to live (in seconds)
+# of the cache of created STAC Items, if the size is '0', then the items are not cached
+INPE_STAC_FEATURE_CACHE_SIZE = int(getenv('INPE_STAC_FEATURE_CACHE_SIZE', '10000'))
+INPE_STAC_FEATURE_CACHE_MAX_BYTES = int(getenv('INPE_STAC_FEATURE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+INPE_STAC_FEATURE_CACHE_TTL = int(getenv('INPE_STAC_FEATURE_CACHE_TTL', '3600'))
+
+# responses of `/stac/search` are cached by 'memory' (each worker has its own cache) or by 'sqlite'
+# (a file shared by the workers of the same host), if it is 'off', then they are not cached
+INPE_STAC_SEARCH_CACHE = getenv('INPE_STAC_SEARCH_CACHE', 'off')
+INPE_STAC_SEARCH_CACHE_TTL = int(getenv('INPE_STAC_SEARCH_CACHE_TTL', '60'))
+INPE_STAC_SEARCH_CACHE_SIZE = int(getenv('INPE_STAC_SEARCH_CACHE_SIZE', '1024'))
+# the file is created in a directory of the user that runs the service, it must not be writable by other users
+INPE_STAC_SEARCH_CACHE_PATH = expanduser(getenv(
+    'INPE_STAC_SEARCH_CACHE_PATH',
+    join(getenv('XDG_CACHE_HOME', '~/.cache'), 'inpe-stac', 'search-cache.sqlite')
+))
+# number of decimal digits of the bbox coordinates of a search (6 digits are about 10 centimeters)
+INPE_STAC_SEARCH_BBOX_DIGITS = int(getenv('INPE_STAC_SEARCH_BBOX_DIGITS', '6'))
+
+# how a search by several collections reads its page: 'fanout' runs one query per collection, which stops
+# at the end of the page, at the same time, while 'window' numbers all the matched rows by `row_number()`
+INPE_STAC_COLLECTIONS_SEARCH = getenv('INPE_STAC_COLLECTIONS_SEARCH', 'fanout')
+
+# the `ids` of a search are searched in chunks of this number of ids at a time, whose results are merged
+INPE_STAC_IDS_CHUNK_SIZE = int(getenv('INPE_STAC_IDS_CHUNK_SIZE', '1000'))
+# maximum number of (collection, id) pairs that `/stac/items` receives at once, they are read in chunks
+# of `INPE_STAC_IDS_CHUNK_SIZE` ids
+INPE_STAC_BATCH_MAX_ITEMS = int(getenv('INPE_STAC_BATCH_MAX_ITEMS', '5000'))
+
+# fields of the `query` extension whose columns have an index in this database (e.g. 'cloud_cover,satellite'),
+# besides `id` and `collection`
+INPE_STAC_QUERY_INDEXED_FIELDS = getenv('INPE_STAC_QUERY_INDEXED_FIELDS', '')
+# what to do with the searches that can only run as full scans of `stac_item`, i.e. without an indexed filter:
+# 'allow' them, 'cap' their count (an exact count becomes a capped one) or 'reject' them
+INPE_STAC_FULL_SCAN_POLICY = getenv('INPE_STAC_FULL_SCAN_POLICY', 'allow')
+
+# pages with `limit` greater than or equal to this value are streamed, if it is '0', then no page is streamed
+INPE_STAC_STREAM_MIN_LIMIT = int(getenv('INPE_STAC_STREAM_MIN_LIMIT', '500'))
+
+# `Cache-Control` header of the responses of each endpoint, if it is empty, then the header is not sent
+INPE_STAC_CACHE_CONTROL_STAC = getenv('INPE_STAC_CACHE_CONTROL_STAC', '')
+INPE_STAC_CACHE_CONTROL_COLLECTIONS = getenv('INPE_STAC_CACHE_CONTROL_COLLECTIONS', '')
+INPE_STAC_CACHE_CONTROL_COLLECTION = getenv('INPE_STAC_CACHE_CONTROL_COLLECTION', '')
+INPE_STAC_CACHE_CONTROL_ITEMS = getenv('INPE_STAC_CACHE_CONTROL_ITEMS', '')
+INPE_STAC_CACHE_CONTROL_ITEM = getenv('INPE_STAC_CACHE_CONTROL_ITEM', '')
+INPE_STAC_CACHE_CONTROL_SEARCH = getenv('INPE_STAC_CACHE_CONTROL_SEARCH', '')
+
+# if it is '1', then the responses have the `Server-Timing` header and `/metrics` exposes the duration of the requests
+INPE_STAC_METRICS = getenv('INPE_STAC_METRICS', '0') == '1'
+# maximum number of collections that have their own `collection` label, the others are labeled '_other'
+INPE_STAC_METRICS_MAX_COLLECTIONS = int(getenv('INPE_STAC_METRICS_MAX_COLLECTIONS', '100'))
+
+# queries that take this number of milliseconds or more are saved with their plan (EXPLAIN FORMAT=JSON)
+# in a buffer of the last `INPE_STAC_SLOW_QUERY_LOG_SIZE` ones, if it is '0', then they are not saved
+INPE_STAC_SLOW_QUERY_THRESHOLD_MS = int(getenv('INPE_STAC_SLOW_QUERY_THRESHOLD_MS', '0'))
+INPE_STAC_SLOW_QUERY_LOG_SIZE = int(getenv('INPE_STAC_SLOW_QUERY_LOG_SIZE', '100'))
+INPE_STAC_SLOW_QUERY_EXPLAIN = getenv('INPE_STAC_SLOW_QUERY_EXPLAIN', '1') == '1'
+# prefix of the files where the slow queries are dumped, each worker appends to '<prefix>-<pid>.ndjson'
+INPE_STAC_SLOW_QUERY_DUMP_PATH = getenv('INPE_STAC_SLOW_QUERY_DUMP_PATH', '/tmp/inpe-stac-slow-queries')
+
 # database environment variables
 DB_USER = getenv('DB_USER', 'root')
 DB_PASS = getenv('DB_PASS', 'password')
 DB_HOST = getenv('DB_HOST', 'localhost')
 DB_NAME = getenv('DB_NAME', 'catalog')
 
+# database connection pool environment variables
+DB_POOL_SIZE = int(getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(getenv('DB_POOL_TIMEOUT', '30'))
+# number of seconds after which a connection is recycled (MySQL closes idle connections after `wait_timeout`)
+DB_POOL_RECYCLE = int(getenv('DB_POOL_RECYCLE', '3600'))
+DB_POOL_PRE_PING = getenv('DB_POOL_PRE_PING', '1') == '1'
+# number of threads shared by the app to run queries at the same time (e.g. count and page queries),
+# each thread uses its own pooled connection, then it must not be greater than the pool size
+DB_QUERY_WORKERS = int(getenv('DB_QUERY_WORKERS', '4'))
+
 # default logging level in production server
 LOGGING_LEVEL = INFO
 
 # if the application is in development mode, then change the logging level and debug mode
 if FLASK_ENV == 'development':
     LOGGING_LEVEL = DEBUG
+
+# if it is '1', then the log records are written by a background thread, instead of by the thread that logs them
+INPE_STAC_LOG_ASYNC = getenv('INPE_STAC_LOG_ASYNC', '1') == '1'
+# maximum number of records waiting to be written, the records logged while the queue is full are dropped
+INPE_STAC_LOG_QUEUE_SIZE = int(getenv('INPE_STAC_LOG_QUEUE_SIZE', '10000'))
+# format of the log records: 'text' or 'json' (one JSON object per line)
+INPE_STAC_LOG_FORMAT = getenv('INPE_STAC_LOG_FORMAT', 'text')
+# fraction of the INFO and DEBUG records of each category that are logged, e.g. 'sql=0.01,function=0.1',
+# the categories are 'sql' (SQL statements, parameters and their elapsed times) and 'function' (function calls)
+INPE_STAC_LOG_SAMPLING = getenv('INPE_STAC_LOG_SAMPLING', '')
@@ -0,0 +1,145 @@
+"""
+Parser of the `fields` extension, which chooses the fields of the returned STAC Items.
+Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/api-spec/extensions/fields/README.md
+
+The fields of an Item are created from some columns of `stac_item`, then a search just reads the columns
+of the chosen fields (`Fields.columns`) and `FeatureSerializer` just creates the chosen fields, e.g. the assets
+JSON is not parsed if neither `assets` nor `properties.eo:bands` is chosen.
+"""
+
+from werkzeug.exceptions import BadRequest
+
+
+# fields of the Items created by `FeatureSerializer`, in their order
+FEATURE_FIELDS = (
+    'stac_version', 'stac_extensions', 'type', 'id', 'collection', 'geometry', 'bbox', 'properties', 'assets', 'links'
+)
+PROPERTIES = ('datetime', 'path', 'row', 'satellite', 'sensor', 'cloud_cover', 'sync_loss', 'eo:gsd', 'eo:bands')
+
+# a GeoJSON Feature always has these fields
+REQUIRED_FIELDS = ('type', 'id')
+
+# columns that are always read, because they are the key of the pages, which creates the `next` token
+KEY_COLUMNS = ('collection', 'date', 'id')
+
+CORNER_COLUMNS = (
+    'tl_longitude', 'tl_latitude', 'bl_longitude', 'bl_latitude',
+    'br_longitude', 'br_latitude', 'tr_longitude', 'tr_latitude'
+)
+
+# field -> columns of `stac_item` that create it
+FIELD_COLUMNS = {
+    'geometry': CORNER_COLUMNS,
+    'bbox': CORNER_COLUMNS,
+    'properties.datetime': ('datetime',),
+    'properties.path': ('path',),
+    # `row` is a reserved word since MySQL 8
+    'properties.row': ('`row`',),
+    'properties.satellite': ('satellite',),
+    'properties.sensor': ('sensor',),
+    'properties.cloud_cover': ('cloud_cover',),
+    'properties.sync_loss': ('sync_loss',),
+    'properties.eo:bands': ('assets',),
+    'assets': ('assets', 'thumbnail')
+}
+
+
+class Fields:
+    """
+    Fields of the Items chosen by the `include` and `exclude` sets of field names (e.g. 'geometry' or
+    'properties.datetime'). If `include` is empty, then all the fields that are not excluded are chosen.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        include, exclude = set(include), set(exclude)
+
+        def is_chosen(field, parent=None):
+            if field in REQUIRED_FIELDS:
+                return True
+
+            if field in exclude or parent in exclude:
+                return False
+
+            return not include or field in include or parent in include
+
+        # names of the chosen properties, in their order
+        self.properties = tuple(name for name in PROPERTIES if is_chosen(f'properties.{name}', 'properties'))
+
+        # chosen fields, in their order, `properties` is chosen if one of its properties is chosen
+        self.keys = tuple(
+            field for field in FEATURE_FIELDS
+            if (bool(self.properties) if field == 'properties' else is_chosen(field))
+        )
+
+        columns = list(KEY_COLUMNS)
+
+        for field in self.keys + tuple(f'properties.{name}' for name in self.properties):
+            for column in FIELD_COLUMNS.get(field, ()):
+                if column not in columns:
+                    columns.append(column)
+
+        # SELECT list of the columns that create the chosen fields
+        self.columns = ', '.join(columns)
+
+
+def __split_fields(fields):
+    """Returns the `include` and `exclude` sets of the `fields` parameter or raises BadRequest."""
+
+    if fields is None:
+        return set(), set()
+
+    # GET requests: a comma-separated list, whose excluded fields start with '-', e.g. 'id,geometry,-assets'
+    if isinstance(fields, str):
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+
+        include = {name.lstrip('+') for name in names if not name.startswith('-')}
+        exclude = {name[1:] for name in names if name.startswith('-')}
+
+        return include, exclude
+
+    # POST requests: an object with the `include` and `exclude` lists
+    if isinstance(fields, dict):
+        include = fields.get('include') or []
+        exclude = fields.get('exclude') or []
+
+        for name, names in (('include', include), ('exclude', exclude)):
+            if not isinstance(names, list) or not all(isinstance(field, str) for field in names):
+                raise BadRequest(f'`fields` field `{name}` must be a list of field names')
+
+        return set(include), set(exclude)
+
+    raise BadRequest('`fields` field must be a comma-separated string or an object with `include` and `exclude` lists')
+
+
+def parse_fields(fields):
+    """
+    Returns the `Fields` of the `fields` parameter: a comma-separated string (e.g. 'id,geometry,-assets') or
+    an object with `include` and `exclude` lists. If it does not choose any field, then it returns None,
+    i.e. the Items have all their fields. It raises BadRequest if `fields` is not valid.
+    """
+
+    include, exclude = __split_fields(fields)
+
+    if not include and not exclude:
+        return None
+
+    return Fields(include, exclude)
+
+
+def normalize_fields(fields):
+    """Returns the `fields` parameter as an object with sorted `include` and `exclude` lists, or None."""
+
+    include, exclude = __split_fields(fields)
+
+    if not include and not exclude:
+        return None
+
+    return {'include': sorted(include), 'exclude': sorted(exclude)}
+
+
+def format_fields(fields):
+    """Returns the `fields` parameter as the comma-separated string of GET requests."""
+
+    include, exclude = __split_fields(fields)
+
+    return ','.join(sorted(include) + [f'-{field}' for field in sorted(exclude)])
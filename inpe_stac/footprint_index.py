@@ -0,0 +1,135 @@
+from array import array
+from math import ceil, sqrt
+from threading import Lock
+
+
+class FootprintIndex:
+    """
+    In-memory R-tree of the items footprint, packed by the Sort-Tile-Recursive (STR) algorithm.
+
+    The bounds are saved in flat arrays of doubles (`min_x, min_y, max_x, max_y` of each entry) and the ids are
+    saved in a single buffer of UTF-8 bytes (`id_data`), where the id of the entry `i` goes from `id_offsets[i]`
+    to `id_offsets[i + 1]`, then an item costs 40 bytes plus the bytes of its id instead of one Python object per
+    coordinate and per id.
+    `levels[0]` has the bounds of the items and `levels[n]` has the bounds of the nodes that
+    group `node_size` entries of `levels[n - 1]`.
+
+    The packed tree is immutable, then the changed items are kept apart: the `tombstones` set has the ids
+    whose packed bounds are not valid anymore and `delta` has the current bounds of the changed items.
+    """
+
+    def __init__(self, id_data, id_offsets, bounds, node_size=16):
+        self.node_size = node_size
+        self.id_data, self.id_offsets, self.levels = self.__pack(id_data, id_offsets, bounds, node_size)
+
+        # id -> (min_x, min_y, max_x, max_y) of the items changed after packing the tree
+        self.delta = {}
+        self.tombstones = set()
+        self.__lock = Lock()
+
+    @staticmethod
+    def __pack(id_data, id_offsets, bounds, node_size):
+        count = len(id_offsets) - 1
+
+        # center of each item, in order to sort them
+        def center(i, axis):
+            return bounds[4 * i + axis] + bounds[4 * i + axis + 2]
+
+        # sort the items by the x center, slice them vertically and then sort each slice by the y center
+        order = sorted(range(count), key=lambda i: center(i, 0))
+        slice_size = node_size * ceil(sqrt(ceil(count / node_size))) if count else 1
+
+        packed_order = []
+
+        for start in range(0, count, slice_size):
+            packed_order += sorted(order[start:start + slice_size], key=lambda i: center(i, 1))
+
+        del order
+
+        packed_id_data = bytearray()
+        packed_id_offsets = array('Q', [0])
+        packed_bounds = array('d')
+
+        for i in packed_order:
+            packed_id_data += id_data[id_offsets[i]:id_offsets[i + 1]]
+            packed_id_offsets.append(len(packed_id_data))
+            packed_bounds.extend(bounds[4 * i:4 * i + 4])
+
+        del packed_order
+
+        levels = [packed_bounds]
+
+        # group `node_size` consecutive entries of the last level until there is just one root node
+        while len(levels[-1]) > 4 * node_size:
+            children = levels[-1]
+            nodes = array('d')
+
+            for start in range(0, len(children), 4 * node_size):
+                group = children[start:start + 4 * node_size]
+
+                nodes.extend((
+                    min(group[0::4]), min(group[1::4]),
+                    max(group[2::4]), max(group[3::4])
+                ))
+
+            levels.append(nodes)
+
+        return bytes(packed_id_data), packed_id_offsets, levels
+
+    def get_id(self, i):
+        """Returns the id of the entry `i` of the packed tree."""
+
+        return self.id_data[self.id_offsets[i]:self.id_offsets[i + 1]].decode('utf-8')
+
+    def update(self, changes):
+        """
+        Updates the index with `changes`, a list of `(id, bounds)` tuples.
+        If `bounds` is None, then the item has been removed (e.g. flagged as `deleted`).
+        """
+
+        with self.__lock:
+            for item_id, bounds in changes:
+                self.tombstones.add(item_id)
+
+                if bounds is None:
+                    self.delta.pop(item_id, None)
+                else:
+                    self.delta[item_id] = bounds
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Returns the ids of the items whose bounds intersect the (min_x, min_y, max_x, max_y) box."""
+
+        def intersects(bounds, i):
+            return not (bounds[4 * i] > max_x or bounds[4 * i + 1] > max_y or
+                        bounds[4 * i + 2] < min_x or bounds[4 * i + 3] < min_y)
+
+        node_size = self.node_size
+        level = len(self.levels) - 1
+        candidates = range(len(self.levels[level]) // 4)
+
+        # go down the tree just through the nodes that intersect the box
+        while True:
+            bounds = self.levels[level]
+            hits = [i for i in candidates if intersects(bounds, i)]
+
+            if level == 0:
+                break
+
+            level -= 1
+            count = len(self.levels[level]) // 4
+
+            candidates = [
+                child
+                for i in hits
+                for child in range(i * node_size, min((i + 1) * node_size, count))
+            ]
+
+        with self.__lock:
+            result = [item_id for item_id in map(self.get_id, hits) if item_id not in self.tombstones]
+
+            result += [
+                item_id for item_id, (x1, y1, x2, y2) in self.delta.items()
+                if not (x1 > max_x or y1 > max_y or x2 < min_x or y2 < min_y)
+            ]
+
+        return result
@@ -1,7 +1,221 @@
+"""
+Logging of the application.
+
+With `INPE_STAC_LOG_ASYNC`, the records are put in a bounded queue and a background thread formats and writes them,
+then a request does not wait for the I/O of its records. The records of the `sql` and `function` categories are
+logged by their own loggers (`sql_logger` and `function_logger`), whose INFO and DEBUG records can be sampled by
+`INPE_STAC_LOG_SAMPLING`. The messages receive their arguments lazily (e.g. `logger.info('sql: %s', sql)`),
+then a record that is discarded by the level or by the sampling is never formatted.
+"""
 
 import logging
+from atexit import register
+from copy import copy
+from json import dumps
+from logging.handlers import QueueHandler
+from os import getpid
+from queue import SimpleQueue
+from random import random
+from threading import Lock, Thread
+from time import sleep
+
+from inpe_stac.environment import LOGGING_LEVEL, INPE_STAC_LOG_ASYNC, INPE_STAC_LOG_FORMAT, \
+                                  INPE_STAC_LOG_QUEUE_SIZE, INPE_STAC_LOG_SAMPLING
+
+
+TEXT_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+LOG_FORMATS = ('text', 'json')
+
+# categories of records that can be sampled, each one has its own `inpe_stac.<category>` logger
+LOG_CATEGORIES = ('sql', 'function')
+
+# SQL statements, their parameters and elapsed times
+sql_logger = logging.getLogger('inpe_stac.sql')
+# calls and elapsed times of the functions decorated by `log_function_header` and `log_function_footer`
+function_logger = logging.getLogger('inpe_stac.function')
+
+# containers that are copied when a record is queued, because the caller may change them after logging
+MUTABLE_ARGUMENTS = (dict, list, set, bytearray)
+
+
+def snapshot_argument(argument):
+    """Returns a shallow copy of `argument` if it is a mutable container, else `argument` itself."""
+
+    return copy(argument) if isinstance(argument, MUTABLE_ARGUMENTS) else argument
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as a JSON object in a single line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'pid': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through a `rate` fraction of the INFO and DEBUG records, the WARNING and higher ones always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.INFO or random() < self.rate
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Puts the records in a queue, whose records are formatted and written to `handler` by a background thread.
+    The thread wakes up each `interval` seconds and writes all the waiting records at once, then the threads that
+    log do not hand the GIL over to it at each record. The records logged while `maxsize` records are waiting are
+    dropped and counted. The thread is started by the first record of each process, then a forked worker starts
+    its own one. The thread that logs just copies the mutable arguments (shallowly) and the traceback, the message
+    is formatted by the background thread.
+    """
+
+    def __init__(self, handler, maxsize, interval=0.05):
+        # `SimpleQueue` is implemented in C and it does not lock in Python code, then the size is checked by `enqueue`
+        super().__init__(SimpleQueue())
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.interval = interval
+        self.dropped = 0
+
+        self.__writer = None
+        # PID of the process that started the writer thread
+        self.__writer_pid = None
+        self.__lock = Lock()
+
+    def prepare(self, record):
+        # the arguments may be changed after the call (e.g. a dict of parameters), then the mutable ones are copied,
+        # but the message is formatted by the writer thread
+        record = copy(record)
+
+        if isinstance(record.args, dict):
+            record.args = {key: snapshot_argument(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(snapshot_argument(argument) for argument in record.args)
+
+        # the traceback can not be formatted after its frames are gone
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.handler.formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record):
+        if self.__writer_pid != getpid():
+            self.__start_writer()
+
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+
+            self.queue.put(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING', 'module': 'log',
+                'msg': f'AsyncHandler - {dropped} records have been dropped, because the queue was full'
+            }))
+
+        self.queue.put(record)
+
+    def __start_writer(self):
+        with self.__lock:
+            if self.__writer_pid != getpid():
+                # the queue of the parent process may have records that are written by the parent
+                self.queue = SimpleQueue()
+
+                self.__writer = Thread(target=self.__write, args=(self.queue,), name='inpe_stac_log', daemon=True)
+                self.__writer.start()
+
+                self.__writer_pid = getpid()
+
+    def __write(self, queue):
+        while True:
+            records = [queue.get()]
+
+            sleep(self.interval)
+
+            while not queue.empty():
+                records.append(queue.get())
+
+            for record in records:
+                # `stop` puts None in the queue
+                if record is None:
+                    return
+
+                if record.levelno >= self.handler.level:
+                    self.handler.handle(record)
+
+    def stop(self):
+        """Writes the waiting records and stops the writer thread of this process."""
+
+        with self.__lock:
+            if self.__writer is not None and self.__writer_pid == getpid():
+                self.queue.put(None)
+                self.__writer.join()
+                self.__writer, self.__writer_pid = None, None
+
+
+def parse_sampling(sampling):
+    """Returns the rate of each category of a sampling configuration, e.g. 'sql=0.01,function=0.1'."""
+
+    rates = {}
+
+    for item in sampling.split(','):
+        if not item.strip():
+            continue
+
+        category, _, rate = item.partition('=')
+        category = category.strip()
+
+        if category not in LOG_CATEGORIES:
+            raise ValueError(
+                f'INPE_STAC_LOG_SAMPLING categories must be one of the following values: {", ".join(LOG_CATEGORIES)}'
+            )
+
+        rate = float(rate)
+
+        if not 0 <= rate <= 1:
+            raise ValueError(f'INPE_STAC_LOG_SAMPLING rate of `{category}` must be between 0 and 1')
+
+        rates[category] = rate
+
+    return rates
+
+
+if INPE_STAC_LOG_FORMAT not in LOG_FORMATS:
+    raise ValueError(f'INPE_STAC_LOG_FORMAT must be one of the following values: {", ".join(LOG_FORMATS)}')
+
+__handler = logging.StreamHandler()
+__handler.setFormatter(JSONFormatter() if INPE_STAC_LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+
+if INPE_STAC_LOG_ASYNC:
+    __handler = AsyncHandler(__handler, INPE_STAC_LOG_QUEUE_SIZE)
 
-from inpe_stac.environment import LOGGING_LEVEL
+    # the records that are still in the queue are written before the process exits
+    register(__handler.stop)
 
+logging.basicConfig(level=LOGGING_LEVEL, handlers=[__handler])
 
-logging.basicConfig(format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s', level=LOGGING_LEVEL)
+for __category, __rate in parse_sampling(INPE_STAC_LOG_SAMPLING).items():
+    logging.getLogger(f'inpe_stac.{__category}').addFilter(SamplingFilter(__rate))
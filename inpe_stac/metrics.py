@@ -0,0 +1,204 @@
+"""
+Per-request instrumentation: the durations of the phases of a request (connect, count query, page query, etc.)
+are sent in the `Server-Timing` header and observed by histograms, which are exposed in the Prometheus text format.
+
+The durations of a request are kept by a `Timings` object in a context variable, then the queries that run
+in the shared thread pool (whose calls copy the context of the request) add their durations to it too.
+If the instrumentation is disabled, then `record` just reads the context variable.
+"""
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from inpe_stac.environment import INPE_STAC_METRICS_MAX_COLLECTIONS
+
+
+# upper bounds (in seconds) of the buckets of the histograms
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# phases of a request, in the order of the `Server-Timing` header
+PHASES = {
+    'connect': 'Connection checkout',
+    'count': 'Count query',
+    'page': 'Page query',
+    'rendered': 'Rendered features query',
+    'rows': 'Row to dict conversion',
+    'features': 'Feature building',
+    'encode': 'JSON encoding'
+}
+
+# the `collection` label of the searches of several collections
+MULTIPLE_COLLECTIONS = '_multiple'
+# the `collection` label of the collections after the first `INPE_STAC_METRICS_MAX_COLLECTIONS` ones
+OTHER_COLLECTIONS = '_other'
+
+
+__timings = ContextVar('inpe_stac_timings', default=None)
+
+
+class Timings:
+    """Durations (in seconds) of the phases of the current request."""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.collection = None
+        self.durations = {}
+        # the queries of a request may run in several threads at the same time
+        self.lock = Lock()
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.durations[phase] = self.durations.get(phase, 0) + seconds
+
+    def elapsed(self):
+        return perf_counter() - self.start
+
+    def server_timing(self, total):
+        """Returns the value of the `Server-Timing` header, e.g. 'count;dur=1.2, page;dur=3.4, total;dur=6.1'."""
+
+        metrics = [
+            f'{phase};dur={self.durations[phase] * 1000:.1f};desc="{description}"'
+            for phase, description in PHASES.items() if phase in self.durations
+        ]
+
+        return ', '.join(metrics + [f'total;dur={total * 1000:.1f}'])
+
+
+class Histogram:
+    """Prometheus histogram whose series are identified by the values of its labels."""
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        # label values -> [counts of each bucket (not cumulative, the last one is '+Inf'), sum]
+        self.series = {}
+        self.lock = Lock()
+
+    def observe(self, values, seconds):
+        with self.lock:
+            series = self.series.get(values)
+
+            if series is None:
+                series = self.series[values] = [[0] * (len(BUCKETS) + 1), 0.0]
+
+            series[0][bisect_left(BUCKETS, seconds)] += 1
+            series[1] += seconds
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        """Returns the lines of the histogram in the Prometheus text format."""
+
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+
+        with self.lock:
+            series = sorted((values, list(counts), total) for values, (counts, total) in self.series.items())
+
+        for values, counts, total in series:
+            labels = ','.join(f'{label}="{escape_label_value(value)}"' for label, value in zip(self.labels, values))
+
+            cumulative = 0
+
+            for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'inpe_stac_request_duration_seconds', 'Duration of the requests.', ('endpoint', 'collection')
+)
+PHASE_DURATION = Histogram(
+    'inpe_stac_request_phase_duration_seconds', 'Duration of the phases of the requests.',
+    ('endpoint', 'collection', 'phase')
+)
+
+__collections = set()
+__collections_lock = Lock()
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def start_request():
+    """Starts the timings of the current request and returns them."""
+
+    timings = Timings()
+    __timings.set(timings)
+
+    return timings
+
+
+def get_timings():
+    """Returns the timings of the current request, or None if they have not been started."""
+
+    return __timings.get()
+
+
+def record(phase, seconds):
+    """Adds `seconds` to the duration of `phase` of the current request, if its timings have been started."""
+
+    timings = __timings.get()
+
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+def set_collection(collection_id=None, collections=None):
+    """Sets the `collection` label of the current request, from the collection or the searched collections."""
+
+    timings = __timings.get()
+
+    if timings is None:
+        return
+
+    if collections:
+        collections = collections.split(',') if isinstance(collections, str) else collections
+        collection_id = collections[0] if len(collections) == 1 else MULTIPLE_COLLECTIONS
+
+    timings.collection = collection_id
+
+
+def __get_collection_label(collection):
+    if collection is None:
+        return ''
+
+    # the collection comes from the URL, then the number of series is limited
+    if collection not in __collections and collection != MULTIPLE_COLLECTIONS:
+        with __collections_lock:
+            if len(__collections) >= INPE_STAC_METRICS_MAX_COLLECTIONS:
+                return OTHER_COLLECTIONS
+
+            __collections.add(collection)
+
+    return collection
+
+
+def observe_request(timings, endpoint, total):
+    """Observes the duration (`total`) and the phases of a finished request by the histograms."""
+
+    collection = __get_collection_label(timings.collection)
+
+    REQUEST_DURATION.observe((endpoint, collection), total)
+
+    with timings.lock:
+        durations = list(timings.durations.items())
+
+    for phase, seconds in durations:
+        PHASE_DURATION.observe((endpoint, collection, phase), seconds)
+
+
+def render_metrics():
+    """Returns the histograms in the Prometheus text format."""
+
+    return '\n'.join(REQUEST_DURATION.render() + PHASE_DURATION.render()) + '\n'
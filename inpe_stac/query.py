@@ -0,0 +1,140 @@
+"""
+Compiler of the `query` extension to conditions of the WHERE clause of `stac_item`.
+Specification: https://github.com/radiantearth/stac-spec/blob/v0.9.0/api-spec/extensions/query/README.md
+
+The fields are validated against `QUERYABLES` and the values are bound as parameters, then the same
+filters create the same SQL statement, whatever their values.
+"""
+
+from werkzeug.exceptions import BadRequest
+
+from inpe_stac.environment import INPE_STAC_QUERY_INDEXED_FIELDS
+
+
+# queryable property -> (column of `stac_item`, type of the values, the column is indexed)
+QUERYABLES = {
+    'id': ('id', 'string', True),
+    'collection': ('collection', 'string', True),
+    'satellite': ('satellite', 'string', False),
+    'sensor': ('sensor', 'string', False),
+    'path': ('path', 'integer', False),
+    # `row` is a reserved word since MySQL 8
+    'row': ('`row`', 'integer', False),
+    'cloud_cover': ('cloud_cover', 'number', False),
+    'sync_loss': ('sync_loss', 'number', False)
+}
+
+# other columns that have an index in this database, e.g. 'cloud_cover,satellite'
+INDEXED_FIELDS = {field.strip() for field in INPE_STAC_QUERY_INDEXED_FIELDS.split(',') if field.strip()}
+
+# operator -> SQL condition, whose `{column}` and `{param}` placeholders receive the column and the parameter
+COMPARISON_OPERATORS = {
+    'eq': '{column} = :{param}',
+    'neq': '{column} != :{param}',
+    'lt': '{column} < :{param}',
+    'lte': '{column} <= :{param}',
+    'gt': '{column} > :{param}',
+    'gte': '{column} >= :{param}',
+    'in': '{column} IN :{param}'
+}
+
+# operator -> pattern of the value, the pattern of `startsWith` has a constant prefix, then it can use an index
+LIKE_OPERATORS = {
+    'startsWith': '{}%',
+    'endsWith': '%{}',
+    'contains': '%{}%'
+}
+
+# operators that can not use an index, i.e. they are not sargable
+NON_SARGABLE_OPERATORS = ('neq', 'endsWith', 'contains')
+
+
+def escape_like(value):
+    """Escapes the wildcards of `value` to use it inside a LIKE pattern, whose escape character is '\\'."""
+
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def __convert_value(field, type_, value):
+    """Returns `value` converted to the `type_` of `field` or raises BadRequest."""
+
+    if type_ == 'string':
+        if isinstance(value, str):
+            return value
+
+    # booleans are integers in Python, but they are not numbers in JSON
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if type_ == 'number':
+            return value
+
+        if float(value).is_integer():
+            return int(value)
+
+    raise BadRequest(f'`query` field `{field}` must receive {"a" if type_ == "string" else "an"} {type_}')
+
+
+def compile_query(query):
+    """
+    Returns the conditions (a list of SQL strings) and the parameters of the `query` extension object, whether any
+    of the conditions can use an index and the list of non-sargable filters (e.g. 'satellite contains').
+    It raises BadRequest if a field is not queryable, an operator is not supported or a value has a wrong type.
+    """
+
+    if not isinstance(query, dict):
+        raise BadRequest('`query` field is not a valid JSON object')
+
+    conditions = []
+    params = {}
+    indexed = False
+    non_sargable = []
+
+    for field, operators in query.items():
+        if field not in QUERYABLES:
+            raise BadRequest(
+                f'`query` field `{field}` is not queryable, the queryable fields are: {", ".join(QUERYABLES)}'
+            )
+
+        if not isinstance(operators, dict):
+            raise BadRequest(f'`query` field `{field}` must receive an object of operators, e.g. {{"eq": ...}}')
+
+        column, type_, is_indexed = QUERYABLES[field]
+        is_indexed = is_indexed or field in INDEXED_FIELDS
+
+        for operator, value in operators.items():
+            # the name of the parameter depends on the position of the filter, not on its value
+            param = f'query_{len(params)}'
+
+            if operator in COMPARISON_OPERATORS:
+                if operator == 'in':
+                    if not isinstance(value, list) or not value:
+                        raise BadRequest(f'`query` field `{field}` must receive a non-empty list to `in` operator')
+
+                    value = [__convert_value(field, type_, v) for v in value]
+                else:
+                    value = __convert_value(field, type_, value)
+
+                conditions.append(COMPARISON_OPERATORS[operator].format(column=column, param=param))
+
+            elif operator in LIKE_OPERATORS:
+                if type_ != 'string':
+                    raise BadRequest(f'`query` field `{field}` does not support `{operator}` operator')
+
+                value = LIKE_OPERATORS[operator].format(escape_like(__convert_value(field, type_, value)))
+
+                # the default escape character of LIKE in MySQL is '\\'
+                conditions.append(f'{column} LIKE :{param}')
+
+            else:
+                raise BadRequest(
+                    f'`query` field `{field}` does not support `{operator}` operator, the supported operators are: '
+                    f'{", ".join(list(COMPARISON_OPERATORS) + list(LIKE_OPERATORS))}'
+                )
+
+            params[param] = value
+
+            if operator in NON_SARGABLE_OPERATORS:
+                non_sargable.append(f'{field} {operator}')
+            elif is_indexed:
+                indexed = True
+
+    return conditions, params, indexed, non_sargable
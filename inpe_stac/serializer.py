@@ -0,0 +1,383 @@
+"""
+Fast serialization of `stac_item` rows to STAC Items (GeoJSON Features).
+
+The output has the same structure and key order created by the original `make_json_items`,
+but the parts that do not depend on the item (links, asset types, `eo:bands` lists, etc.)
+are created once per serializer or per collection instead of once per item.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from json import dumps as json_dumps, loads as json_loads
+
+from inpe_stac.environment import API_VERSION, INPE_STAC_JSON_ENCODER, PNG_ROOT, TIF_ROOT
+
+# `orjson` is optional, it is used to encode and decode JSON just if `INPE_STAC_JSON_ENCODER` opts in to it
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+JSON_ENCODERS = ('json', 'orjson', 'auto')
+
+if INPE_STAC_JSON_ENCODER not in JSON_ENCODERS:
+    raise ValueError(f'INPE_STAC_JSON_ENCODER must be one of the following values: {", ".join(JSON_ENCODERS)}')
+
+if INPE_STAC_JSON_ENCODER == 'orjson' and orjson is None:
+    raise ValueError('INPE_STAC_JSON_ENCODER=orjson needs the `orjson` package')
+
+
+TIF_TYPE = 'image/tiff; application=geotiff'
+XML_TYPE = 'application/xml'
+PNG_TYPE = 'image/png'
+
+# the roots of the assets `href`s in the rendered features (`FeatureSerializer.fragment`),
+# they are replaced when the features are served, then the roots can change without rendering them again
+TIF_ROOT_PLACEHOLDER = '{TIF_ROOT}'
+PNG_ROOT_PLACEHOLDER = '{PNG_ROOT}'
+
+
+def __default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+if orjson is not None and INPE_STAC_JSON_ENCODER != 'json':
+    JSON_ENCODER = 'orjson'
+
+    def dumps(obj):
+        """Returns `obj` encoded as compact JSON bytes."""
+
+        return orjson.dumps(obj, default=__default)
+
+    loads = orjson.loads
+else:
+    JSON_ENCODER = 'json'
+
+    def dumps(obj):
+        """Returns `obj` encoded as compact JSON bytes, in the same format of `flask.jsonify`."""
+
+        return json_dumps(obj, separators=(',', ':'), default=__default).encode('utf-8')
+
+    loads = json_loads
+
+
+def format_datetime(value):
+    """Returns `value` (datetime, date or str) in ISO format, e.g. '2020-01-01T10:00:00'."""
+
+    # a datetime is a date too, then it must be checked first
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).isoformat()
+
+    return datetime.fromisoformat(str(value)).isoformat()
+
+
+# columns of the `stac_item` rows used by the full features, which are the key of their cached entries
+FEATURE_COLUMNS = (
+    'id', 'collection', 'datetime', 'path', 'row', 'satellite', 'sensor', 'cloud_cover', 'sync_loss',
+    'tl_longitude', 'tl_latitude', 'bl_longitude', 'bl_latitude',
+    'br_longitude', 'br_latitude', 'tr_longitude', 'tr_latitude',
+    'assets', 'thumbnail'
+)
+
+
+class FeatureSerializer:
+    """
+    Creates the STAC Items of `stac_item` rows.
+
+    `links` is the template of the links of each item: the `href` of the first link receives
+    '{collection}/items/{id}' and the `href` of the second and third links receive '{collection}'.
+    The created features share the objects that do not depend on the item, then they must not be changed.
+
+    If `cache` (a `TTLCache`) is given, then it saves the created features and their encoded JSON.
+    An entry is found by the values of all the columns that the feature uses (`FEATURE_COLUMNS`), then an item
+    changed in place creates a new entry even without the `updated` marker and the old one is removed by the LRU policy.
+
+    If `fields` (a `Fields` of the `fields` extension) is given, then the features just have the chosen fields
+    and the rows just need their columns. These features are cheap to create, then they are not cached.
+
+    If a row has a `feature` key, then it is the rendered feature of the item (created by `fragment`),
+    which `encoded_feature` completes with the parts that depend on the request instead of creating the feature.
+    """
+
+    def __init__(self, links, item_stac_extensions=None, cache=None, fields=None, tif_root=TIF_ROOT, png_root=PNG_ROOT):
+        self.links = links
+        self.item_stac_extensions = item_stac_extensions
+        self.cache = cache if fields is None else None
+        self.fields = fields
+        self.tif_root = tif_root
+        self.png_root = png_root
+
+        # the features depend on the links template, on the extensions and on the roots, then they are part of the key
+        self.__key_prefix = (
+            tuple((link['href'], link['rel']) for link in links),
+            None if item_stac_extensions is None else tuple(item_stac_extensions),
+            tif_root, png_root
+        )
+
+        # collection -> (prefix of the `self` link, list of the other links)
+        self.__collection_links = {}
+        # tuple of band names -> `eo:bands` list
+        self.__eo_bands = {}
+        # collection -> encoded links of its items, whose `self` link ends with the `{id}` placeholder
+        self.__encoded_links = {}
+
+        # beginning of the encoded features, which does not depend on the item
+        self.__encoded_head = (
+            b'{"stac_version":' + dumps(API_VERSION) + b',"stac_extensions":' + dumps(item_stac_extensions) + b','
+        )
+        # placeholders of the rendered features and their encoded values, at the beginning of an `href` member:
+        # the quotes of the strings of the item are escaped, then they can not contain this sequence
+        self.__encoded_roots = tuple(
+            (b'"href":"' + placeholder.encode('utf-8'), b'"href":"' + dumps(root)[1:-1])
+            for placeholder, root in ((TIF_ROOT_PLACEHOLDER, tif_root), (PNG_ROOT_PLACEHOLDER, png_root))
+        )
+
+    def __get_collection_links(self, collection):
+        collection_links = self.__collection_links.get(collection)
+
+        if collection_links is None:
+            links = self.links
+
+            collection_links = (
+                links[0]['href'] + collection + '/items/',
+                [{**links[1], 'href': links[1]['href'] + collection},
+                 {**links[2], 'href': links[2]['href'] + collection}] + links[3:]
+            )
+
+            self.__collection_links[collection] = collection_links
+
+        return collection_links
+
+    def __get_eo_bands(self, bands):
+        eo_bands = self.__eo_bands.get(bands)
+
+        if eo_bands is None:
+            eo_bands = [{'name': band, 'common_name': band} for band in bands]
+            self.__eo_bands[bands] = eo_bands
+
+        return eo_bands
+
+    def __get_encoded_links(self, collection):
+        encoded_links = self.__encoded_links.get(collection)
+
+        if encoded_links is None:
+            self_prefix, other_links = self.__get_collection_links(collection)
+
+            encoded_links = dumps([{**self.links[0], 'href': self_prefix + '{id}'}] + other_links)
+            self.__encoded_links[collection] = encoded_links
+
+        return encoded_links
+
+    def __splice_feature(self, i):
+        """Returns the encoded STAC Item of the `i` row from its rendered feature, without parsing it."""
+
+        fragment = i['feature']
+
+        for placeholder, root in self.__encoded_roots:
+            fragment = fragment.replace(placeholder, root)
+
+        links = self.__get_encoded_links(i['collection']).replace(b'{id}', dumps(i['id'])[1:-1], 1)
+
+        return self.__encoded_head + fragment + b',"links":' + links + b'}'
+
+    def __get_entry(self, i):
+        """Returns the cached `(feature, encoded feature)` tuple of the `i` row, creating it if necessary."""
+
+        key = (self.__key_prefix, *(i[column] for column in FEATURE_COLUMNS))
+
+        entry = self.cache.get(key)
+
+        if entry is None:
+            feature = self.__make_feature(i)
+            encoded = dumps(feature)
+
+            entry = (feature, encoded)
+            self.cache.set(key, entry, weight=len(encoded))
+
+        return entry
+
+    def feature(self, i):
+        """Returns the STAC Item related to the `i` row."""
+
+        if self.fields is not None:
+            return self.__make_projected_feature(i)
+
+        if self.cache is None:
+            return self.__make_feature(i)
+
+        return self.__get_entry(i)[0]
+
+    def encoded_feature(self, i):
+        """Returns the STAC Item related to the `i` row encoded as JSON bytes."""
+
+        if self.fields is not None:
+            return dumps(self.__make_projected_feature(i))
+
+        if i.get('feature') is not None:
+            return self.__splice_feature(i)
+
+        if self.cache is None:
+            return dumps(self.__make_feature(i))
+
+        return self.__get_entry(i)[1]
+
+    def __make_geometry(self, i):
+        """Returns the `geometry` and the `bbox` of the `i` row."""
+
+        tl = [i['tl_longitude'], i['tl_latitude']]
+        bl = [i['bl_longitude'], i['bl_latitude']]
+        br = [i['br_longitude'], i['br_latitude']]
+        tr = [i['tr_longitude'], i['tr_latitude']]
+
+        xs = (tl[0], bl[0], br[0], tr[0])
+        ys = (tl[1], bl[1], br[1], tr[1])
+
+        geometry = {
+            'type': 'Polygon',
+            'coordinates': [[tl, bl, br, tr, tl]]
+        }
+
+        return geometry, [min(xs), min(ys), max(xs), max(ys)]
+
+    def __make_assets(self, i, assets):
+        """Returns the `assets` of the `i` row, whose `assets` column has been parsed to `assets`."""
+
+        feature_assets = {}
+
+        for index, asset in enumerate(assets):
+            href = asset['href']
+
+            feature_assets[asset['band']] = {
+                'href': self.tif_root + href,
+                'type': TIF_TYPE,
+                'eo:bands': [index]
+            }
+            feature_assets[asset['band'] + '_xml'] = {
+                'href': self.tif_root + href.replace('.tif', '.xml'),
+                'type': XML_TYPE
+            }
+
+        feature_assets['thumbnail'] = {
+            'href': self.png_root + i['thumbnail'],
+            'type': PNG_TYPE
+        }
+
+        return feature_assets
+
+    def fragment(self, i):
+        """
+        Returns the rendered feature of the `i` row: the encoded members of its STAC Item from `type` to `assets`,
+        without the enclosing braces. The serializer must be created with the `tif_root` and `png_root`
+        placeholders, then the parts that depend on the request are added when the feature is served.
+        """
+
+        feature = self.__make_feature(i)
+
+        del feature['stac_version'], feature['stac_extensions'], feature['links']
+
+        return dumps(feature)[1:-1]
+
+    def __make_feature(self, i):
+        collection = i['collection']
+
+        geometry, bbox = self.__make_geometry(i)
+
+        # the assets are a JSON string with a list of `{"band": ..., "href": ...}` objects
+        assets = loads(i['assets'])
+
+        bands = tuple(asset['band'] for asset in assets)
+
+        return {
+            'stac_version': API_VERSION,
+            'stac_extensions': self.item_stac_extensions,
+            'type': 'Feature',
+            'id': i['id'],
+            'collection': collection,
+            'geometry': geometry,
+            'bbox': bbox,
+            'properties': {
+                'datetime': format_datetime(i['datetime']),
+                'path': i['path'],
+                'row': i['row'],
+                'satellite': i['satellite'],
+                'sensor': i['sensor'],
+                'cloud_cover': i['cloud_cover'],
+                'sync_loss': i['sync_loss'],
+                'eo:gsd': -1,
+                'eo:bands': self.__get_eo_bands(bands)
+            },
+            'assets': self.__make_assets(i, assets),
+            'links': self.__make_links(collection, i['id'])
+        }
+
+    def __make_links(self, collection, id):
+        if not self.links:
+            return []
+
+        self_prefix, other_links = self.__get_collection_links(collection)
+
+        return [{**self.links[0], 'href': self_prefix + id}] + other_links
+
+    def __make_projected_feature(self, i):
+        """Returns the STAC Item related to the `i` row with just the fields chosen by `self.fields`."""
+
+        keys = self.fields.keys
+
+        feature = {}
+        # the assets are just parsed if `assets` or `properties.eo:bands` is chosen
+        assets = None
+
+        if 'stac_version' in keys:
+            feature['stac_version'] = API_VERSION
+
+        if 'stac_extensions' in keys:
+            feature['stac_extensions'] = self.item_stac_extensions
+
+        feature['type'] = 'Feature'
+        feature['id'] = i['id']
+
+        if 'collection' in keys:
+            feature['collection'] = i['collection']
+
+        if 'geometry' in keys or 'bbox' in keys:
+            geometry, bbox = self.__make_geometry(i)
+
+            if 'geometry' in keys:
+                feature['geometry'] = geometry
+
+            if 'bbox' in keys:
+                feature['bbox'] = bbox
+
+        if 'properties' in keys:
+            properties = {}
+
+            for name in self.fields.properties:
+                if name == 'datetime':
+                    properties[name] = format_datetime(i['datetime'])
+                elif name == 'eo:gsd':
+                    properties[name] = -1
+                elif name == 'eo:bands':
+                    assets = loads(i['assets'])
+                    properties[name] = self.__get_eo_bands(tuple(asset['band'] for asset in assets))
+                else:
+                    properties[name] = i[name]
+
+            feature['properties'] = properties
+
+        if 'assets' in keys:
+            feature['assets'] = self.__make_assets(i, assets if assets is not None else loads(i['assets']))
+
+        if 'links' in keys:
+            feature['links'] = self.__make_links(i['collection'], i['id'])
+
+        return feature
@@ -0,0 +1,110 @@
+from collections import deque
+from datetime import datetime, timezone
+from os import getpid
+from queue import Full, Queue
+from re import compile
+from threading import Lock, Thread
+
+from inpe_stac.log import logging
+from inpe_stac.serializer import dumps
+
+
+WHITESPACE = compile(r'\s+')
+
+
+class SlowQueryLog:
+    """
+    Thread-safe ring buffer with the last `maxlen` queries that took `threshold` seconds or more.
+
+    If `explain` is given, then it receives the SQL and the parameters of a slow SELECT statement and returns its plan,
+    which is saved in the entry. The plans are created by a background thread, one at a time, then the slow request
+    does not wait for them. If `max_pending` plans are already waiting, then the entry is saved without a plan.
+    """
+
+    def __init__(self, maxlen=100, threshold=1.0, explain=None, max_pending=16):
+        self.threshold = threshold
+        self.explain = explain
+
+        self.__entries = deque(maxlen=maxlen)
+        self.__lock = Lock()
+
+        self.__pending = Queue(maxsize=max_pending)
+        # PID of the process that started the thread, a forked process starts its own one
+        self.__worker_pid = None
+
+    def add(self, sql, params, rows, elapsed_time):
+        """Saves the query if it is slow, i.e. if `elapsed_time` (in seconds) is greater than the threshold."""
+
+        if elapsed_time < self.threshold:
+            return
+
+        # the parameters are bound, then the whitespace can be collapsed without changing literals
+        sql = WHITESPACE.sub(' ', sql).strip()
+
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'pid': getpid(),
+            'elapsed_ms': round(elapsed_time * 1000, 3),
+            'rows': rows,
+            'sql': sql,
+            'params': dict(params),
+            'plan': None
+        }
+
+        # slow queries are rare, then they are not sampled as the other SQL statements
+        logging.info('SlowQueryLog - slow query (%s ms): %s - params: %s', entry['elapsed_ms'], sql, params)
+
+        with self.__lock:
+            self.__entries.append(entry)
+
+        if self.explain is not None and sql.lstrip('( ').upper().startswith('SELECT'):
+            self.__start_worker()
+
+            try:
+                self.__pending.put_nowait(entry)
+            except Full:
+                entry['plan_error'] = 'skipped: too many plans were waiting'
+
+    def __start_worker(self):
+        if self.__worker_pid == getpid():
+            return
+
+        with self.__lock:
+            if self.__worker_pid != getpid():
+                Thread(target=self.__explain, name='inpe_stac_slow_query_explain', daemon=True).start()
+                self.__worker_pid = getpid()
+
+    def __explain(self):
+        while True:
+            entry = self.__pending.get()
+
+            try:
+                entry['plan'] = self.explain(entry['sql'], entry['params'])
+            except Exception as error:
+                entry['plan_error'] = str(error)
+
+    def entries(self, limit=None):
+        """Returns the saved queries, from the newest to the oldest one."""
+
+        with self.__lock:
+            entries = list(reversed(self.__entries))
+
+        return entries[:limit] if limit is not None else entries
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def dump(self, path):
+        """Appends the saved queries to the `path` file as newline-delimited JSON and returns how many were written."""
+
+        entries = self.entries()
+
+        with open(path, 'ab') as file:
+            for entry in reversed(entries):
+                file.write(dumps(entry) + b'\n')
+
+        return len(entries)
+
+    def __len__(self):
+        return len(self.__entries)
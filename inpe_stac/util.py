@@ -1,5 +1,12 @@
 
-from inpe_stac.environment import INPE_STAC_DELETED
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from json import dumps, loads
+
+from werkzeug.exceptions import BadRequest
+
+from inpe_stac.environment import INPE_STAC_DELETED, INPE_STAC_SEARCH_BBOX_DIGITS, INPE_STAC_STREAM_MIN_LIMIT
+from inpe_stac.fields import normalize_fields
 
 
 def calc_offset(page, limit):
@@ -35,5 +42,108 @@ def insert_deleted_flag_to_where(where):
         pass
 
 
+def is_stream(params):
+    """Returns True if the page requested by `params` is large enough to be streamed."""
+
+    return INPE_STAC_STREAM_MIN_LIMIT > 0 and params['limit'] >= INPE_STAC_STREAM_MIN_LIMIT
+
+
 def len_result(result):
     return len(result) if result is not None else len([])
+
+
+def encode_next_token(key):
+    """Encodes a keyset `key` as an opaque and URL safe token."""
+
+    token = urlsafe_b64encode(dumps(key, separators=(',', ':')).encode('utf-8'))
+
+    # remove the padding, because it is not necessary to decode the token
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_next_token(token):
+    """Decodes a token created by `encode_next_token` to its keyset."""
+
+    try:
+        # add the removed padding again before decoding the token
+        key = loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        raise BadRequest('`next` field is not a valid token')
+
+    if not isinstance(key, dict) or not ('k' in key or 'c' in key):
+        raise BadRequest('`next` field is not a valid token')
+
+    return key
+
+
+def make_next_token(items, collections, limit):
+    """
+    Creates the token to the page after `items`, the rows are sorted by (collection, date, id).
+
+    If `collections` is a list, then the token has the last position of each collection, because
+    each collection is paginated independently. Otherwise, the token has the last position of all rows.
+    It returns None when there is not a next page.
+    """
+
+    if not items or not limit:
+        return None
+
+    if collections:
+        key = {}
+
+        for collection in collections:
+            rows = [i for i in items if i['collection'] == collection]
+
+            # if the collection has returned less rows than `limit`, then it does not have a next page
+            key[collection] = [str(rows[-1]['date']), rows[-1]['id']] if len(rows) >= limit else None
+
+        if all(position is None for position in key.values()):
+            return None
+
+        return encode_next_token({'c': key})
+
+    if len(items) < limit:
+        return None
+
+    last = items[-1]
+
+    return encode_next_token({'k': [last['collection'], str(last['date']), last['id']]})
+
+
+def normalize_search_params(params):
+    """
+    Returns a copy of the `/stac/search` parameters in a canonical form, then the same search returns the same
+    response, whatever the order of the collections and ids, the precision of the bbox or the HTTP method.
+    The collections and ids are sorted, the bbox is rounded, `time` is a 'start/end' string and `fields`
+    is an object with sorted `include` and `exclude` lists.
+    """
+
+    params = dict(params)
+
+    # the `query` extension is just available to POST requests
+    params.setdefault('query', None)
+
+    if params.get('collections') is not None:
+        params['collections'] = sorted({collection.strip() for collection in params['collections']})
+
+    if params.get('ids') is not None:
+        params['ids'] = ','.join(sorted({i.strip() for i in params['ids'].split(',')}))
+
+    if params.get('bbox') is not None:
+        params['bbox'] = [round(value, INPE_STAC_SEARCH_BBOX_DIGITS) for value in params['bbox']]
+
+    if params.get('fields') is not None:
+        params['fields'] = normalize_fields(params['fields'])
+
+    if isinstance(params.get('time'), list):
+        params['time'] = '/'.join(str(value).strip() for value in params['time'])
+    elif isinstance(params.get('time'), str):
+        params['time'] = '/'.join(value.strip() for value in params['time'].split('/'))
+
+    return params
+
+
+def make_search_cache_key(params, marker=None):
+    """Returns the key of a search in the response cache, `params` must be normalized."""
+
+    return dumps({'params': params, 'marker': marker}, sort_keys=True, separators=(',', ':'), default=str)
@@ -0,0 +1,7 @@
+-- Index used by the keyset pagination (`next` token) of `/stac/search` and `/collections/{id}/items`.
+-- The pages are sorted by (collection, date, id), then MySQL seeks the next page through this index
+-- instead of scanning and throwing away all the rows of the previous pages.
+-- It is required: every page query has this ORDER BY, then without the index MySQL sorts all the matched rows
+-- in order to return a single page, and the service does not start without it (`check_keyset_index`).
+
+CREATE INDEX stac_item_collection_date_id_idx ON stac_item (collection, date, id);
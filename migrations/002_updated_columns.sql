@@ -0,0 +1,10 @@
+-- `updated` columns used to detect changed collections and items (INPE_STAC_CHANGE_TRACKING=1).
+-- MySQL updates them automatically when a row changes, including when an item is flagged as `deleted`.
+
+ALTER TABLE stac_collection
+    ADD COLUMN updated TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+ALTER TABLE stac_item
+    ADD COLUMN updated TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+CREATE INDEX stac_item_updated_idx ON stac_item (updated);
@@ -0,0 +1,110 @@
+-- Summary of the items of each collection (INPE_STAC_COLLECTION_SUMMARY=1).
+-- `get_collections` reads this table instead of grouping the whole `stac_item` table.
+-- The triggers below update the summary incrementally when an item is inserted, deleted or flagged as `deleted`.
+-- The extents and cloud cover ranges just grow incrementally, because they can not shrink without a scan,
+-- then `flask rebuild-collection-summary` recreates the summary from scratch (e.g. once a day).
+
+CREATE TABLE stac_collection_summary (
+    collection VARCHAR(255) NOT NULL,
+    -- JSON list with the band names of the items
+    bands JSON NULL,
+    -- spatial extent of the items that are not deleted
+    min_x DOUBLE NULL,
+    min_y DOUBLE NULL,
+    max_x DOUBLE NULL,
+    max_y DOUBLE NULL,
+    -- temporal extent of the items that are not deleted
+    start_date DATETIME NULL,
+    end_date DATETIME NULL,
+    item_count BIGINT NOT NULL DEFAULT 0,
+    deleted_count BIGINT NOT NULL DEFAULT 0,
+    min_cloud_cover DOUBLE NULL,
+    max_cloud_cover DOUBLE NULL,
+    updated TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (collection)
+);
+
+DELIMITER $$
+
+-- it adds an item that is not deleted to the extents and counts it as an item or as a deleted item
+CREATE PROCEDURE stac_collection_summary_add(
+    IN p_collection VARCHAR(255), IN p_assets TEXT, IN p_deleted INT, IN p_sign INT,
+    IN p_min_x DOUBLE, IN p_min_y DOUBLE, IN p_max_x DOUBLE, IN p_max_y DOUBLE,
+    IN p_date DATETIME, IN p_cloud_cover DOUBLE
+)
+BEGIN
+    -- deleted items do not change the extents
+    IF p_deleted <> 0 OR p_sign < 0 THEN
+        SET p_min_x = NULL, p_min_y = NULL, p_max_x = NULL, p_max_y = NULL, p_date = NULL, p_cloud_cover = NULL;
+    END IF;
+
+    INSERT INTO stac_collection_summary (
+        collection, bands, min_x, min_y, max_x, max_y, start_date, end_date,
+        item_count, deleted_count, min_cloud_cover, max_cloud_cover
+    )
+    VALUES (
+        p_collection, JSON_EXTRACT(p_assets, '$[*].band'), p_min_x, p_min_y, p_max_x, p_max_y, p_date, p_date,
+        IF(p_deleted = 0, p_sign, 0), IF(p_deleted <> 0, p_sign, 0), p_cloud_cover, p_cloud_cover
+    )
+    ON DUPLICATE KEY UPDATE
+        bands = COALESCE(bands, VALUES(bands)),
+        -- LEAST and GREATEST return NULL if one of the values is NULL, then COALESCE chooses the other one
+        min_x = COALESCE(LEAST(min_x, VALUES(min_x)), min_x, VALUES(min_x)),
+        min_y = COALESCE(LEAST(min_y, VALUES(min_y)), min_y, VALUES(min_y)),
+        max_x = COALESCE(GREATEST(max_x, VALUES(max_x)), max_x, VALUES(max_x)),
+        max_y = COALESCE(GREATEST(max_y, VALUES(max_y)), max_y, VALUES(max_y)),
+        start_date = COALESCE(LEAST(start_date, VALUES(start_date)), start_date, VALUES(start_date)),
+        end_date = COALESCE(GREATEST(end_date, VALUES(end_date)), end_date, VALUES(end_date)),
+        item_count = item_count + VALUES(item_count),
+        deleted_count = deleted_count + VALUES(deleted_count),
+        min_cloud_cover = COALESCE(LEAST(min_cloud_cover, VALUES(min_cloud_cover)), min_cloud_cover, VALUES(min_cloud_cover)),
+        max_cloud_cover = COALESCE(GREATEST(max_cloud_cover, VALUES(max_cloud_cover)), max_cloud_cover, VALUES(max_cloud_cover));
+END$$
+
+CREATE TRIGGER stac_item_summary_insert AFTER INSERT ON stac_item
+FOR EACH ROW
+BEGIN
+    CALL stac_collection_summary_add(
+        NEW.collection, NEW.assets, NEW.deleted, 1,
+        LEAST(NEW.tl_longitude, NEW.bl_longitude, NEW.br_longitude, NEW.tr_longitude),
+        LEAST(NEW.tl_latitude, NEW.bl_latitude, NEW.br_latitude, NEW.tr_latitude),
+        GREATEST(NEW.tl_longitude, NEW.bl_longitude, NEW.br_longitude, NEW.tr_longitude),
+        GREATEST(NEW.tl_latitude, NEW.bl_latitude, NEW.br_latitude, NEW.tr_latitude),
+        NEW.date, NEW.cloud_cover
+    );
+END$$
+
+CREATE TRIGGER stac_item_summary_update AFTER UPDATE ON stac_item
+FOR EACH ROW
+BEGIN
+    -- the old row is removed from the counts and the new one is added to the counts and extents,
+    -- including when just its footprint (the corners) is corrected
+    IF NOT (OLD.deleted <=> NEW.deleted AND OLD.collection <=> NEW.collection
+            AND OLD.date <=> NEW.date AND OLD.cloud_cover <=> NEW.cloud_cover
+            AND OLD.tl_longitude <=> NEW.tl_longitude AND OLD.tl_latitude <=> NEW.tl_latitude
+            AND OLD.bl_longitude <=> NEW.bl_longitude AND OLD.bl_latitude <=> NEW.bl_latitude
+            AND OLD.br_longitude <=> NEW.br_longitude AND OLD.br_latitude <=> NEW.br_latitude
+            AND OLD.tr_longitude <=> NEW.tr_longitude AND OLD.tr_latitude <=> NEW.tr_latitude) THEN
+        CALL stac_collection_summary_add(
+            OLD.collection, OLD.assets, OLD.deleted, -1, NULL, NULL, NULL, NULL, NULL, NULL
+        );
+        CALL stac_collection_summary_add(
+            NEW.collection, NEW.assets, NEW.deleted, 1,
+            LEAST(NEW.tl_longitude, NEW.bl_longitude, NEW.br_longitude, NEW.tr_longitude),
+            LEAST(NEW.tl_latitude, NEW.bl_latitude, NEW.br_latitude, NEW.tr_latitude),
+            GREATEST(NEW.tl_longitude, NEW.bl_longitude, NEW.br_longitude, NEW.tr_longitude),
+            GREATEST(NEW.tl_latitude, NEW.bl_latitude, NEW.br_latitude, NEW.tr_latitude),
+            NEW.date, NEW.cloud_cover
+        );
+    END IF;
+END$$
+
+CREATE TRIGGER stac_item_summary_delete AFTER DELETE ON stac_item
+FOR EACH ROW
+BEGIN
+    CALL stac_collection_summary_add(
+        OLD.collection, OLD.assets, OLD.deleted, -1, NULL, NULL, NULL, NULL, NULL, NULL
+    );
+END$$
+
+DELIMITER ;
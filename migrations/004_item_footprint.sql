@@ -0,0 +1,22 @@
+-- Footprint of each item, created from its corners, to filter the bbox by a SPATIAL index (INPE_STAC_BBOX_MODE=footprint).
+-- After applying this script, fill the column of the existing items with `flask backfill-footprints`
+-- and then apply `005_item_footprint_index.sql`.
+
+ALTER TABLE stac_item ADD COLUMN footprint POLYGON NULL;
+
+-- new and changed items get their footprint automatically
+CREATE TRIGGER stac_item_footprint_insert BEFORE INSERT ON stac_item
+FOR EACH ROW
+    SET NEW.footprint = Polygon(LineString(
+        Point(NEW.tl_longitude, NEW.tl_latitude), Point(NEW.bl_longitude, NEW.bl_latitude),
+        Point(NEW.br_longitude, NEW.br_latitude), Point(NEW.tr_longitude, NEW.tr_latitude),
+        Point(NEW.tl_longitude, NEW.tl_latitude)
+    ));
+
+CREATE TRIGGER stac_item_footprint_update BEFORE UPDATE ON stac_item
+FOR EACH ROW
+    SET NEW.footprint = Polygon(LineString(
+        Point(NEW.tl_longitude, NEW.tl_latitude), Point(NEW.bl_longitude, NEW.bl_latitude),
+        Point(NEW.br_longitude, NEW.br_latitude), Point(NEW.tr_longitude, NEW.tr_latitude),
+        Point(NEW.tl_longitude, NEW.tl_latitude)
+    ));
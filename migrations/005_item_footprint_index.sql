@@ -0,0 +1,6 @@
+-- SPATIAL index of the items footprint, it needs all the items filled by `flask backfill-footprints`,
+-- because a SPATIAL index just accepts NOT NULL columns.
+
+ALTER TABLE stac_item MODIFY footprint POLYGON NOT NULL;
+
+CREATE SPATIAL INDEX stac_item_footprint_idx ON stac_item (footprint);
@@ -0,0 +1,18 @@
+-- Feature JSON of each item, rendered in advance (INPE_STAC_PRERENDERED_FEATURES=1).
+-- It needs the `updated` column of `002_updated_columns.sql`: a fragment is served only while its `updated`
+-- value is the same of its item, then a changed item is created from its columns until it is rendered again.
+-- After applying this script, fill the table with `flask refresh-features` and run it periodically (e.g. by cron),
+-- it just reads the items that have changed since the last rendered one, by the `stac_item_updated_idx` index.
+
+CREATE TABLE stac_item_feature (
+    collection VARCHAR(255) NOT NULL,
+    id VARCHAR(255) NOT NULL,
+    -- `updated` value of the item when it was rendered
+    updated TIMESTAMP(6) NOT NULL,
+    -- members of the Feature object from `type` to `assets`, without the enclosing braces,
+    -- whose `href`s of the assets have the '{TIF_ROOT}' and '{PNG_ROOT}' placeholders
+    feature MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (id, collection),
+    -- the last rendered `updated` value is the watermark of `flask refresh-features`
+    KEY stac_item_feature_updated_idx (updated)
+);